@@ -0,0 +1,134 @@
+"""Фильтр выгрузки по лицевым счетам и организациям.
+
+Строка фильтра - список через запятую, точку с запятой или пробел:
+
+    101, 105, 200-250       лицевые счета (facialacc_cls.id) и диапазоны счетов
+    org:7, org:10-12        организации и диапазоны организаций (facialacc_cls.org_ref)
+
+Организации заменяются их лицевыми счетами в базе выгрузки (resolve_account_filter),
+затем фильтр компилируется в одно условие по колонке счёта основного запроса:
+счета - пачками ``in (...)`` по FILTER_CHUNK_SIZE, диапазоны - ``between``. Условие
+использует индекс колонки счёта, и несколько счетов выгружаются одним проходом.
+
+Строка, которая не разбирается как список, передаётся в запрос одним значением, как раньше.
+"""
+import re
+from collections import namedtuple
+
+from krista_sql import ACCOUNT_EQUAL_SQL, ACCOUNT_FILTER_SQL, ACCOUNT_IN_SQL, ACCOUNT_RANGE_SQL, EMPTY_FILTER_SQL
+from settings import FILTER_CHUNK_SIZE
+
+FILTER_SEPARATORS = re.compile(r'[\s,;]+')
+# необязательный префикс организации, число или диапазон чисел
+FILTER_ITEM = re.compile(r'(org:)?(\d+)(?:-(\d+))?', re.IGNORECASE)
+
+IdRange = namedtuple('IdRange', ('first', 'last'))
+
+
+class AccountFilter:
+    """Разобранный фильтр по счетам.
+
+    Attributes:
+        accounts: лицевые счета (или одно значение фильтра, не разобранного как список)
+        account_ranges: диапазоны счетов IdRange
+        organizations: организации, счета которых попадают в выгрузку
+        organization_ranges: диапазоны организаций IdRange
+    """
+
+    def __init__(self, accounts=(), account_ranges=(), organizations=(), organization_ranges=()):
+        self.accounts = frozenset(accounts)
+        self.account_ranges = tuple(account_ranges)
+        self.organizations = frozenset(organizations)
+        self.organization_ranges = tuple(organization_ranges)
+
+    @property
+    def resolved(self):
+        """Фильтр без организаций: его можно передать в запрос."""
+        return not self.organizations and not self.organization_ranges
+
+    def with_organization_accounts(self, accounts):
+        """Фильтр, в котором организации заменены их лицевыми счетами.
+
+        Args:
+            accounts (iterable): Счета организаций фильтра.
+
+        Returns:
+            AccountFilter: Фильтр только по счетам.
+        """
+        return AccountFilter(self.accounts | set(accounts), self.account_ranges)
+
+    def matches(self, value):
+        """Подходит ли значение колонки счёта фильтру (деление выборки на клиенте)."""
+        if value in self.accounts:
+            return True
+        return value is not None and any(first <= value <= last for first, last in self.account_ranges)
+
+    def predicate(self, expression):
+        """Условие запроса по колонке счёта.
+
+        Один счёт сравнивается на равенство. Список счетов делится на пачки
+        FILTER_CHUNK_SIZE, последняя пачка дополняется повтором последнего счёта,
+        поэтому для списков одной длины в пачках текст запроса совпадает.
+
+        Args:
+            expression (str): Выражение колонки счёта (*_FILTER_COLUMN).
+
+        Returns:
+            tuple: Текст условия для добавления к запросу и значения его параметров.
+        """
+        accounts = sorted(self.accounts)
+        if len(accounts) == 1 and not self.account_ranges:
+            return ACCOUNT_EQUAL_SQL.format(expression), (accounts[0],)
+
+        conditions = []
+        params = []
+        for start in range(0, len(accounts), FILTER_CHUNK_SIZE):
+            chunk = accounts[start:start + FILTER_CHUNK_SIZE]
+            chunk += chunk[-1:] * (FILTER_CHUNK_SIZE - len(chunk))
+            conditions.append(ACCOUNT_IN_SQL.format(expression, ', '.join('?' * FILTER_CHUNK_SIZE)))
+            params.extend(chunk)
+
+        for account_range in self.account_ranges:
+            conditions.append(ACCOUNT_RANGE_SQL.format(expression))
+            params.extend(account_range)
+
+        if not conditions:
+            # у организаций фильтра нет счетов
+            return EMPTY_FILTER_SQL, ()
+
+        return ACCOUNT_FILTER_SQL.format(' or '.join(conditions)), tuple(params)
+
+
+def parse_account_filter(text):
+    """Разбирает строку фильтра.
+
+    Args:
+        text (str): Строка фильтра из окна или задания планировщика.
+
+    Returns:
+        AccountFilter or None: Фильтр; None, если строка пустая.
+    """
+    text = (text or '').strip()
+    if not text:
+        return None
+
+    accounts = []
+    account_ranges = []
+    organizations = []
+    organization_ranges = []
+    for item in FILTER_SEPARATORS.split(text):
+        match = FILTER_ITEM.fullmatch(item)
+        if match is None:
+            # не список счетов: значение передаётся в запрос как есть
+            return AccountFilter((text,))
+
+        organization, first, last = match.groups()
+        first = int(first)
+        if last is None:
+            (organizations if organization else accounts).append(first)
+        else:
+            last = int(last)
+            id_range = IdRange(min(first, last), max(first, last))
+            (organization_ranges if organization else account_ranges).append(id_range)
+
+    return AccountFilter(accounts, account_ranges, organizations, organization_ranges)
@@ -0,0 +1,77 @@
+"""Сборка модуля формы главного окна.
+
+krista_ui.py генерируется pyuic из UI_FILE, чтобы окно не разбирало xml формы при
+каждом запуске. В модуль записывается хэш исходной формы: окно использует модуль,
+только пока хэш совпадает, иначе загружает форму через uic.loadUi.
+
+Запуск: ``python build_ui.py`` - пересобрать модуль, если форма изменилась;
+``python build_ui.py --check`` - только проверить, что модуль актуален (код возврата 1, если нет).
+Сборка exe (main.spec) вызывает build_ui перед анализом.
+"""
+import hashlib
+import io
+import os
+import re
+import sys
+
+from settings import UI_FILE, UI_MODULE_FILE
+
+UI_HASH_RE = re.compile(r"^UI_SOURCE_HASH = '(\w+)'$", re.MULTILINE)
+
+
+def ui_source_hash(ui_file=UI_FILE):
+    with open(ui_file, 'rb') as source:
+        return hashlib.sha1(source.read()).hexdigest()
+
+
+def compiled_hash(module_file=UI_MODULE_FILE):
+    """Хэш формы, из которой собран модуль.
+
+    Returns:
+        str or None: Хэш или None, если модуля нет.
+    """
+    if not os.path.isfile(module_file):
+        return None
+
+    with open(module_file, encoding='utf-8') as module:
+        match = UI_HASH_RE.search(module.read())
+
+    return match.group(1) if match else None
+
+
+def build_ui(ui_file=UI_FILE, module_file=UI_MODULE_FILE, force=False):
+    """Собирает модуль формы, если форма изменилась.
+
+    Returns:
+        bool: Модуль пересобран.
+    """
+    source_hash = ui_source_hash(ui_file)
+    if not force and compiled_hash(module_file) == source_hash:
+        return False
+
+    from PyQt6 import uic
+
+    output = io.StringIO()
+    uic.compileUi(ui_file, output)
+    temp_path = module_file + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as module:
+        module.write(output.getvalue())
+        module.write(f"\n\nUI_SOURCE_HASH = '{source_hash}'\n")
+    os.replace(temp_path, module_file)
+
+    return True
+
+
+def main():
+    if '--check' in sys.argv[1:]:
+        if compiled_hash() != ui_source_hash():
+            print(f'{UI_MODULE_FILE} не соответствует {UI_FILE}, выполните python build_ui.py')
+            sys.exit(1)
+        return
+
+    if build_ui(force='--force' in sys.argv[1:]):
+        print(f'{UI_MODULE_FILE} собран из {UI_FILE}')
+
+
+if __name__ == '__main__':
+    main()
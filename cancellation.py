@@ -0,0 +1,68 @@
+"""Отмена выгрузки.
+
+Токен отмены передаётся выгрузке, её соединениям и записи dbf-файлов: циклы выборки,
+записи и упаковки проверяют его между порциями. Отмена вызывает зарегистрированные
+обработчики - прерывание запроса, который сервер выполняет в этот момент.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class UnloadCancelled(Exception):
+    """Выгрузка отменена."""
+
+
+class CancellationToken:
+    """Признак отмены, общий для потоков одной выгрузки.
+
+    Attributes:
+        event: установлен после отмены
+        callbacks: обработчики, вызываемые при отмене
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        """Отменяет выгрузку; обработчики выполняются в потоке, вызвавшем отмену."""
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks = list(self.callbacks)
+
+        for callback in callbacks:
+            callback()
+
+    def check(self):
+        """Прерывает выполнение исключением UnloadCancelled, если выгрузка отменена."""
+        if self.event.is_set():
+            raise UnloadCancelled()
+
+    def guard(self, items):
+        """Элементы итератора с проверкой отмены перед каждым."""
+        for item in items:
+            self.check()
+            yield item
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """Пока выполняется блок, отмена вызывает callback.
+
+        Args:
+            callback (callable): Обработчик без аргументов, например прерывание запроса соединения.
+        """
+        with self.lock:
+            self.callbacks.append(callback)
+        try:
+            self.check()
+            yield
+        finally:
+            with self.lock:
+                self.callbacks.remove(callback)
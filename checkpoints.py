@@ -0,0 +1,243 @@
+"""Контрольные точки выгрузки для продолжения после сбоя.
+
+Манифест ``{prefix}_manifest.json`` в директории выгрузки хранит завершённые этапы
+(записанные dbf-файлы и собранные к этому моменту fkr_list, organizations_ids и т.п.)
+и состояние постраничной записи незавершённого файла: последние ключи страниц и
+количество записей, уже сохранённых в файле. Повторный запуск с теми же параметрами
+пропускает завершённые этапы и дописывает незавершённый файл с последней страницы.
+
+Побочные данные незавершённого файла не переписываются в манифест целиком: к журналу
+``{prefix}_pages.jsonl`` дописываются только элементы, появившиеся после прошлой
+контрольной точки, а манифест запоминает размер журнала на контрольной точке.
+"""
+import json
+import os
+from decimal import Decimal
+
+
+def encode_state(value):
+    """Представление побочных данных в виде, пригодном для json.
+
+    Множества, кортежи, словари с нестроковыми ключами и Decimal помечаются,
+    чтобы decode_state восстановил их без потерь.
+    """
+    if isinstance(value, set):
+        return {'set': [encode_state(item) for item in value]}
+    if isinstance(value, tuple):
+        return {'tuple': [encode_state(item) for item in value]}
+    if isinstance(value, dict):
+        return {'items': [[encode_state(key), encode_state(item)] for key, item in value.items()]}
+    if isinstance(value, Decimal):
+        return {'decimal': str(value)}
+
+    return value
+
+
+def decode_state(value):
+    """Обратное преобразование к encode_state."""
+    if isinstance(value, list):
+        return [decode_state(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    (kind, content), = value.items()
+    if kind == 'set':
+        return {decode_state(item) for item in content}
+    if kind == 'tuple':
+        return tuple(decode_state(item) for item in content)
+    if kind == 'items':
+        return {decode_state(key): decode_state(item) for key, item in content}
+
+    return Decimal(content)
+
+
+class UnloadManifest:
+    """Манифест выгрузки в директории выгрузки.
+
+    Attributes:
+        file_path: путь к файлу манифеста
+        parameters: параметры выгрузки; манифест с другими параметрами не используется
+        enabled: вести ли манифест, иначе все этапы выполняются заново
+        stages: завершённые этапы: файлы и состояние
+        pages: состояние постраничной записи незавершённого файла
+        volumes: тома, на которые разделены готовые файлы
+        journal_path: путь к журналу побочных данных незавершённого файла
+        journal_keys: элементы побочных данных, уже записанные в журнал, по именам
+    """
+
+    def __init__(self, unload_dir, prefix, parameters, enabled=True):
+        self.file_path = os.path.join(unload_dir, f'{prefix}_manifest.json')
+        self.journal_path = os.path.join(unload_dir, f'{prefix}_pages.jsonl')
+        self.journal_keys = {}
+        self.unload_dir = unload_dir
+        self.parameters = parameters
+        self.enabled = enabled
+        self.stages = {}
+        self.pages = None
+        self.volumes = {}
+        if enabled:
+            self.load()
+
+    def load(self):
+        if not os.path.isfile(self.file_path):
+            return
+
+        try:
+            with open(self.file_path, encoding='utf-8') as manifest_file:
+                content = json.load(manifest_file)
+        except (OSError, ValueError):
+            return
+
+        if content.get('parameters') == self.parameters:
+            self.stages = content.get('stages', {})
+            self.pages = content.get('pages')
+            self.volumes = content.get('volumes', {})
+
+    def save(self):
+        if not self.enabled:
+            return
+
+        # пишем во временный файл и подменяем, чтобы сбой не оставил манифест недописанным
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(
+                {'parameters': self.parameters, 'stages': self.stages, 'pages': self.pages, 'volumes': self.volumes},
+                manifest_file,
+                ensure_ascii=False,
+            )
+        os.replace(temp_path, self.file_path)
+
+    def remove(self):
+        """Удаляет манифест после успешной упаковки архива."""
+        self.stages = {}
+        self.pages = None
+        self.volumes = {}
+        for file_path in (self.file_path, self.journal_path):
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+    def files_exist(self, files):
+        return all(self.file_exists(file_name) for file_name in files)
+
+    def file_exists(self, file_name):
+        """Файл на месте целиком, либо на месте все его тома."""
+        names = self.volumes.get(file_name) or (file_name,)
+        return all(os.path.isfile(os.path.join(self.unload_dir, name)) for name in names)
+
+    def set_volumes(self, file_name, volumes):
+        """Запоминает тома, на которые разделён готовый файл."""
+        self.volumes[file_name] = list(volumes)
+        self.save()
+
+    def is_done(self, stage):
+        """Этап завершён в прошлом запуске и его файлы на месте."""
+        return stage in self.stages and self.files_exist(self.stages[stage]['files'])
+
+    def state(self, stage):
+        """Состояние, сохранённое при завершении этапа.
+
+        Returns:
+            dict: Значения атрибутов выгрузки по именам.
+        """
+        return decode_state(self.stages[stage]['state'])
+
+    def complete(self, stage, files, state):
+        """Отмечает этап завершённым.
+
+        Args:
+            stage (str): Имя этапа.
+            files (tuple): Файлы этапа; в манифест попадают только созданные.
+            state (dict): Атрибуты выгрузки, нужные следующим этапам.
+        """
+        self.stages[stage] = {
+            'files': [file_name for file_name in files if self.files_exist((file_name,))],
+            'state': encode_state(state),
+        }
+        if self.pages and self.pages['stage'] == stage:
+            self.pages = None
+        self.save()
+        if self.pages is None and os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+    def page_progress(self, stage, file_name):
+        """Состояние постраничной записи файла этапа, если файл был начат в прошлом запуске.
+
+        Журнал побочных данных обрезается до контрольной точки: дописанное после неё
+        относится к записям, которые будут выбраны заново.
+
+        Returns:
+            dict or None: Ключи страниц (keys), количество записей в файле (records)
+            и побочные данные создателя (state).
+        """
+        if not self.pages or self.pages['stage'] != stage or self.pages['file'] != file_name:
+            return None
+        # манифест прежней версии хранил побочные данные в себе, файл пишется заново
+        if 'journal_size' not in self.pages or not os.path.isfile(self.journal_path):
+            return None
+        if not self.files_exist((file_name,)):
+            return None
+
+        state = {}
+        with open(self.journal_path, 'r+b') as journal:
+            journal.truncate(self.pages['journal_size'])
+            for line in journal:
+                for name, value in decode_state(json.loads(line)).items():
+                    if name in state:
+                        state[name].update(value)
+                    else:
+                        state[name] = value
+
+        self.journal_keys = {name: set(value) for name, value in state.items()}
+        return {
+            'keys': decode_state(self.pages['keys']),
+            'records': self.pages['records'],
+            'state': state,
+        }
+
+    def begin_pages(self):
+        """Начинает постраничную запись файла с начала: журнал прошлого файла отбрасывается."""
+        if self.pages is not None:
+            # контрольная точка прошлого файла не должна ссылаться на обрезанный журнал
+            self.pages = None
+            self.save()
+        self.journal_keys = {}
+        if self.enabled:
+            open(self.journal_path, 'wb').close()
+
+    def save_pages(self, stage, file_name, keys, records, state):
+        """Запоминает контрольную точку постраничной записи файла этапа.
+
+        В журнал дописываются только новые элементы побочных данных, в манифест - ключи
+        страниц, количество записей и размер журнала.
+
+        Args:
+            stage (str): Имя этапа.
+            file_name (str): Имя dbf-файла.
+            keys (dict): Последние ключи страниц по именам контрольных точек.
+            records (int): Количество записей, сохранённых в файле.
+            state (dict): Побочные данные создателя (side_data).
+        """
+        if not self.enabled:
+            return
+
+        added = {}
+        for name, value in state.items():
+            journal_keys = self.journal_keys.setdefault(name, set())
+            new_keys = value.keys() - journal_keys if isinstance(value, dict) else value - journal_keys
+            if new_keys:
+                journal_keys.update(new_keys)
+                added[name] = {key: value[key] for key in new_keys} if isinstance(value, dict) else new_keys
+
+        with open(self.journal_path, 'ab') as journal:
+            if added:
+                journal.write(json.dumps(encode_state(added), ensure_ascii=False).encode('utf-8') + b'\n')
+            journal_size = journal.tell()
+
+        self.pages = {
+            'stage': stage,
+            'file': file_name,
+            'keys': encode_state(keys),
+            'records': records,
+            'journal_size': journal_size,
+        }
+        self.save()
@@ -0,0 +1,626 @@
+"""Колоночная конвертация пакетов записей в готовые блоки dbf-записей.
+
+Пакет записей из FireBird транспонируется в массивы по колонкам, геттеры
+FireBirdGetterMethods применяются к колонке целиком (через numpy), после чего
+колонки фиксированной ширины перемежаются в буфер dbf-записей. Если numpy не
+установлен, используется построчное кодирование с тем же результатом.
+"""
+import datetime
+import heapq
+import os
+import struct
+import tempfile
+from collections import namedtuple
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from settings import DBF_CODE_PAGE, SORT_MEMORY_BUDGET
+
+# коды кодовых страниц в заголовке dbf
+DBF_CODE_PAGE_IDS = {
+    'cp866': 0x26,
+    'cp1251': 0xC9,
+}
+
+# примерные накладные расходы python на одну запись при сортировке в памяти, байт
+RECORD_SORT_OVERHEAD = 200
+
+DbfField = namedtuple('DbfField', ('type_code', 'name', 'length', 'decimal_count', 'start'))
+
+
+class RecordBatch:
+    """Пакет записей из базы данных: имена колонок и строки в виде кортежей.
+
+    Attributes:
+        columns: имена колонок в порядке курсора
+        rows: список строк (кортежей)
+    """
+
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.rows = rows
+        self._index = {name: position for position, name in enumerate(self.columns)}
+        self._transposed = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getstate__(self):
+        # транспонированные колонки не передаём в процессы пула
+        return {'columns': self.columns, 'rows': self.rows}
+
+    def __setstate__(self, state):
+        self.__init__(state['columns'], state['rows'])
+
+    def __iter__(self):
+        return iter(self.as_dicts())
+
+    def column(self, name):
+        """Значения колонки пакета.
+
+        Args:
+            name (str): Имя колонки.
+
+        Returns:
+            tuple: Значения колонки по всем строкам пакета.
+        """
+        if self._transposed is None:
+            self._transposed = list(zip(*self.rows)) if self.rows else [() for _ in self.columns]
+
+        return self._transposed[self._index[name]]
+
+    def as_dicts(self):
+        """Строки пакета в виде словарей, как их возвращает DatabaseConnection.execute."""
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    @classmethod
+    def from_dicts(cls, records, columns=None):
+        """Собирает пакет из списка словарей.
+
+        Args:
+            records (list[dict]): Записи.
+            columns (tuple, optional): Имена колонок, по умолчанию ключи первой записи.
+
+        Returns:
+            RecordBatch: Пакет записей.
+        """
+        records = list(records)
+        if columns is None:
+            columns = tuple(records[0].keys()) if records else ()
+
+        return cls(columns, [tuple(record[name] for name in columns) for record in records])
+
+
+class RecordLayout:
+    """Раскладка dbf-записи по схеме dbf_schema_and_getter_map.
+
+    Attributes:
+        fields: список описаний полей DbfField
+        record_length: длина записи вместе с флагом удаления
+    """
+
+    def __init__(self, schema_keys, encoding=DBF_CODE_PAGE):
+        self.encoding = encoding
+        self.fields = []
+        start = 1
+        for key in schema_keys:
+            type_code, name, length = key[:3]
+            decimal_count = key[3] if len(key) > 3 else 0
+            self.fields.append(DbfField(type_code.upper(), name.upper(), length, decimal_count, start))
+            start += length
+
+        self.record_length = start
+
+    def encode_value(self, field, value):
+        """Кодирует значение поля так же, как построчная запись (DbfCreatorABS.write_records).
+
+        Текст кодируется в кодировку файла с заменой недопустимых символов на '?' - это
+        делает force_encode перед записью через dbfpy3; bytes перед этим декодируются.
+
+        Args:
+            field (DbfField): Описание поля.
+            value: Значение.
+
+        Returns:
+            bytes: Значение фиксированной ширины.
+        """
+        if field.type_code == 'N':
+            string = '%*.*f' % (field.length, field.decimal_count, value)
+            if len(string) > field.length:
+                if not (0 <= string.find('.') <= field.length):
+                    raise ValueError(f'[{field.name}] Numeric overflow: {string} (field length: {field.length})')
+                string = string[:field.length]
+            return string.encode('ascii')
+
+        if isinstance(value, bytes):
+            value = value.decode()
+        return str(value).encode(self.encoding, 'replace')[:field.length].ljust(field.length)
+
+    def encode_record(self, values):
+        """Кодирует запись из словаря значений полей.
+
+        Args:
+            values (dict): Значения по именам полей, отсутствующие поля заполняются пустыми.
+
+        Returns:
+            bytes: Запись dbf вместе с флагом удаления.
+        """
+        parts = [b' ']
+        for field in self.fields:
+            value = values.get(field.name)
+            if value is None:
+                value = 0 if field.type_code == 'N' else ''
+            parts.append(self.encode_value(field, value))
+
+        return b''.join(parts)
+
+    def encode_column(self, field, values):
+        """Кодирует колонку значений в массив байтов фиксированной ширины (numpy).
+
+        Args:
+            field (DbfField): Описание поля.
+            values: Массив значений колонки.
+
+        Returns:
+            numpy.ndarray: Массив uint8 размерности (количество записей, длина поля).
+        """
+        count = len(values)
+        if field.type_code == 'N':
+            encoded = _format_numbers(field, _as_float(values))
+        else:
+            text = _as_text(values)
+            encoded = np.char.encode(text, self.encoding, 'replace').astype(f'S{field.length}')
+            encoded = np.char.ljust(encoded, field.length).astype(f'S{field.length}')
+
+        return encoded.view(np.uint8).reshape(count, field.length)
+
+    def interleave(self, columns, count):
+        """Перемежает закодированные колонки в блок dbf-записей.
+
+        Args:
+            columns (dict): Значения колонок по именам полей; отсутствующие заполняются пустыми.
+            count (int): Количество записей.
+
+        Returns:
+            bytes: Блок записей.
+        """
+        buffer = np.full((count, self.record_length), ord(' '), dtype=np.uint8)
+        for field in self.fields:
+            values = columns.get(field.name)
+            if values is None:
+                values = np.full(count, 0 if field.type_code == 'N' else '', dtype=object)
+            buffer[:, field.start:field.start + field.length] = self.encode_column(field, values)
+
+        return buffer.tobytes()
+
+
+def _as_objects(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _as_float(values):
+    """Числовая колонка: пустые значения превращаются в 0."""
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        return values
+
+    objects = _as_objects(values)
+    objects[~objects.astype(bool)] = 0
+    return objects.astype(float)
+
+
+def _as_text(values):
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        return values
+
+    return _as_objects(values).astype(str)
+
+
+def _format_numbers(field, numbers):
+    if field.decimal_count:
+        text = np.char.mod(f'%{field.length}.{field.decimal_count}f', numbers)
+    else:
+        text = np.rint(numbers).astype(np.int64).astype(str)
+        text = np.char.rjust(text, field.length)
+
+    if len(text) and np.char.str_len(text).max() > field.length:
+        # без дробной части переполнение не обрезается, как и в dbfpy3
+        raise ValueError(f'[{field.name}] Numeric overflow (field length: {field.length})')
+
+    return np.char.encode(text, 'ascii').astype(f'S{field.length}')
+
+
+def _round_scaled(values, digits):
+    """Округление round(Decimal(value), digits) в целых единицах 10**-digits.
+
+    Значения, попавшие рядом с половиной единицы, пересчитываются через Decimal,
+    чтобы результат совпадал с построчным округлением до бита.
+    """
+    objects = _as_objects(values)
+    numbers = _as_float(objects)
+    scaled = numbers * 10 ** digits
+    result = np.rint(scaled)
+    tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= np.abs(scaled) * 1e-14 + 1e-9
+    for position in np.flatnonzero(tie):
+        value = objects[position] or 0
+        result[position] = int(round(Decimal(value), digits).scaleb(digits))
+
+    return result
+
+
+def vec_date_from_double(values):
+    numbers = _as_float(values)
+    text = np.rint(numbers).astype(np.int64).astype(str)
+    return np.where(numbers != 0, text, '')
+
+
+def vec_to_string(values):
+    objects = _as_objects(values)
+    return np.where(objects.astype(bool), objects.astype(str), '')
+
+
+def vec_number(values):
+    objects = _as_objects(values)
+    objects[~objects.astype(bool)] = 0
+    return objects
+
+
+def vec_number_prescision2(values):
+    return _round_scaled(values, 2) / 100
+
+
+def vec_number_prescision4(values):
+    return _round_scaled(values, 4) / 10000
+
+
+def vec_get_inn(values):
+    text = vec_date_from_double(values)
+    lengths = np.char.str_len(text)
+    return np.where((lengths == 9) | (lengths == 11), np.char.add('0', text), text)
+
+
+# векторные аналоги геттеров FireBirdGetterMethods по (имени геттера, типу поля)
+VECTORIZED_GETTERS = {
+    ('FireBirdGetterMethods.date_from_double', 'C'): vec_date_from_double,
+    ('FireBirdGetterMethods.string_from_float', 'C'): vec_date_from_double,
+    ('FireBirdGetterMethods.to_string', 'C'): vec_to_string,
+    ('FireBirdGetterMethods.get_inn', 'C'): vec_get_inn,
+    ('FireBirdGetterMethods.number', 'C'): vec_number,
+    ('FireBirdGetterMethods.number', 'N'): vec_number,
+    ('FireBirdGetterMethods.number_prescision2', 'N'): vec_number_prescision2,
+    ('FireBirdGetterMethods.number_prescision4', 'N'): vec_number_prescision4,
+}
+
+
+def apply_getter(getter, type_code, values):
+    """Применяет геттер к колонке целиком.
+
+    Для известных геттеров используется векторный аналог, для остальных геттер
+    вызывается поэлементно.
+
+    Args:
+        getter (callable): Геттер из схемы создателя.
+        type_code (str): Тип dbf-поля.
+        values: Значения колонки.
+
+    Returns:
+        numpy.ndarray: Преобразованная колонка.
+    """
+    vectorized = VECTORIZED_GETTERS.get((getattr(getter, '__qualname__', None), type_code))
+    if vectorized:
+        return vectorized(values)
+
+    return np.frompyfunc(getter, 1, 1)(_as_objects(values))
+
+
+class DbfBlockWriter:
+    """Запись dbf-файла готовыми блоками записей.
+
+    Заголовок совпадает с тем, что пишет dbfpy3, поэтому файл читается теми же
+    средствами. Поддерживается дозапись в существующий файл с той же раскладкой.
+    """
+
+    def __init__(self, file_path, layout, new=True):
+        self.file_path = file_path
+        self.layout = layout
+        self.header_length = 32 + 32 * len(layout.fields) + 1
+        self.record_count = 0
+        self.stream = open(file_path, 'w+b' if new else 'r+b')
+        if new:
+            self.write_header()
+        else:
+            self.read_header()
+
+        self.stream.seek(self.header_length + self.record_count * self.layout.record_length)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def read_header(self):
+        self.stream.seek(0)
+        _, _, _, _, record_count, header_length, record_length = struct.unpack('< 4B I 2H', self.stream.read(12))
+        if record_length != self.layout.record_length:
+            raise ValueError(f'{self.file_path}: длина записи {record_length} не совпадает со схемой')
+
+        self.record_count = record_count
+        self.header_length = header_length
+
+    def write_header(self):
+        today = datetime.date.today()
+        self.stream.seek(0)
+        self.stream.write(struct.pack(
+            '< 4B I 2H 16s 2B 2s',
+            0x03,
+            today.year - 1900,
+            today.month,
+            today.day,
+            self.record_count,
+            self.header_length,
+            self.layout.record_length,
+            b'\x00' * 16,
+            0,
+            DBF_CODE_PAGE_IDS.get(self.layout.encoding, 0),
+            b'\x00' * 2,
+        ))
+        for field in self.layout.fields:
+            self.stream.write(struct.pack(
+                '< 11s c I 3B I B 8s',
+                field.name.encode(self.layout.encoding),
+                field.type_code.encode(),
+                field.start,
+                field.length,
+                field.decimal_count,
+                0,
+                0,
+                0,
+                b'\x00' * 8,
+            ))
+        self.stream.write(b'\x0D')
+
+    def write_block(self, block, record_count):
+        """Дописывает блок закодированных записей.
+
+        Args:
+            block (bytes): Записи подряд.
+            record_count (int): Количество записей в блоке.
+        """
+        self.stream.write(block)
+        self.record_count += record_count
+
+    def truncate(self, record_count):
+        """Отбрасывает записи после первых record_count, следующие блоки пишутся с этого места."""
+        self.record_count = min(self.record_count, record_count)
+        self.stream.seek(self.header_length + self.record_count * self.layout.record_length)
+
+    def flush(self):
+        """Обновляет заголовок и сбрасывает записанное на диск, запись продолжается с того же места."""
+        position = self.stream.tell()
+        self.write_header()
+        self.stream.seek(position)
+        self.stream.flush()
+
+    def close(self):
+        if self.stream.closed:
+            return
+
+        self.stream.seek(self.header_length + self.record_count * self.layout.record_length)
+        self.stream.write(b'\x1A')
+        self.stream.truncate()
+        self.write_header()
+        self.stream.close()
+
+
+def read_dbf_header(file_path):
+    """Заголовок dbf-файла.
+
+    Returns:
+        tuple: Количество записей, длина заголовка, длина записи и список DbfField.
+    """
+    with open(file_path, 'rb') as stream:
+        _, _, _, _, record_count, header_length, record_length = struct.unpack('< 4B I 2H', stream.read(12))
+        stream.seek(32)
+        fields = []
+        start = 1
+        while True:
+            descriptor = stream.read(32)
+            if not descriptor or descriptor[0] == 0x0D:
+                break
+            name, type_code, _, length, decimal_count = struct.unpack('< 11s c I 2B', descriptor[:18])
+            fields.append(DbfField(type_code.decode(), name.split(b'\x00')[0].decode(), length, decimal_count, start))
+            start += length
+
+    return record_count, header_length, record_length, fields
+
+
+def read_dbf_blocks(file_path, layout, records_per_block=5000):
+    """Читает записи dbf-файла блоками без разбора значений.
+
+    Args:
+        file_path (str): Путь к файлу.
+        layout (RecordLayout): Ожидаемая раскладка записи.
+        records_per_block (int): Количество записей в блоке.
+
+    Yields:
+        tuple: Блок записей и количество записей в нём.
+    """
+    with open(file_path, 'rb') as stream:
+        _, _, _, _, record_count, header_length, record_length = struct.unpack('< 4B I 2H', stream.read(12))
+        if record_length != layout.record_length:
+            raise ValueError(f'{file_path}: длина записи {record_length} не совпадает со схемой')
+
+        stream.seek(header_length)
+        for start in range(0, record_count, records_per_block):
+            count = min(records_per_block, record_count - start)
+            yield stream.read(count * record_length), count
+
+
+def unique_records(blocks, layout, field_name, seen_keys):
+    """Оставляет в блоках только записи с новым значением поля.
+
+    Args:
+        blocks: Итератор пар (блок, количество записей).
+        layout (RecordLayout): Раскладка записи.
+        field_name (str): Поле-ключ.
+        seen_keys (set): Уже встреченные значения поля, пополняется.
+
+    Yields:
+        tuple: Блок оставшихся записей и их количество.
+    """
+    field = next(field for field in layout.fields if field.name == field_name)
+    length = layout.record_length
+    for block, record_count in blocks:
+        kept = []
+        for position in range(0, record_count * length, length):
+            record = block[position:position + length]
+            key = record[field.start:field.start + field.length]
+            if key not in seen_keys:
+                seen_keys.add(key)
+                kept.append(record)
+
+        if kept:
+            yield b''.join(kept), len(kept)
+
+
+def record_sort_key(layout, field_names):
+    """Ключ сортировки закодированной записи.
+
+    Поля сравниваются как числа, если значение состоит из цифр, иначе как байты;
+    при равенстве полей записи упорядочиваются по всем байтам, поэтому порядок
+    не зависит от порядка строк, пришедших из базы.
+
+    Args:
+        layout (RecordLayout): Раскладка записи.
+        field_names (tuple): Поля сортировки.
+
+    Returns:
+        callable: Функция запись -> ключ.
+    """
+    fields = [field for name in field_names for field in layout.fields if field.name == name]
+
+    def key(record):
+        parts = []
+        for field in fields:
+            value = record[field.start:field.start + field.length].strip()
+            parts.append((0, int(value), b'') if value.isdigit() else (1, 0, value))
+        parts.append(record)
+        return tuple(parts)
+
+    return key
+
+
+def _write_run(directory, number, records):
+    path = os.path.join(directory, f'run{number}')
+    with open(path, 'wb') as run_file:
+        run_file.writelines(records)
+    return path
+
+
+def _read_run(path, record_length, records_per_read=5000):
+    with open(path, 'rb') as run_file:
+        while True:
+            chunk = run_file.read(record_length * records_per_read)
+            if not chunk:
+                break
+            for position in range(0, len(chunk), record_length):
+                yield chunk[position:position + record_length]
+
+
+def sort_dbf_file(file_path, layout, field_names, memory_budget=SORT_MEMORY_BUDGET, records_per_block=5000):
+    """Сортирует записи dbf-файла по полям.
+
+    Если записи не помещаются в memory_budget, используется внешняя сортировка слиянием:
+    отсортированные серии сбрасываются во временные файлы рядом с файлом и сливаются
+    в новый файл. Файл заменяется отсортированным целиком.
+
+    Args:
+        file_path (str): Путь к файлу.
+        layout (RecordLayout): Раскладка записи.
+        field_names (tuple): Поля сортировки.
+        memory_budget (int): Сколько байт записей можно держать в памяти.
+        records_per_block (int): Количество записей в блоке чтения и записи.
+    """
+    key = record_sort_key(layout, field_names)
+    length = layout.record_length
+    run_records = max(1, memory_budget // (length + RECORD_SORT_OVERHEAD))
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(file_path))) as temp_dir:
+        runs = []
+        records = []
+        for block, record_count in read_dbf_blocks(file_path, layout, records_per_block):
+            records.extend(block[position:position + length] for position in range(0, record_count * length, length))
+            if len(records) >= run_records:
+                records.sort(key=key)
+                runs.append(_write_run(temp_dir, len(runs), records))
+                records = []
+
+        if runs:
+            if records:
+                records.sort(key=key)
+                runs.append(_write_run(temp_dir, len(runs), records))
+                records = []
+            ordered = heapq.merge(*(_read_run(path, length, records_per_block) for path in runs), key=key)
+        else:
+            ordered = iter(sorted(records, key=key))
+
+        sorted_path = os.path.join(temp_dir, 'sorted.dbf')
+        with DbfBlockWriter(sorted_path, layout) as writer:
+            while True:
+                chunk = [record for _, record in zip(range(records_per_block), ordered)]
+                if not chunk:
+                    break
+                writer.write_block(b''.join(chunk), len(chunk))
+
+        os.replace(sorted_path, file_path)
+
+
+def split_dbf_file(file_path, max_bytes=0, max_records=0, copy_chunk=1024 * 1024):
+    """Делит dbf-файл на тома ``имя_001.dbf``, ``имя_002.dbf``, ... по размеру или количеству записей.
+
+    Заголовок каждого тома - заголовок исходного файла со своим количеством записей,
+    записи копируются байтами. Исходный файл не удаляется.
+
+    Args:
+        file_path (str): Путь к файлу.
+        max_bytes (int): Наибольший размер тома, 0 - без ограничения.
+        max_records (int): Наибольшее количество записей в томе, 0 - без ограничения.
+        copy_chunk (int): Размер порции копирования, байт.
+
+    Returns:
+        list[str]: Пути к томам; если делить не нужно - список из исходного файла.
+    """
+    with open(file_path, 'rb') as source:
+        record_count, header_length, record_length = struct.unpack('< I 2H', source.read(12)[4:])
+        limits = [record_count]
+        if max_bytes:
+            limits.append(max(1, (max_bytes - header_length - 1) // record_length))
+        if max_records:
+            limits.append(max_records)
+        records_per_volume = min(limits)
+        if records_per_volume >= record_count:
+            return [file_path]
+
+        source.seek(0)
+        header = bytearray(source.read(header_length))
+        base, extension = os.path.splitext(file_path)
+        volumes = []
+        for number, start in enumerate(range(0, record_count, records_per_volume), 1):
+            volume_path = f'{base}_{number:03}{extension}'
+            struct.pack_into('< I', header, 4, min(records_per_volume, record_count - start))
+            remaining = min(records_per_volume, record_count - start) * record_length
+            with open(volume_path, 'wb') as volume:
+                volume.write(header)
+                while remaining:
+                    chunk = source.read(min(remaining, copy_chunk))
+                    volume.write(chunk)
+                    remaining -= len(chunk)
+                volume.write(b'\x1A')
+            volumes.append(volume_path)
+
+    return volumes
@@ -0,0 +1,81 @@
+"""Пул процессов для кодирования пакетов записей в блоки dbf-записей.
+
+Кодирование пакета (геттеры, fkr, перемежение колонок) выполняется в
+процессах-исполнителях, главный процесс только пишет готовые блоки по порядку.
+Побочные данные создателя (fkr_list, organizations_ids) собираются в каждом
+исполнителе и объединяются в главном процессе.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def encode_batch_in_process(creator_class, batch, with_columns=False):
+    """Кодирует пакет в процессе-исполнителе.
+
+    Args:
+        creator_class (type): Класс создателя dbf-файла.
+        batch (RecordBatch): Пакет записей.
+        with_columns (bool): Вернуть и преобразованные колонки (для дополнительных форматов).
+
+    Returns:
+        tuple: Блок записей, количество записей, побочные данные создателя и колонки или None.
+    """
+    creator = creator_class()
+    columns = creator.convert_batch(batch)
+    block = creator.encode_batch(batch, columns=columns)
+    return block, len(batch), creator.side_data(), columns if with_columns else None
+
+
+class ConversionPool:
+    """Пул процессов кодирования пакетов.
+
+    Attributes:
+        processes: количество процессов
+        max_pending: сколько пакетов может находиться в обработке одновременно
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.max_pending = self.processes * 2
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def encode(self, creator, batches, columns_handler=None):
+        """Кодирует пакеты в пуле, сохраняя исходный порядок.
+
+        Побочные данные исполнителей объединяются в ``creator`` по мере получения блоков.
+
+        Args:
+            creator (DbfCreatorABS): Создатель, для класса которого кодируются пакеты.
+            batches: Итератор пакетов RecordBatch.
+            columns_handler (callable, optional): Получает колонки и количество записей каждого
+                пакета по порядку, например запись в дополнительные форматы.
+
+        Yields:
+            tuple: Блок записей и количество записей в нём.
+        """
+        pending = deque()
+        for batch in batches:
+            pending.append(self.executor.submit(encode_batch_in_process, type(creator), batch, columns_handler is not None))
+            if len(pending) >= self.max_pending:
+                yield self._result(creator, pending.popleft(), columns_handler)
+
+        while pending:
+            yield self._result(creator, pending.popleft(), columns_handler)
+
+    @staticmethod
+    def _result(creator, future, columns_handler=None):
+        block, record_count, side_data, columns = future.result()
+        creator.merge_side_data(side_data)
+        if columns_handler is not None:
+            columns_handler(columns, record_count)
+        return block, record_count
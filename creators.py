@@ -1,9 +1,14 @@
 import os
 from abc import ABCMeta
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from itertools import islice
 
 from dbfpy3 import dbf
 
+from columnar import DbfBlockWriter, RecordLayout, apply_getter, np
+from formats import open_table_writer
+from settings import COLUMNAR_BATCH_SIZE, DBF_CODE_PAGE, ORG_COLUMNS
 
 import json
 from decimal import Decimal
@@ -137,6 +142,16 @@ class DbfCreatorABS(metaclass=ABCMeta):
 
     file_name = None
     dbf_schema_and_getter_map = {}
+    # поле справочника, по которому убираются повторы при объединении выгрузок нескольких баз
+    unique_field = None
+    # поля упорядочивания записей при SORTED_OUTPUT
+    sort_fields = ('ID',)
+    # поля, по которым при DBF_INDEXES строятся индексы .ndx
+    index_fields = ('ID',)
+    # сколько строк организаций запоминать из основного запроса (бюджет памяти), None - все
+    organizations_limit = None
+    # поля-классификаторы с небольшим числом значений: в Parquet хранятся словарём
+    classifier_fields = ()
 
     def additional_handler(self, dbf_record, firebird_record):
         """Метод для дополнительной обработки записей, может быть переопределен в наследуемых классах."""
@@ -144,15 +159,23 @@ class DbfCreatorABS(metaclass=ABCMeta):
 
     @staticmethod
     def force_encode(value):
-        """Представляем строки в виде bytes, если это строка.
+        """Приводим строку к символам кодировки dbf-файла.
+
+        dbfpy3 кодирует текстовое поле как str(value).encode(кодировка): bytes записались бы
+        своим представлением b'...', а символ вне DBF_CODE_PAGE - ошибкой. Такие символы
+        заменяются на '?', как при колоночной записи (RecordLayout.encode_value).
 
         Args:
             value: Значение для преобразования.
 
         Returns:
-            bytes or original value: Преобразованное в bytes значение или оригинал, если не строка.
+            str or original value: Строка в символах DBF_CODE_PAGE или оригинал, если не строка.
         """
-        return value.encode() if isinstance(value, str) else value
+        if isinstance(value, bytes):
+            value = value.decode()
+        if isinstance(value, str):
+            return value.encode(DBF_CODE_PAGE, 'replace').decode(DBF_CODE_PAGE)
+        return value
 
     def fkr_handler(self, dbf_record, firebird_record):
         """Заполнение и чтение полей fkr.
@@ -170,40 +193,416 @@ class DbfCreatorABS(metaclass=ABCMeta):
         tarst = FireBirdGetterMethods.to_string(firebird_record['TARST']).ljust(3, '0')
         return f'{grbs}.{divsn}.{targt}.{tarst}', grbs, divsn, targt, tarst
 
-    def create(self, db_records, unload_dir, create_new_file=True):
+    def create(self, db_records, unload_dir, create_new_file=True, cancel_token=None, formats=()):
         """Создание и запись dbf-файла на основе записей из базы данных.
 
         Args:
             db_records: Список записей из базы данных.
             unload_dir: Директория для выгрузки файла.
             create_new_file (bool): Флаг, нужно ли создавать новый файл.
+            cancel_token (CancellationToken, optional): Токен отмены, проверяется перед каждой записью.
+            formats (tuple): Дополнительные форматы (formats.FORMAT_EXTENSIONS), которые пишутся рядом с dbf.
+
+        Returns:
+            None
+        """
+        with self.open(unload_dir, create_new_file, cancel_token=cancel_token, formats=formats) as sink:
+            sink.write(db_records)
+
+    def open(self, unload_dir, create_new_file=True, columnar=False, cancel_token=None, formats=()):
+        """Открывает dbf-файл для записи порциями.
+
+        Args:
+            unload_dir: Директория для выгрузки файла.
+            create_new_file (bool): Флаг, нужно ли создавать новый файл.
+            columnar (bool): Порции - пакеты RecordBatch с колоночной конвертацией, иначе словари.
+            cancel_token (CancellationToken, optional): Токен отмены выгрузки.
+            formats (tuple): Дополнительные форматы, которые пишутся рядом с dbf.
+
+        Returns:
+            DbfRecordSink: Открытый файл.
+        """
+        return DbfRecordSink(self, unload_dir, create_new_file, columnar, cancel_token, formats)
+
+    def write_records(self, dbf_db, db_records, converted=None):
+        """Построчная запись записей из базы данных в открытый dbf-файл.
+
+        Args:
+            dbf_db (dbf.Dbf): Открытый dbf-файл.
+            db_records: Записи из базы данных.
+            converted (list, optional): Сюда добавляются значения записанных полей по именам (для других форматов).
+        """
+        for firebird_record in db_records:
+            dbf_record = dbf_db.new()
+            for key, getter in self.dbf_schema_and_getter_map.items():
+                _, column, _ = key  # Извлекаем имя столбца
+                if isinstance(getter, (tuple, list)):
+                    getter, firebird_column = getter
+                    value = getter(firebird_record[firebird_column])
+                else:
+                    value = getter(firebird_record[column]) if callable(getter) else firebird_record.get(column)
+
+                dbf_record[column.upper()] = self.force_encode(value)
+
+            self.additional_handler(dbf_record, firebird_record)
+            dbf_db.write(dbf_record)
+            if converted is not None:
+                converted.append({key[1].upper(): dbf_record[key[1].upper()] for key in self.dbf_schema_and_getter_map})
+
+    def columnar_handler(self, columns, batch):
+        """Колоночный аналог additional_handler: дополняет колонки пакета и собирает побочные данные.
+
+        По умолчанию переопределённый additional_handler вызывается построчно.
+
+        Args:
+            columns (dict): Преобразованные колонки по именам полей dbf.
+            batch (RecordBatch): Исходный пакет записей из базы данных.
+        """
+        if type(self).additional_handler is DbfCreatorABS.additional_handler:
+            return
+
+        handled = []
+        for firebird_record in batch.as_dicts():
+            values = {}
+            self.additional_handler(values, firebird_record)
+            handled.append(values)
+
+        for name in {name for values in handled for name in values}:
+            columns[name] = [values.get(name) for values in handled]
+
+    def organization_handler(self, org_id, firebird_record):
+        """Запоминает атрибуты организации, если основной запрос выбирает их колонками ORG_COLUMNS.
+
+        Args:
+            org_id: Id организации.
+            firebird_record (dict): Запись из базы данных.
+        """
+        if org_id is not None and org_id not in self.organizations and ORG_COLUMNS[0] in firebird_record:
+            self.remember_organizations({org_id: (org_id,) + tuple(firebird_record[column] for column in ORG_COLUMNS)})
+
+    def organization_columns_handler(self, org_column, batch):
+        """Колоночный аналог organization_handler.
+
+        Args:
+            org_column (str): Колонка с id организации.
+            batch (RecordBatch): Пакет записей из базы данных.
+        """
+        if ORG_COLUMNS[0] not in batch.columns:
+            return
+
+        ids = batch.column(org_column)
+        rows = zip(ids, *(batch.column(column) for column in ORG_COLUMNS))
+        new_rows = {row[0]: row for row in rows if row[0] is not None and row[0] not in self.organizations}
+        self.remember_organizations(new_rows)
+
+    def remember_organizations(self, rows):
+        """Запоминает строки организаций, пока их не больше organizations_limit.
+
+        Незапомненные организации org.dbf выбирает запросом ORG_INFO_SQL по id.
+
+        Args:
+            rows (dict): Id -> строка в порядке ORG_KEYS.
+        """
+        if self.organizations_limit is None:
+            self.organizations.update(rows)
+        elif len(self.organizations) < self.organizations_limit:
+            self.organizations.update(islice(rows.items(), self.organizations_limit - len(self.organizations)))
+
+    def fkr_columns_handler(self, batch):
+        """Колоночный аналог fkr_handler, заполняет fkr_list уникальными кодами пакета.
+
+        Args:
+            batch (RecordBatch): Пакет записей из базы данных.
+
+        Returns:
+            numpy.ndarray: Колонка кодов fkr.
+        """
+        grbs = np.char.ljust(apply_getter(FireBirdGetterMethods.to_string, 'C', batch.column('GRBS')), 3, '0')
+        divsn = np.char.ljust(apply_getter(FireBirdGetterMethods.to_string, 'C', batch.column('DIVSN')), 4, '0')
+        targt = np.char.ljust(apply_getter(FireBirdGetterMethods.to_string, 'C', batch.column('TARGT')), 7, '0')
+        tarst = np.char.ljust(apply_getter(FireBirdGetterMethods.to_string, 'C', batch.column('TARST')), 3, '0')
+        fkrid = grbs
+        for part in (divsn, targt, tarst):
+            fkrid = np.char.add(np.char.add(fkrid, '.'), part)
+
+        _, first = np.unique(fkrid, return_index=True)
+        self.fkr_list.update(zip(
+            fkrid[first].tolist(),
+            grbs[first].tolist(),
+            divsn[first].tolist(),
+            targt[first].tolist(),
+            tarst[first].tolist(),
+        ))
+        return fkrid
+
+    def convert_record(self, firebird_record):
+        """Построчное преобразование записи из базы данных в значения полей dbf.
+
+        Args:
+            firebird_record (dict): Запись из базы данных.
+
+        Returns:
+            dict: Значения по именам полей dbf.
+        """
+        values = {}
+        for key, getter in self.dbf_schema_and_getter_map.items():
+            _, column, _ = key
+            firebird_column = column
+            if isinstance(getter, (tuple, list)):
+                getter, firebird_column = getter
+
+            if callable(getter):
+                values[column.upper()] = getter(firebird_record[firebird_column])
+            elif firebird_column in firebird_record:
+                values[column.upper()] = firebird_record[firebird_column]
+
+        self.additional_handler(values, firebird_record)
+        return values
+
+    def convert_batch(self, batch):
+        """Преобразует пакет записей в колонки значений полей dbf.
+
+        При наличии numpy геттеры применяются к колонкам целиком, иначе записи
+        преобразуются построчно; результат в обоих случаях одинаковый. Закодированные
+        блоки совпадают по байтам с записями write_records (через force_encode и dbfpy3).
+
+        Args:
+            batch (RecordBatch): Пакет записей из базы данных.
+
+        Returns:
+            dict: Колонки (numpy-массивы или списки) по именам полей dbf.
+        """
+        if np is None:
+            records = [self.convert_record(record) for record in batch.as_dicts()]
+            names = {name for values in records for name in values}
+            return {name: [values.get(name) for values in records] for name in names}
+
+        columns = {}
+        for key, getter in self.dbf_schema_and_getter_map.items():
+            type_code, column, _ = key
+            firebird_column = column
+            if isinstance(getter, (tuple, list)):
+                getter, firebird_column = getter
+
+            if callable(getter):
+                columns[column.upper()] = apply_getter(getter, type_code, batch.column(firebird_column))
+            elif firebird_column in batch.columns:
+                columns[column.upper()] = batch.column(firebird_column)
+
+        self.columnar_handler(columns, batch)
+        return columns
+
+    def encode_batch(self, batch, layout=None, columns=None):
+        """Кодирует пакет записей в блок dbf-записей.
+
+        Args:
+            batch (RecordBatch): Пакет записей из базы данных.
+            layout (RecordLayout, optional): Раскладка записи, по умолчанию строится по схеме.
+            columns (dict, optional): Результат convert_batch, если пакет уже преобразован.
+
+        Returns:
+            bytes: Блок записей.
+        """
+        layout = layout or RecordLayout(self.dbf_schema_and_getter_map.keys())
+        if columns is None:
+            columns = self.convert_batch(batch)
+        if np is None:
+            return b''.join(
+                layout.encode_record({name: values[position] for name, values in columns.items()})
+                for position in range(len(batch))
+            )
+
+        return layout.interleave(columns, len(batch))
+
+    def side_data(self):
+        """Побочные данные, собранные при кодировании (fkr_list, organizations_ids, organizations и т.п.).
+
+        Returns:
+            dict: Множества и словари по именам атрибутов.
+        """
+        return {name: value for name, value in vars(self).items() if isinstance(value, (set, dict))}
+
+    def merge_side_data(self, side_data):
+        """Объединяет побочные данные, собранные другим экземпляром (например, в процессе пула).
+
+        Args:
+            side_data (dict): Результат side_data.
+        """
+        for name, value in side_data.items():
+            if name == 'organizations':
+                self.remember_organizations(value)
+            else:
+                getattr(self, name).update(value)
+
+    def create_columnar(self, batches, unload_dir, create_new_file=True, pool=None, cancel_token=None, formats=()):
+        """Создание dbf-файла из пакетов записей с колоночной конвертацией.
+
+        Args:
+            batches: Итератор пакетов RecordBatch.
+            unload_dir: Директория для выгрузки файла.
+            create_new_file (bool): Флаг, нужно ли создавать новый файл.
+            pool (ConversionPool, optional): Пул процессов для кодирования пакетов.
+            cancel_token (CancellationToken, optional): Токен отмены, проверяется перед каждым пакетом.
+            formats (tuple): Дополнительные форматы, которые пишутся рядом с dbf.
 
         Returns:
             None
         """
-        file_path = os.path.join(unload_dir, self.file_name)
-        with dbf.Dbf(file_path, new=create_new_file, code_page='cp866') as dbf_db:
+        with self.open(unload_dir, create_new_file, columnar=True, cancel_token=cancel_token, formats=formats) as sink:
+            if pool:
+                if cancel_token is not None:
+                    batches = cancel_token.guard(batches)
+                columns_handler = sink.write_tables if sink.tables else None
+                sink.write_blocks(pool.encode(self, batches, columns_handler))
+            else:
+                sink.write(batches)
+
+
+class DbfRecordSink:
+    """Открытый на запись dbf-файл создателя, записи добавляются порциями.
+
+    Если заданы дополнительные форматы, каждая порция преобразуется один раз: колонки
+    кодируются в dbf-блок и параллельно, в потоках, пишутся в файлы форматов.
+    Пока кодируется следующая порция, файлы форматов дописывают предыдущую.
+
+    Attributes:
+        creator: создатель, по схеме которого пишутся записи
+        columnar: порции - пакеты RecordBatch, иначе словари записей
+        writer: DbfBlockWriter в колоночном режиме, иначе dbf.Dbf
+        cancel_token: токен отмены, проверяется перед каждой записью или пакетом
+        tables: открытые файлы дополнительных форматов
+    """
+
+    def __init__(self, creator, unload_dir, create_new_file=True, columnar=False, cancel_token=None, formats=()):
+        self.creator = creator
+        self.columnar = columnar
+        self.cancel_token = cancel_token
+        file_path = os.path.join(unload_dir, creator.file_name)
+        if columnar:
+            self.layout = RecordLayout(creator.dbf_schema_and_getter_map.keys())
+            self.writer = DbfBlockWriter(file_path, self.layout, new=create_new_file)
+        else:
+            self.layout = None
+            self.writer = dbf.Dbf(file_path, new=create_new_file, code_page=DBF_CODE_PAGE)
             if create_new_file:
-                dbf_db.add_field(*self.dbf_schema_and_getter_map.keys())
+                self.writer.add_field(*creator.dbf_schema_and_getter_map.keys())
+
+        self.tables = [
+            open_table_writer(output_format, creator, unload_dir, append=not create_new_file)
+            for output_format in formats
+        ]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.tables)) if self.tables else None
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, db_records):
+        """Дописывает порцию записей: пакеты RecordBatch или словари, в зависимости от режима."""
+        if self.columnar:
+            self.write_blocks(self.encode(batch) for batch in db_records)
+            return
+
+        if self.cancel_token is not None:
+            db_records = self.cancel_token.guard(db_records)
+        if not self.tables:
+            self.creator.write_records(self.writer, db_records)
+            return
+
+        db_records = iter(db_records)
+        while True:
+            converted = []
+            self.creator.write_records(self.writer, islice(db_records, COLUMNAR_BATCH_SIZE), converted)
+            if not converted:
+                break
+            names = {name for values in converted for name in values}
+            self.write_tables({name: [values.get(name) for values in converted] for name in names}, len(converted))
+
+    def encode(self, batch):
+        """Кодирует пакет в dbf-блок, преобразованные колонки отдаёт файлам форматов.
+
+        Returns:
+            tuple: Блок записей и количество записей.
+        """
+        if not self.tables:
+            return self.creator.encode_batch(batch, self.layout), len(batch)
+
+        columns = self.creator.convert_batch(batch)
+        self.write_tables(columns, len(batch))
+        return self.creator.encode_batch(batch, self.layout, columns), len(batch)
 
-            for firebird_record in db_records:
-                dbf_record = dbf_db.new()
-                for key, getter in self.dbf_schema_and_getter_map.items():
-                    _, column, _ = key  # Извлекаем имя столбца
-                    if isinstance(getter, (tuple, list)):
-                        getter, firebird_column = getter
-                        value = getter(firebird_record[firebird_column])
-                    else:
-                        value = getter(firebird_record[column]) if callable(getter) else firebird_record[column]
+    def write_tables(self, columns, count):
+        """Передаёт колонки порции файлам форматов, каждому в своём потоке.
+
+        Сначала дожидается записи предыдущей порции, поэтому порядок записей сохраняется,
+        а в памяти остаётся не больше одной порции сверх текущей.
+
+        Args:
+            columns (dict): Колонки по именам полей dbf.
+            count (int): Количество записей.
+        """
+        self.wait_tables()
+        self.pending = [self.executor.submit(table.write_columns, columns, count) for table in self.tables]
 
-                    dbf_record[column.upper()] = self.force_encode(value)
+    def wait_tables(self):
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
 
-                self.additional_handler(dbf_record, firebird_record)
-                dbf_db.write(dbf_record)
+    def write_blocks(self, blocks):
+        """Дописывает готовые блоки записей (только колоночный режим).
+
+        Args:
+            blocks: Итератор пар (блок, количество записей).
+        """
+        if self.cancel_token is not None:
+            blocks = self.cancel_token.guard(blocks)
+        for block, record_count in blocks:
+            self.writer.write_block(block, record_count)
+
+    @property
+    def record_count(self):
+        return self.writer.record_count
+
+    def truncate(self, record_count):
+        """Отбрасывает записи, дописанные после record_count (например, до сбоя прошлого запуска).
+
+        Файлы дополнительных форматов не обрезаются, поэтому постраничное продолжение с ними не используется.
+        """
+        if self.columnar:
+            self.writer.truncate(record_count)
+        else:
+            self.writer.header.record_count = min(self.writer.header.record_count, record_count)
+            self.flush()
+
+    def flush(self):
+        """Сохраняет заголовок и записанные записи на диск."""
+        self.wait_tables()
+        if self.columnar:
+            self.writer.flush()
+        else:
+            # dbfpy3 пишет заголовок только после изменения полей, количество записей обновляем сами
+            self.writer.header.write(self.writer.stream)
+            self.writer.stream.flush()
+
+    def close(self):
+        try:
+            self.wait_tables()
+        finally:
+            for table in self.tables:
+                table.close()
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.writer.close()
 
 
 class PlpMainCreator(DbfCreatorABS):
     file_name = 'plp_main.dbf'
+    index_fields = ('ID', 'FKRID', 'ENT_LS')
+    classifier_fields = ('FKRID', 'SOURCEKESR', 'REFBU')
     dbf_schema_and_getter_map = {
         ("C", 'ID', 15): FireBirdGetterMethods.to_string,
         ("C", 'ENT_INN', 12): FireBirdGetterMethods.string_from_float,
@@ -236,6 +635,7 @@ class PlpMainCreator(DbfCreatorABS):
 
     def __init__(self):
         self.organizations_ids = set()
+        self.organizations = {}
         self.fkr_list = set()
 
     def additional_handler(self, dbf_record, firebird_record):
@@ -243,10 +643,18 @@ class PlpMainCreator(DbfCreatorABS):
         dbf_record['FKRID'] = fkrid
         self.fkr_list.add((fkrid, grbs, divsn, targt, tarst))
         self.organizations_ids.add(firebird_record['DEST_ORG'])
+        self.organization_handler(firebird_record['DEST_ORG'], firebird_record)
+
+    def columnar_handler(self, columns, batch):
+        columns['FKRID'] = self.fkr_columns_handler(batch)
+        self.organizations_ids.update(batch.column('DEST_ORG'))
+        self.organization_columns_handler('DEST_ORG', batch)
 
 
 class PlpOrgCreator(DbfCreatorABS):
     file_name = 'plp_org.dbf'
+    unique_field = 'ID'
+    classifier_fields = ('OKATO',)
     dbf_schema_and_getter_map = {
         ("C", 'ID', 15): FireBirdGetterMethods.to_string,
         ("C", 'INN', 12): FireBirdGetterMethods.get_inn,
@@ -259,6 +667,8 @@ class PlpOrgCreator(DbfCreatorABS):
 
 class PlpFkrCreator(DbfCreatorABS):
     file_name = 'plp_fkr.dbf'
+    unique_field = 'ID'
+    classifier_fields = ('GRBS', 'DIVSN', 'TARGT', 'TARST')
     dbf_schema_and_getter_map = {
         ("C", 'ID', 30): FireBirdGetterMethods.to_string,
         ("C", 'GRBS', 3): FireBirdGetterMethods.to_string,
@@ -270,6 +680,8 @@ class PlpFkrCreator(DbfCreatorABS):
 
 class PbsMainCreator(DbfCreatorABS):
     file_name = 'pbs_main.dbf'
+    index_fields = ('ID', 'FKRID', 'ENT_LS')
+    classifier_fields = ('FKRID', 'KOSGU', 'KVD')
     dbf_schema_and_getter_map = {
         ("C", 'ID', 15): FireBirdGetterMethods.to_string,
         ("C", 'ID_BUDGETD', 15): FireBirdGetterMethods.to_string,
@@ -298,6 +710,9 @@ class PbsMainCreator(DbfCreatorABS):
         dbf_record['FKRID'] = fkrid
         self.fkr_list.add((fkrid, grbs, divsn, targt, tarst))
 
+    def columnar_handler(self, columns, batch):
+        columns['FKRID'] = self.fkr_columns_handler(batch)
+
 
 class PbsFkrCreator(PlpFkrCreator):
     file_name = 'pbs_fkr.dbf'
@@ -305,6 +720,8 @@ class PbsFkrCreator(PlpFkrCreator):
 
 class ArgMainCreator(DbfCreatorABS):
     file_name = 'arg_main.dbf'
+    index_fields = ('ID', 'FKR')
+    classifier_fields = ('AGRTYPE', 'FKR', 'KOSGU', 'REFBU', 'DOCINDEX')
     dbf_schema_and_getter_map = {
         ("C", 'ID', 15): FireBirdGetterMethods.to_string,
         ("C", 'PARID', 15): FireBirdGetterMethods.to_string,
@@ -346,6 +763,7 @@ class ArgMainCreator(DbfCreatorABS):
 
     def __init__(self):
         self.organizations_ids = set()
+        self.organizations = {}
         self.fkr_list = set()
 
     def additional_handler(self, dbf_record, firebird_record):
@@ -353,10 +771,19 @@ class ArgMainCreator(DbfCreatorABS):
         dbf_record['FKR'] = fkrid
         self.fkr_list.add((fkrid, grbs, divsn, targt, tarst))
         self.organizations_ids.add(firebird_record['EXECUTER_REF'])
+        self.organization_handler(firebird_record['EXECUTER_REF'], firebird_record)
+
+    def columnar_handler(self, columns, batch):
+        columns['FKR'] = self.fkr_columns_handler(batch)
+        self.organizations_ids.update(batch.column('EXECUTER_REF'))
+        self.organization_columns_handler('EXECUTER_REF', batch)
 
 
 class ArgEstCreator(DbfCreatorABS):
     file_name = 'arg_est.dbf'
+    sort_fields = ('RECORDIDX', 'ID')
+    index_fields = ('ID', 'RECORDIDX')
+    classifier_fields = ('MSM_ID', 'MSM_NAME', 'MSM_SHORTN')
     dbf_schema_and_getter_map = {
         ("C", 'ID', 20): (FireBirdGetterMethods.to_string, 'EST_ID'),
         ("C", 'RECORDIDX', 20): (FireBirdGetterMethods.to_string, 'ARG_ID'),
@@ -379,8 +806,48 @@ class ArgFkrCreator(PlpFkrCreator):
     file_name = 'arg_fkr.dbf'
 
 
+class ArgTotalCreator(DbfCreatorABS):
+    """Итоги графиков платежей по договору, ФКР и КОСГУ (ARG_TOTAL_SQL)."""
+
+    file_name = 'arg_total.dbf'
+    sort_fields = ('ID', 'FKR', 'KOSGU')
+    index_fields = ('ID', 'FKR')
+    classifier_fields = ('FKR', 'KOSGU')
+    dbf_schema_and_getter_map = {
+        ("C", 'ID', 15): FireBirdGetterMethods.to_string,
+        ("C", 'FKR', 30): None,
+        ("C", 'KOSGU', 8): FireBirdGetterMethods.to_string,
+        ("N", 'LINES', 10): FireBirdGetterMethods.number,
+        ("N", 'MONTH01', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH02', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH03', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH04', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH05', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH06', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH07', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH08', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH09', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH10', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH11', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'MONTH12', 15): FireBirdGetterMethods.number_prescision2,
+        ("N", 'SUMMA', 15): FireBirdGetterMethods.number_prescision2,
+    }
+
+    def __init__(self):
+        self.fkr_list = set()
+
+    def additional_handler(self, dbf_record, firebird_record):
+        fkrid, grbs, divsn, targt, tarst = self.fkr_handler(dbf_record, firebird_record)
+        dbf_record['FKR'] = fkrid
+        self.fkr_list.add((fkrid, grbs, divsn, targt, tarst))
+
+    def columnar_handler(self, columns, batch):
+        columns['FKR'] = self.fkr_columns_handler(batch)
+
+
 class BndMainCreator(DbfCreatorABS):
     file_name = 'bnd_main.dbf'
+    classifier_fields = ('CLSTYPE', 'KD', 'IFS', 'KVD')
     dbf_schema_and_getter_map = {
         ("C", 'ID', 15): FireBirdGetterMethods.to_string,
         ("C", 'ENT_INN', 12): FireBirdGetterMethods.to_string,
@@ -406,6 +873,7 @@ class BndMainCreator(DbfCreatorABS):
     
     def __init__(self):
         self.organizations_ids = set()
+        self.organizations = {}
         self.fkr_list = set()
     
     def additional_handler(self, dbf_record, firebird_record):
@@ -413,6 +881,12 @@ class BndMainCreator(DbfCreatorABS):
         dbf_record['FKRID'] = fkrid
         self.fkr_list.add((fkrid, grbs, divsn, targt, tarst))
         self.organizations_ids.add(firebird_record['DEST_ORG'])
+        self.organization_handler(firebird_record['DEST_ORG'], firebird_record)
+
+    def columnar_handler(self, columns, batch):
+        columns['FKRID'] = self.fkr_columns_handler(batch)
+        self.organizations_ids.update(batch.column('DEST_ORG'))
+        self.organization_columns_handler('DEST_ORG', batch)
 
 
 class BndOrgCreator(PlpOrgCreator):
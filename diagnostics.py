@@ -0,0 +1,144 @@
+"""Диагностика запросов выгрузки: планы, время выполнения и выборки, статистика ввода-вывода.
+
+Для каждого подготовленного запроса записывается план FireBird, время execute,
+время выборки, количество строк и приращение статистики MON$ по соединению.
+Отдельно отмечаются натуральные (полные) просмотры крупных таблиц и колонки
+дат/ссылок, у которых нет индекса.
+"""
+import json
+import re
+from time import perf_counter
+
+from krista_sql import INDEXED_COLUMNS_SQL
+from settings import DIAGNOSTIC_INDEX_COLUMNS, NATURAL_SCAN_WATCH_TABLES
+
+IO_STATS_KEYS = (
+    'page_reads',
+    'page_writes',
+    'page_fetches',
+    'page_marks',
+    'record_seq_reads',
+    'record_idx_reads',
+)
+
+NATURAL_SCAN_RE = re.compile(r'(\w+)\s+NATURAL', re.IGNORECASE)
+
+
+def natural_scans(plan):
+    """Таблицы из NATURAL_SCAN_WATCH_TABLES, которые план читает полным просмотром.
+
+    Args:
+        plan (str): План запроса FireBird.
+
+    Returns:
+        list[str]: Имена таблиц в порядке появления в плане.
+    """
+    result = []
+    for table in NATURAL_SCAN_RE.findall(plan or ''):
+        table = table.upper()
+        if table in NATURAL_SCAN_WATCH_TABLES and table not in result:
+            result.append(table)
+
+    return result
+
+
+class QueryTrace:
+    """Замер одного выполнения запроса."""
+
+    def __init__(self, diagnostics, connection, sql, params):
+        self.diagnostics = diagnostics
+        self.connection = connection
+        self.sql = sql
+        self.params = params
+        self.rows = 0
+        self.execute_time = 0
+        self.io_before = connection.io_stats()
+        self.started = perf_counter()
+
+    def executed(self):
+        self.execute_time = perf_counter() - self.started
+
+    def add_rows(self, count):
+        self.rows += count
+
+    def finish(self):
+        fetch_time = perf_counter() - self.started - self.execute_time
+        io_after = self.connection.io_stats()
+        io = None
+        if self.io_before and io_after:
+            io = {key: io_after[key] - self.io_before[key] for key in IO_STATS_KEYS}
+
+        plan = self.connection.plans.get(self.sql)
+        self.diagnostics.queries.append({
+            'sql': self.sql,
+            'params': [str(param) for param in self.params],
+            'plan': plan,
+            'execute_time': round(self.execute_time, 3),
+            'fetch_time': round(fetch_time, 3),
+            'rows': self.rows,
+            'io': io,
+            'natural_scans': natural_scans(plan),
+        })
+
+
+class NullTrace:
+    """Замер-заглушка, когда диагностика выключена."""
+
+    def executed(self):
+        pass
+
+    def add_rows(self, count):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+class QueryDiagnostics:
+    """Собранная диагностика запросов одного соединения.
+
+    Attributes:
+        queries: замеры выполненных запросов
+        missing_indexes: колонки без индекса по таблицам
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.missing_indexes = {}
+
+    def trace(self, connection, sql, params):
+        return QueryTrace(self, connection, sql, params)
+
+    def check_indexes(self, connection):
+        """Заполняет missing_indexes по метаданным базы.
+
+        Колонка считается индексированной, если она первая в каком-либо индексе таблицы.
+
+        Args:
+            connection (DatabaseConnection): Соединение.
+        """
+        self.missing_indexes = {}
+        for table, columns in DIAGNOSTIC_INDEX_COLUMNS.items():
+            indexed = {row[0].strip() for row in connection.fetch_metadata(INDEXED_COLUMNS_SQL, (table,))}
+            missing = [column for column in columns if column not in indexed]
+            if missing:
+                self.missing_indexes[table] = missing
+
+    def report(self):
+        """Отчёт в виде словаря.
+
+        Returns:
+            dict: Запросы, натуральные просмотры и колонки без индекса.
+        """
+        return {
+            'queries': self.queries,
+            'natural_scans': sorted({table for query in self.queries for table in query['natural_scans']}),
+            'missing_indexes': self.missing_indexes,
+        }
+
+    def write(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.report(), report_file, ensure_ascii=False, indent=2)
@@ -0,0 +1,254 @@
+"""Предварительная оценка выгрузки: строки, объём и длительность до запуска.
+
+Основные запросы выгрузки (main_requests) в каждой её базе выполняются как count(*)
+с теми же условиями профиля, периодом и фильтром по счёту (krista_sql.count_query),
+строки при этом не передаются. Объём основного dbf-файла считается по длине записи
+схемы его создателя, память выборки - по числу полей записи. Длительность - по
+скорости прошлых успешных запусков той же выгрузки из журнала метрик METRICS_LOG_FILE:
+медиана выбранных строк в секунду последних ESTIMATE_HISTORY_RUNS запусков, прежде
+всего по той же базе. В выбранные строки прошлых запусков входят и справочники,
+поэтому для выгрузок с большими справочниками длительность получается меньше реальной.
+
+По оценке выгрузка настраивается (apply_estimate): если выборка не помещается в
+бюджет памяти, основные запросы выбираются страницами ESTIMATE_PAGE_SIZE, бюджет
+памяти параллельно выгружаемых баз делится пропорционально их строкам.
+"""
+import json
+import os
+from statistics import median
+from time import perf_counter
+
+from cancellation import UnloadCancelled
+from info_strings import ESTIMATE_UNLOAD
+from settings import ESTIMATE_HISTORY_RUNS, ESTIMATE_PAGE_SIZE, METRICS_LOG_FILE
+
+# память строки выборки в python: словарь или кортеж и значения полей, байт
+ROW_MEMORY = 240
+FIELD_MEMORY = 56
+
+BYTE_UNITS = ('байт', 'КБ', 'МБ', 'ГБ', 'ТБ')
+
+
+def record_length(creator_class):
+    """Длина dbf-записи создателя вместе с флагом удаления."""
+    return 1 + sum(key[2] for key in creator_class.dbf_schema_and_getter_map)
+
+
+def format_bytes(size):
+    size = float(size)
+    for unit in BYTE_UNITS[:-1]:
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = BYTE_UNITS[-1]
+
+    return f'{size:.0f} {unit}' if unit == BYTE_UNITS[0] else f'{size:.1f} {unit}'
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f'{hours} ч {minutes} мин'
+    if minutes:
+        return f'{minutes} мин {seconds} с'
+    return f'{seconds} с'
+
+
+class UnloadEstimate:
+    """Оценка выгрузки.
+
+    Attributes:
+        unload: префикс выгрузки (plp, pbs, arg)
+        database_rows: база -> строки основных запросов
+        main_creator: класс создателя основного dbf-файла
+        count_seconds: время подсчёта строк
+        throughput: строк в секунду по прошлым запускам или None, если их нет
+        history_runs: сколько прошлых запусков учтено в скорости
+        page_size: размер страницы основных запросов, выбранный по оценке, или None
+        database_budgets: бюджет памяти каждой базы, выбранный по оценке
+    """
+
+    def __init__(self, unload, database_rows, main_creator, count_seconds, throughput=None, history_runs=0):
+        self.unload = unload
+        self.database_rows = database_rows
+        self.main_creator = main_creator
+        self.count_seconds = count_seconds
+        self.throughput = throughput
+        self.history_runs = history_runs
+        self.page_size = None
+        self.database_budgets = {}
+
+    @property
+    def rows(self):
+        return sum(self.database_rows.values())
+
+    @property
+    def file_bytes(self):
+        """Размер основного dbf-файла: заголовок, описания полей и записи."""
+        fields = len(self.main_creator.dbf_schema_and_getter_map)
+        return 32 + 32 * fields + 1 + self.rows * record_length(self.main_creator)
+
+    @property
+    def memory_bytes(self):
+        """Память, которую заняла бы вся выборка основных запросов."""
+        return self.rows * (ROW_MEMORY + FIELD_MEMORY * len(self.main_creator.dbf_schema_and_getter_map))
+
+    @property
+    def duration(self):
+        """Ожидаемая длительность, секунд, или None без прошлых запусков."""
+        if not self.throughput:
+            return None
+        return self.rows / self.throughput
+
+    def describe(self):
+        """Оценка текстом для окна и журнала планировщика."""
+        lines = [f'Строк основных запросов: {self.rows:,}'.replace(',', ' ')]
+        if len(self.database_rows) > 1:
+            lines.extend(f'    {path}: {rows:,}'.replace(',', ' ') for path, rows in self.database_rows.items())
+        lines.append(f'Размер {self.main_creator.file_name}: {format_bytes(self.file_bytes)}')
+        lines.append(f'Память выборки: {format_bytes(self.memory_bytes)}')
+        if self.page_size:
+            lines.append(f'Основные запросы выбираются страницами по {self.page_size} строк')
+        if self.duration is None:
+            lines.append('Длительность: нет прошлых запусков для оценки')
+        else:
+            lines.append(f'Длительность: {format_duration(self.duration)} (по прошлым запускам: {self.history_runs})')
+        lines.append(f'Подсчёт строк: {format_duration(self.count_seconds)}')
+        return '\n'.join(lines)
+
+
+def read_history(file_path):
+    """Успешные запуски из журнала метрик, пропуская повреждённые строки.
+
+    Returns:
+        list[dict]: Записи журнала в порядке запусков.
+    """
+    records = []
+    if not file_path or not os.path.isfile(file_path):
+        return records
+
+    with open(file_path, encoding='utf-8') as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('status') == 'ok':
+                records.append(record)
+
+    return records
+
+
+def historical_throughput(unload, database_path, file_path=METRICS_LOG_FILE, runs=ESTIMATE_HISTORY_RUNS):
+    """Скорость выгрузки по прошлым запускам: медиана выбранных строк в секунду.
+
+    Args:
+        unload (str): Префикс выгрузки.
+        database_path (str): База (или базы через разделитель), запуски по ней учитываются в первую очередь.
+        file_path (str): Журнал метрик.
+        runs (int): Сколько последних запусков учитывать.
+
+    Returns:
+        tuple: Строк в секунду или None и количество учтённых запусков.
+    """
+    records = [
+        record for record in read_history(file_path)
+        if record.get('unload') == unload and record.get('duration') and record.get('fetch', {}).get('rows')
+    ]
+    same_database = [record for record in records if record.get('database_path') == database_path]
+    records = (same_database or records)[-runs:]
+    if not records:
+        return None, 0
+
+    return median(record['fetch']['rows'] / record['duration'] for record in records), len(records)
+
+
+def split_memory_budget(budget, database_rows):
+    """Делит бюджет памяти между базами пропорционально их строкам.
+
+    Args:
+        budget (int): Бюджет памяти, 0 - без ограничения.
+        database_rows (dict): База -> строки.
+
+    Returns:
+        dict: База -> бюджет; пусто, если делить нечего.
+    """
+    total = sum(database_rows.values())
+    if not budget or len(database_rows) < 2 or not total:
+        return {}
+
+    return {path: max(1, budget * rows // total) for path, rows in database_rows.items()}
+
+
+def estimate_unload(unload):
+    """Оценка выгрузки: count основных запросов в каждой базе и скорость прошлых запусков.
+
+    Args:
+        unload (UnloadAbs): Выгрузка.
+
+    Returns:
+        UnloadEstimate: Оценка.
+    """
+    started = perf_counter()
+    database_rows = {path: unload.count_rows(path) for path in unload.database_paths()}
+    throughput, history_runs = historical_throughput(unload.prefix, unload.database_path)
+    return UnloadEstimate(
+        unload.prefix,
+        database_rows,
+        unload.creator_classes[0],
+        perf_counter() - started,
+        throughput,
+        history_runs,
+    )
+
+
+def apply_estimate(unload, estimate):
+    """Настраивает выгрузку по оценке: постраничная выборка и бюджеты памяти баз.
+
+    Страницы выбираются, только если размер страницы не задан KEYSET_PAGE_SIZE и у основных
+    запросов есть ключ страниц.
+
+    Args:
+        unload (UnloadAbs): Выгрузка.
+        estimate (UnloadEstimate): Оценка этой выгрузки.
+    """
+    if not unload.page_size and unload.memory_budget and estimate.memory_bytes > unload.memory_budget:
+        if any(request.page_key for request in unload.main_requests()):
+            unload.page_size = estimate.page_size = ESTIMATE_PAGE_SIZE
+
+    estimate.database_budgets = split_memory_budget(unload.memory_budget, estimate.database_rows)
+    unload.database_budgets = estimate.database_budgets
+
+
+class UnloadPreflight:
+    """Оценка перед выгрузкой (в потоке окна через WorkerWrapper или в задании планировщика):
+    настраивает выгрузку и возвращает оценку текстом.
+
+    Attributes:
+        unload: выгрузка
+        estimate: оценка после run
+    """
+
+    def __init__(self, unload):
+        self.unload = unload
+        self.estimate = None
+        self.progress_emiter = None
+        self.progress_max_emiter = None
+
+    def run(self):
+        if self.progress_emiter:
+            self.progress_emiter.emit((ESTIMATE_UNLOAD, 0))
+
+        try:
+            self.estimate = estimate_unload(self.unload)
+        except Exception as error:
+            # подсчёт, прерванный на сервере, завершается ошибкой базы данных
+            if not self.unload.cancel_token.cancelled or isinstance(error, UnloadCancelled):
+                raise
+            raise UnloadCancelled() from error
+
+        apply_estimate(self.unload, self.estimate)
+        return self.estimate.describe()
@@ -0,0 +1,117 @@
+"""Разностные выгрузки: изменения относительно прошлой выгрузки того же типа.
+
+Для каждого документа (значение ключевого поля dbf-файла) хранится отпечаток -
+хэш закодированных записей документа. Отпечатки считаются по готовому файлу, по
+байтам записей, без разбора значений. Сравнение с индексом прошлой выгрузки
+даёт три файла: новые документы (_ins), изменённые (_upd) и удалённые (_del,
+только ключи).
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from columnar import DbfBlockWriter, RecordLayout, read_dbf_blocks
+
+FINGERPRINT_SIZE = 8
+
+DIFF_SUFFIXES = ('_ins', '_upd', '_del')
+
+
+def record_keys(block, record_count, layout, key_field):
+    """Записи блока вместе с их ключами.
+
+    Yields:
+        tuple: Ключ (str) и запись (bytes).
+    """
+    length = layout.record_length
+    for position in range(0, record_count * length, length):
+        record = block[position:position + length]
+        key = record[key_field.start:key_field.start + key_field.length].strip()
+        yield key.decode(layout.encoding), record
+
+
+def file_fingerprints(file_path, layout, key_field):
+    """Отпечатки документов dbf-файла.
+
+    Отпечаток документа не зависит от порядка его записей в файле.
+
+    Args:
+        file_path (str): Путь к файлу.
+        layout (RecordLayout): Раскладка записи.
+        key_field (DbfField): Поле ключа документа.
+
+    Returns:
+        dict: Ключ -> hex отпечатка.
+    """
+    digests = {}
+    for block, record_count in read_dbf_blocks(file_path, layout):
+        for key, record in record_keys(block, record_count, layout, key_field):
+            digests.setdefault(key, []).append(hashlib.blake2b(record, digest_size=FINGERPRINT_SIZE).digest())
+
+    return {
+        key: hashlib.blake2b(b''.join(sorted(parts)), digest_size=FINGERPRINT_SIZE).hexdigest()
+        for key, parts in digests.items()
+    }
+
+
+def diff_file_names(file_name):
+    base, extension = os.path.splitext(file_name)
+    return tuple(f'{base}{suffix}{extension}' for suffix in DIFF_SUFFIXES)
+
+
+def write_diff_files(file_path, layout, key_name, previous):
+    """Создаёт файлы изменений рядом с файлом выгрузки.
+
+    Args:
+        file_path (str): Путь к полному файлу выгрузки.
+        layout (RecordLayout): Раскладка записи.
+        key_name (str): Поле ключа документа.
+        previous (dict): Отпечатки прошлой выгрузки, пустой словарь - всё считается новым.
+
+    Returns:
+        tuple: Имена созданных файлов (новые, изменённые, удалённые) и текущие отпечатки.
+    """
+    key_field = next(field for field in layout.fields if field.name == key_name)
+    current = file_fingerprints(file_path, layout, key_field)
+    inserted = {key for key in current if key not in previous}
+    updated = {key for key, fingerprint in current.items() if key in previous and previous[key] != fingerprint}
+    deleted = sorted(key for key in previous if key not in current)
+
+    directory = os.path.dirname(file_path)
+    names = diff_file_names(os.path.basename(file_path))
+    inserted_path, updated_path, deleted_path = (os.path.join(directory, name) for name in names)
+    with DbfBlockWriter(inserted_path, layout) as inserted_writer, DbfBlockWriter(updated_path, layout) as updated_writer:
+        for block, record_count in read_dbf_blocks(file_path, layout):
+            for key, record in record_keys(block, record_count, layout, key_field):
+                if key in inserted:
+                    inserted_writer.write_block(record, 1)
+                elif key in updated:
+                    updated_writer.write_block(record, 1)
+
+    deleted_layout = RecordLayout((('C', key_field.name, key_field.length),), layout.encoding)
+    with DbfBlockWriter(deleted_path, deleted_layout) as deleted_writer:
+        for key in deleted:
+            deleted_writer.write_block(deleted_layout.encode_record({key_field.name: key}), 1)
+
+    return names, current
+
+
+class FingerprintIndex:
+    """Индекс отпечатков прошлой выгрузки: имя файла -> {ключ: отпечаток}.
+
+    Хранится сжатым json; новый индекс записывается только после успешной упаковки архива.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.files = {}
+        if os.path.isfile(file_path):
+            with gzip.open(file_path, 'rt', encoding='utf-8') as index_file:
+                self.files = json.load(index_file)
+
+    def save(self):
+        temp_path = self.file_path + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as index_file:
+            json.dump(self.files, index_file, separators=(',', ':'))
+        os.replace(temp_path, self.file_path)
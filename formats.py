@@ -0,0 +1,341 @@
+"""Дополнительные форматы выгрузки рядом с dbf-файлами: CSV, Arrow IPC (Feather v2) и Parquet.
+
+Поля и их типы берутся из dbf_schema_and_getter_map создателя, значения - из тех же
+преобразованных колонок, что кодируются в dbf-блок, но без обрезки по ширине поля и
+перекодировки в cp866: строки пишутся в utf-8, суммы геттеров number_prescision2/4 -
+десятичными с их точностью, остальные числа - float64. Пустые значения заполняются
+так же, как в dbf (пустая строка, 0).
+
+Поля classifier_fields создателя (классификаторы с небольшим числом значений) в
+Parquet кодируются словарём. В Arrow IPC они остаются строками: файловый формат IPC
+не допускает разных словарей в пакетах одного файла.
+"""
+import csv
+import os
+from collections import namedtuple
+from decimal import Decimal
+from itertools import islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+FORMAT_EXTENSIONS = {
+    'csv': '.csv',
+    'arrow': '.arrow',
+    'parquet': '.parquet',
+}
+
+# точность десятичных полей по геттерам FireBirdGetterMethods
+DECIMAL_GETTERS = {
+    'FireBirdGetterMethods.number_prescision2': 2,
+    'FireBirdGetterMethods.number_prescision4': 4,
+}
+
+# строк в порции при чтении CSV
+CSV_READ_ROWS = 5000
+
+# строк в группе Parquet: мелкие пакеты выборки копятся до этого размера
+PARQUET_ROW_GROUP_SIZE = 100000
+
+# kind: 'string', 'decimal' или 'float'; scale - знаков после запятой десятичного поля
+TableField = namedtuple('TableField', ('name', 'kind', 'length', 'scale'))
+
+
+def check_formats(formats):
+    """Проверяет, что форматы известны и для них установлены зависимости.
+
+    Args:
+        formats (tuple): Имена форматов из FORMAT_EXTENSIONS.
+
+    Raises:
+        ValueError: Неизвестный формат.
+        ImportError: Для arrow или parquet не установлен pyarrow.
+    """
+    for output_format in formats:
+        if output_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f'Неизвестный формат выгрузки: {output_format}')
+        if output_format != 'csv' and pa is None:
+            raise ImportError(f'Для формата {output_format} нужен пакет pyarrow')
+
+
+def format_file_name(file_name, output_format):
+    """Имя файла формата рядом с dbf-файлом: plp_main.dbf -> plp_main.parquet."""
+    return os.path.splitext(file_name)[0] + FORMAT_EXTENSIONS[output_format]
+
+
+def table_fields(creator):
+    """Поля таблицы по схеме создателя.
+
+    Args:
+        creator (DbfCreatorABS): Создатель или его класс.
+
+    Returns:
+        list[TableField]: Поля в порядке dbf-записи.
+    """
+    fields = []
+    for key, getter in creator.dbf_schema_and_getter_map.items():
+        type_code, name, length = key[:3]
+        if isinstance(getter, (tuple, list)):
+            getter = getter[0]
+
+        scale = DECIMAL_GETTERS.get(getattr(getter, '__qualname__', None))
+        if type_code.upper() != 'N':
+            fields.append(TableField(name.upper(), 'string', length, None))
+        elif scale is not None:
+            fields.append(TableField(name.upper(), 'decimal', length, scale))
+        else:
+            fields.append(TableField(name.upper(), 'float', length, None))
+
+    return fields
+
+
+def column_values(field, values, count):
+    """Значения колонки в виде списка python для записи в таблицу.
+
+    Args:
+        field (TableField): Поле.
+        values: Колонка (numpy-массив, кортеж или список) или None, если колонки нет.
+        count (int): Количество записей.
+
+    Returns:
+        list: Строки, Decimal или float.
+    """
+    if values is None:
+        values = [None] * count
+    elif hasattr(values, 'tolist'):
+        values = values.tolist()
+
+    if field.kind == 'string':
+        return [value.decode() if isinstance(value, bytes) else str(value) if value is not None else '' for value in values]
+    if field.kind == 'decimal':
+        quantum = Decimal(1).scaleb(-field.scale)
+        return [Decimal(value or 0).quantize(quantum) for value in values]
+
+    return [float(value or 0) for value in values]
+
+
+class CsvTableWriter:
+    """CSV в utf-8 с заголовком из имён полей."""
+
+    def __init__(self, file_path, fields, classifier_fields=(), append=False):
+        self.fields = fields
+        exists = append and os.path.isfile(file_path)
+        self.file = open(file_path, 'a' if exists else 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        if not exists:
+            self.writer.writerow([field.name for field in fields])
+
+    def write_columns(self, columns, count):
+        """Дописывает порцию записей.
+
+        Args:
+            columns (dict): Колонки по именам полей.
+            count (int): Количество записей.
+        """
+        self.writer.writerows(zip(*(column_values(field, columns.get(field.name), count) for field in self.fields)))
+
+    @staticmethod
+    def read_columns(file_path):
+        """Записи файла порциями.
+
+        Yields:
+            tuple: Колонки (строки) по именам полей и количество записей.
+        """
+        with open(file_path, encoding='utf-8', newline='') as source:
+            reader = csv.reader(source)
+            names = next(reader, None)
+            while names:
+                rows = list(islice(reader, CSV_READ_ROWS))
+                if not rows:
+                    break
+                yield dict(zip(names, (list(values) for values in zip(*rows)))), len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowTableWriter:
+    """Arrow IPC в файловом формате (Feather v2).
+
+    Файл пишется во временный и подменяется при закрытии; при дозаписи в начало
+    временного файла копируются пакеты существующего.
+    """
+
+    def __init__(self, file_path, fields, classifier_fields=(), append=False):
+        self.file_path = file_path
+        self.fields = fields
+        self.classifier_fields = set(classifier_fields)
+        self.schema = pa.schema([pa.field(field.name, self.field_type(field)) for field in fields])
+        self.temp_path = file_path + '.tmp'
+        self.writer = self.open_writer(self.temp_path)
+        if append and os.path.isfile(file_path):
+            for batch in self.read_batches(file_path):
+                self.write_batch(batch)
+
+    def field_type(self, field):
+        if field.kind == 'decimal':
+            return pa.decimal128(field.length, field.scale)
+        if field.kind == 'float':
+            return pa.float64()
+        return pa.string()
+
+    def open_writer(self, file_path):
+        return pa.ipc.new_file(file_path, self.schema)
+
+    @staticmethod
+    def read_batches(file_path):
+        with pa.OSFile(file_path) as source:
+            reader = pa.ipc.open_file(source)
+            for number in range(reader.num_record_batches):
+                yield reader.get_batch(number)
+
+    @classmethod
+    def read_columns(cls, file_path):
+        """Записи файла порциями.
+
+        Yields:
+            tuple: Колонки по именам полей и количество записей.
+        """
+        for batch in cls.read_batches(file_path):
+            yield batch.to_pydict(), batch.num_rows
+
+    def write_columns(self, columns, count):
+        """Дописывает порцию записей.
+
+        Args:
+            columns (dict): Колонки по именам полей.
+            count (int): Количество записей.
+        """
+        arrays = [
+            pa.array(column_values(field, columns.get(field.name), count), type=self.schema.field(field.name).type)
+            for field in self.fields
+        ]
+        self.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.temp_path, self.file_path)
+
+
+class ParquetTableWriter(ArrowTableWriter):
+    """Parquet: поля classifier_fields хранятся словарём, пакеты копятся в группы по PARQUET_ROW_GROUP_SIZE строк."""
+
+    def __init__(self, file_path, fields, classifier_fields=(), append=False):
+        self.pending = []
+        self.pending_rows = 0
+        super().__init__(file_path, fields, classifier_fields, append)
+
+    def field_type(self, field):
+        if field.name in self.classifier_fields:
+            return pa.dictionary(pa.int32(), pa.string())
+        return super().field_type(field)
+
+    def open_writer(self, file_path):
+        return pq.ParquetWriter(file_path, self.schema, use_dictionary=sorted(self.classifier_fields) or False)
+
+    @staticmethod
+    def read_batches(file_path):
+        parquet_file = pq.ParquetFile(file_path)
+        try:
+            yield from parquet_file.iter_batches()
+        finally:
+            parquet_file.close()
+
+    def write_batch(self, batch):
+        self.pending.append(batch)
+        self.pending_rows += batch.num_rows
+        if self.pending_rows >= PARQUET_ROW_GROUP_SIZE:
+            self.flush_pending()
+
+    def flush_pending(self):
+        if self.pending_rows:
+            table = pa.Table.from_batches(self.pending, schema=self.schema)
+            self.writer.write_table(table, row_group_size=self.pending_rows)
+        self.pending = []
+        self.pending_rows = 0
+
+    def close(self):
+        self.flush_pending()
+        super().close()
+
+
+TABLE_WRITERS = {
+    'csv': CsvTableWriter,
+    'arrow': ArrowTableWriter,
+    'parquet': ParquetTableWriter,
+}
+
+
+def open_table_writer(output_format, creator, unload_dir, append=False):
+    """Открывает на запись файл формата для dbf-файла создателя.
+
+    Args:
+        output_format (str): Имя формата из FORMAT_EXTENSIONS.
+        creator (DbfCreatorABS): Создатель файла.
+        unload_dir (str): Директория выгрузки.
+        append (bool): Дописывать существующий файл.
+
+    Returns:
+        CsvTableWriter or ArrowTableWriter or ParquetTableWriter: Открытый файл.
+    """
+    file_path = os.path.join(unload_dir, format_file_name(creator.file_name, output_format))
+    return TABLE_WRITERS[output_format](file_path, table_fields(creator), creator.classifier_fields, append)
+
+
+def unique_columns(columns, key_name, seen_keys):
+    """Записи порции, ключ которых ещё не встречался; ключи добавляются в seen_keys.
+
+    Returns:
+        tuple: Колонки без повторов и количество записей.
+    """
+    positions = []
+    for position, key in enumerate(columns[key_name]):
+        if key not in seen_keys:
+            seen_keys.add(key)
+            positions.append(position)
+
+    return {name: [values[position] for position in positions] for name, values in columns.items()}, len(positions)
+
+
+def merge_table_files(creator_class, output_format, part_dirs, unload_dir, cancel_token):
+    """Объединяет одноимённые файлы формата из директорий баз так же, как merge_files объединяет dbf.
+
+    Записи основных файлов идут подряд в порядке баз, для справочников (unique_field)
+    при повторе ключа остаётся запись последней базы из списка.
+
+    Args:
+        creator_class (type): Класс создателя.
+        output_format (str): Имя формата.
+        part_dirs (list[str]): Директории выгрузок отдельных баз.
+        unload_dir (str): Директория выгрузки.
+        cancel_token (CancellationToken): Токен отмены.
+    """
+    file_name = format_file_name(creator_class.file_name, output_format)
+    paths = [
+        os.path.join(part_dir, file_name)
+        for part_dir in part_dirs
+        if os.path.isfile(os.path.join(part_dir, file_name))
+    ]
+    if not paths:
+        return
+
+    seen_keys = set()
+    if creator_class.unique_field:
+        paths.reverse()
+    read_columns = TABLE_WRITERS[output_format].read_columns
+    writer = open_table_writer(output_format, creator_class, unload_dir)
+    try:
+        for path in paths:
+            for columns, count in cancel_token.guard(read_columns(path)):
+                if creator_class.unique_field:
+                    columns, count = unique_columns(columns, creator_class.unique_field, seen_keys)
+                writer.write_columns(columns, count)
+    finally:
+        writer.close()
@@ -4,4 +4,7 @@ CREATE_FKR = 'Создание fkr.dbf'
 CREATE_ORG = 'Создание org.dbf'
 CREATE_EST = 'Создание est.dbf'
 CREATE_ZIP = 'Упаковка в архив'
-
+MERGE_DBF = 'Объединение {}'
+CANCEL_UNLOAD = 'Отмена выгрузки...'
+UNLOAD_CANCELLED = 'Выгрузка отменена'
+ESTIMATE_UNLOAD = 'Оценка объёма выгрузки'
@@ -1,6 +1,4 @@
 # исходящие платежи
-# TODO: запросить у пользователя структуру базы и сделать нормальную фильтрацию по коду счета
-PLP_ACCOUNT_FILTER = ' and facialfincaption.destfacialacc_cls = {}'
 PLP_IN_SQL = """with acc_service_ref_info AS (
     select ORG_ACCOUNTS.ID, ORG_ACCOUNTS.ACC, BANKS.MFO, BANKS.COR from ORG_ACCOUNTS 
         join BANKS on (BANKS.ID = ORG_ACCOUNTS.BANK_REF)
@@ -80,7 +78,7 @@ from FACIALFINCAPTION
     left join aggreements_step_info on (FACIALFINDETAIL.ID = aggreements_step_info.ID)
 where 
     facialfincaption.reject_cls is null and 
-    facialfincaption.acceptdate>='{}' and facialfincaption.acceptdate<='{}'"""
+    facialfincaption.acceptdate>=? and facialfincaption.acceptdate<=?"""
 
 PLP_OUT_SQL = """with acc_service_ref_info AS (
     select ORG_ACCOUNTS.ID, ORG_ACCOUNTS.ACC, BANKS.MFO, BANKS.COR from ORG_ACCOUNTS 
@@ -161,12 +159,9 @@ from FACIALFINCAPTION
     left join aggreements_step_info on (FACIALFINDETAIL.ID = aggreements_step_info.ID)
 where 
     facialfincaption.reject_cls is null and 
-    facialfincaption.acceptdate>='{}' and facialfincaption.acceptdate<='{}'"""
+    facialfincaption.acceptdate>=? and facialfincaption.acceptdate<=?"""
 
 
-# TODO: запросить у пользователя структуру базы и сделать нормальную фильтрацию по коду счета
-PBS_ACCOUNT_FILTER = ' and budgetdata.facialacc_cls = {}'
-
 # запрос по сметным назначениям
 PBS_SQL = """select 
     budnotify.id,
@@ -202,11 +197,10 @@ from budgetdata
 where 
     budnotify.rejectnote is null 
     and budnotify.rejectcls is null  
-    and budnotify.dat >= '{}' 
-    and budnotify.dat <= '{}'
+    and budnotify.dat >= ? 
+    and budnotify.dat <= ?
 """
 
-ARG_ACCOUNT_FILTER = ' and a.facialacc_cls={}'
 ARG_BANK_SQL = """select 
     agreements.id, 
     agreements.agreementtype, 
@@ -264,7 +258,7 @@ from agreements
 where 
     agreements.rejectcause is null and 
     agreements.rejectcls is null and 
-    agreements.acceptdate>='{}' and agreements.acceptdate<='{}'"""
+    agreements.acceptdate>=? and agreements.acceptdate<=?"""
 
 ARG_ORG_SQL = """select 
     agreements.id, 
@@ -322,9 +316,61 @@ where
     agreements.rejectcause is null and 
     agreements.rejectcls is null and
     agreements.executeraccref is null and 
-    agreements.acceptdate>='{}' and agreements.acceptdate<='{}'"""
+    agreements.acceptdate>=? and agreements.acceptdate<=?"""
+
+# итоги графиков платежей по договору, ФКР и КОСГУ: строки графика складываются на сервере.
+# Договоры те же, что в ARG_BANK_SQL и ARG_ORG_SQL вместе; группировка ARG_TOTAL_GROUP_SQL
+# добавляется после условий профиля и фильтра по счёту (facialacc_cls в ней для колонки FILTER_COLUMN)
+ARG_TOTAL_SQL = """select 
+    agreements.id, 
+    kvsr.code as grbs, 
+    paymentschedule.kfsr as divsn, 
+    kcsr.code as targt, 
+    kvr.code as tarst, 
+    kesr.code as kosgu, 
+    count(*) as lines, 
+    sum(paymentschedule.month01) as month01, 
+    sum(paymentschedule.month02) as month02, 
+    sum(paymentschedule.month03) as month03, 
+    sum(paymentschedule.month04) as month04, 
+    sum(paymentschedule.month05) as month05, 
+    sum(paymentschedule.month06) as month06, 
+    sum(paymentschedule.month07) as month07, 
+    sum(paymentschedule.month08) as month08, 
+    sum(paymentschedule.month09) as month09, 
+    sum(paymentschedule.month10) as month10, 
+    sum(paymentschedule.month11) as month11, 
+    sum(paymentschedule.month12) as month12, 
+    sum(paymentschedule.summa) as summa
+from agreements 
+    join paymentschedule on (paymentschedule.agreementref = agreements.id)
+    left join kvsr on (paymentschedule.kvsr = kvsr.id)
+    left join kcsr on (paymentschedule.kcsr = kcsr.id)
+    left join kvr on (paymentschedule.kvr = kvr.id)
+    join organizations on (agreements.client_ref = organizations.id)
+    join kesr on (paymentschedule.kesr = kesr.id)
+where 
+    agreements.rejectcause is null and 
+    agreements.rejectcls is null and 
+    (agreements.executeraccref is null or exists (
+        select org_accounts.id from org_accounts 
+            join banks on (org_accounts.bank_ref = banks.id) 
+        where org_accounts.id = agreements.executeraccref
+    )) and 
+    agreements.acceptdate>=? and agreements.acceptdate<=?"""
+ARG_TOTAL_GROUP_SQL = """
+group by 
+    agreements.id, 
+    agreements.facialacc_cls, 
+    kvsr.code, 
+    paymentschedule.kfsr, 
+    kcsr.code, 
+    kvr.code, 
+    kesr.code"""
 
-ARG_EST_SQL = """select agreements.id as arg_id, 
+# сметы по уже выгруженным договорам: пачка id подставляется как в ORG_INFO_SQL,
+# поэтому agreements и фильтры основного запроса повторно не применяются
+ARG_EST_SQL = """select estimate.recordindex as arg_id, 
 estimate.id as est_id, 
 estimate.amount, 
 estimate.summa, 
@@ -338,14 +384,11 @@ measurementcls.id as msm_id,
 measurementcls.name as msm_name, 
 measurementcls.shortname as msm_shortname 
 from estimate 
-    join agreements on agreements.id=estimate.recordindex 
     join tenderobjects on tenderobjects.id=estimate.productcls 
     join measurementcls on measurementcls.id=tenderobjects.measurementcls 
     left outer join okdp on okdp.id=tenderobjects.okdp 
 where 
-    agreements.rejectcause is null and 
-    agreements.rejectcls is null and 
-    agreements.acceptdate>='{}' and agreements.acceptdate<='{}'"""
+    estimate.recordindex in ({})"""
 
 BND_MAIN_SQL = """select 
     quotestitle.acceptdate, 
@@ -379,6 +422,117 @@ from quotestitle
     join organizations on (organizations.id = facialacc_cls.org_ref)
 where 
     quotestitle.rejectcls is null and 
-    quotestitle.acceptdate>='{}' and quotestitle.acceptdate<='{}'"""
+    quotestitle.acceptdate>=? and quotestitle.acceptdate<=?"""
+
+# список id подставляется пачками фиксированного размера, чтобы запрос готовился один раз
+ORG_INFO_SQL = """select id, inn, inn20 as kpp, name, shortname, okato from organizations where id in ({})"""
+
+# номер снимка читающей транзакции (Firebird 4+), нужен для открытия других соединений на том же снимке
+SNAPSHOT_NUMBER_SQL = """select rdb$get_context('SYSTEM', 'SNAPSHOT_NUMBER') from rdb$database"""
+
+# статистика ввода-вывода текущего соединения для диагностики запросов
+ATTACHMENT_IO_STATS_SQL = """select 
+    io.mon$page_reads, 
+    io.mon$page_writes, 
+    io.mon$page_fetches, 
+    io.mon$page_marks, 
+    rs.mon$record_seq_reads, 
+    rs.mon$record_idx_reads 
+from mon$attachments a
+    join mon$io_stats io on (io.mon$stat_id = a.mon$stat_id)
+    join mon$record_stats rs on (rs.mon$stat_id = a.mon$stat_id)
+where 
+    a.mon$attachment_id = current_connection"""
+
+# колонки таблицы, с которых начинается хотя бы один индекс
+INDEXED_COLUMNS_SQL = """select distinct segments.rdb$field_name 
+from rdb$indices indices
+    join rdb$index_segments segments on (segments.rdb$index_name = indices.rdb$index_name)
+where 
+    indices.rdb$relation_name = ? and 
+    segments.rdb$field_position = 0"""
+
+
+# атрибуты организации получателя/исполнителя в основном запросе, вместо отдельного ORG_INFO_SQL
+ORG_COLUMNS_SQL = """,
+    {0}.inn as org_inn, 
+    {0}.inn20 as org_kpp, 
+    {0}.name as org_name, 
+    {0}.shortname as org_shortname, 
+    {0}.okato as org_okato"""
+ORG_JOIN_SQL = """
+    left join ORGANIZATIONS {0} on ({1} = {0}.id)"""
+
+
+def _with_org_columns(blank, from_clause, alias, org_ref):
+    blank = blank.replace(from_clause, ORG_COLUMNS_SQL.format(alias) + from_clause, 1)
+    return blank.replace('\nwhere ', ORG_JOIN_SQL.format(alias, org_ref) + '\nwhere ', 1)
+
+
+PLP_IN_ORG_SQL = _with_org_columns(PLP_IN_SQL, '\nfrom FACIALFINCAPTION', 'DEST_ORGANIZATION', 'DEST_ACCOUNT.org_ref')
+PLP_OUT_ORG_SQL = _with_org_columns(PLP_OUT_SQL, '\nfrom FACIALFINCAPTION', 'DEST_ORGANIZATION', 'DEST_ACCOUNT.org_ref')
+ARG_BANK_ORG_SQL = _with_org_columns(ARG_BANK_SQL, ' \nfrom agreements', 'executer_organization', 'agreements.executer_ref')
+ARG_ORG_ORG_SQL = _with_org_columns(ARG_ORG_SQL, ' \nfrom agreements', 'executer_organization', 'agreements.executer_ref')
+
+
+# колонка счёта, по которой фильтр выгрузки (account_filter.py) ограничивает основные запросы;
+# выборка для нескольких потребителей (MultiTargetUnload) выбирается без фильтра и делится на клиенте по FILTER_COLUMN
+FILTER_COLUMN = 'FILTER_ACC'
+FILTER_COLUMN_SQL = """,
+    {0} as filter_acc"""
+PLP_FILTER_COLUMN = 'facialfincaption.destfacialacc_cls'
+PBS_FILTER_COLUMN = 'budgetdata.facialacc_cls'
+ARG_FILTER_COLUMN = 'agreements.facialacc_cls'
+
+
+def with_filter_column(blank, expression):
+    """Добавляет в список колонок основного запроса колонку счёта FILTER_COLUMN."""
+    return blank.replace('\nfrom ', FILTER_COLUMN_SQL.format(expression) + '\nfrom ', 1)
+
+
+# условие фильтра по счёту: {0} - колонка счёта, {1} - место под пачку параметров
+ACCOUNT_EQUAL_SQL = ' and {0} = ?'
+ACCOUNT_IN_SQL = '{0} in ({1})'
+ACCOUNT_RANGE_SQL = '{0} between ? and ?'
+ACCOUNT_FILTER_SQL = ' and ({0})'
+# в фильтре только организации без счетов
+EMPTY_FILTER_SQL = ' and 1 = 0'
+
+# лицевые счета организаций фильтра: пачка id подставляется как в ORG_INFO_SQL
+FILTER_ORG_ACCOUNTS_SQL = """select id from facialacc_cls where org_ref in ({})"""
+FILTER_ORG_RANGE_ACCOUNTS_SQL = """select id from facialacc_cls where org_ref between ? and ?"""
+
+
+# предварительная оценка (estimates.py): основной запрос с count(*) вместо списка колонок,
+# запрос с группировкой считается подзапросом
+COUNT_COLUMNS_SQL = 'select count(*)'
+COUNT_GROUPS_SQL = """select count(*) from (
+{0}
+) grouped"""
+
+
+def count_query(query):
+    """Запрос количества строк основного запроса с теми же условиями и параметрами.
+
+    Список колонок верхнего select (начинается с начала строки, как и первый '\nfrom ')
+    заменяется на count(*); подзапросы with остаются как есть.
+    """
+    if '\ngroup by' in query:
+        return COUNT_GROUPS_SQL.format(query)
+
+    from_index = query.index('\nfrom ')
+    select_index = query.rfind('\nselect', 0, from_index) + 1
+    return query[:select_index] + COUNT_COLUMNS_SQL + query[from_index:]
+
+
+# постраничная выборка по ключу: первая и следующие страницы дописываются к основному запросу
+KEYSET_FIRST_PAGE_SQL = """
+order by {0} rows ?"""
+KEYSET_NEXT_PAGE_SQL = """
+    and {0} > ?
+order by {0} rows ?"""
 
-ORG_INFO_SQL = """select id, inn, inn20 as kpp, name, shortname, okato from organizations where id in {}"""
\ No newline at end of file
+# ключ страниц (выражение в запросе, колонка результата) для крупных таблиц
+PLP_PAGE_KEY = ('facialfincaption.id', 'ID')
+PBS_PAGE_KEY = ('budnotify.id', 'ID')
+ARG_PAGE_KEY = ('agreements.id', 'ID')
@@ -0,0 +1,153 @@
+# Form implementation generated from reading ui file 'krista.ui'
+#
+# Created by: PyQt6 UI code generator 6.11.0
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic6 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt6 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(399, 244)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Fixed, QtWidgets.QSizePolicy.Policy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(MainWindow.sizePolicy().hasHeightForWidth())
+        MainWindow.setSizePolicy(sizePolicy)
+        self.centralwidget = QtWidgets.QWidget(parent=MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.layoutWidget = QtWidgets.QWidget(parent=self.centralwidget)
+        self.layoutWidget.setGeometry(QtCore.QRect(2, 14, 391, 208))
+        self.layoutWidget.setObjectName("layoutWidget")
+        self.verticalLayout = QtWidgets.QVBoxLayout(self.layoutWidget)
+        self.verticalLayout.setContentsMargins(0, 0, 0, 0)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.horizontalLayout_7 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_7.setObjectName("horizontalLayout_7")
+        self.loginLabel = QtWidgets.QLabel(parent=self.layoutWidget)
+        self.loginLabel.setObjectName("loginLabel")
+        self.horizontalLayout_7.addWidget(self.loginLabel)
+        self.login_line_edit = QtWidgets.QLineEdit(parent=self.layoutWidget)
+        self.login_line_edit.setObjectName("login_line_edit")
+        self.horizontalLayout_7.addWidget(self.login_line_edit)
+        self.passwordLabel = QtWidgets.QLabel(parent=self.layoutWidget)
+        self.passwordLabel.setObjectName("passwordLabel")
+        self.horizontalLayout_7.addWidget(self.passwordLabel)
+        self.password_line_edit = QtWidgets.QLineEdit(parent=self.layoutWidget)
+        self.password_line_edit.setInputMethodHints(QtCore.Qt.InputMethodHint.ImhHiddenText|QtCore.Qt.InputMethodHint.ImhNoAutoUppercase|QtCore.Qt.InputMethodHint.ImhNoPredictiveText|QtCore.Qt.InputMethodHint.ImhSensitiveData)
+        self.password_line_edit.setInputMask("")
+        self.password_line_edit.setEchoMode(QtWidgets.QLineEdit.EchoMode.Password)
+        self.password_line_edit.setObjectName("password_line_edit")
+        self.horizontalLayout_7.addWidget(self.password_line_edit)
+        self.verticalLayout.addLayout(self.horizontalLayout_7)
+        self.horizontalLayout_6 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_6.setObjectName("horizontalLayout_6")
+        self.databasePathLabel = QtWidgets.QLabel(parent=self.layoutWidget)
+        self.databasePathLabel.setObjectName("databasePathLabel")
+        self.horizontalLayout_6.addWidget(self.databasePathLabel)
+        self.database_path_line_edit = QtWidgets.QLineEdit(parent=self.layoutWidget)
+        self.database_path_line_edit.setText("")
+        self.database_path_line_edit.setObjectName("database_path_line_edit")
+        self.horizontalLayout_6.addWidget(self.database_path_line_edit)
+        self.database_path_tool_button = QtWidgets.QToolButton(parent=self.layoutWidget)
+        self.database_path_tool_button.setObjectName("database_path_tool_button")
+        self.horizontalLayout_6.addWidget(self.database_path_tool_button)
+        self.verticalLayout.addLayout(self.horizontalLayout_6)
+        self.horizontalLayout_5 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_5.setObjectName("horizontalLayout_5")
+        self.label_4 = QtWidgets.QLabel(parent=self.layoutWidget)
+        self.label_4.setObjectName("label_4")
+        self.horizontalLayout_5.addWidget(self.label_4)
+        self.unload_dir_line_edit = QtWidgets.QLineEdit(parent=self.layoutWidget)
+        self.unload_dir_line_edit.setObjectName("unload_dir_line_edit")
+        self.horizontalLayout_5.addWidget(self.unload_dir_line_edit)
+        self.unload_dir_tool_button = QtWidgets.QToolButton(parent=self.layoutWidget)
+        self.unload_dir_tool_button.setObjectName("unload_dir_tool_button")
+        self.horizontalLayout_5.addWidget(self.unload_dir_tool_button)
+        self.verticalLayout.addLayout(self.horizontalLayout_5)
+        self.horizontalLayout_4 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_4.setObjectName("horizontalLayout_4")
+        self.label_5 = QtWidgets.QLabel(parent=self.layoutWidget)
+        self.label_5.setObjectName("label_5")
+        self.horizontalLayout_4.addWidget(self.label_5)
+        self.date_begin_date_edit = QtWidgets.QDateEdit(parent=self.layoutWidget)
+        self.date_begin_date_edit.setLocale(QtCore.QLocale(QtCore.QLocale.Language.Russian, QtCore.QLocale.Country.Russia))
+        self.date_begin_date_edit.setCalendarPopup(True)
+        self.date_begin_date_edit.setObjectName("date_begin_date_edit")
+        self.horizontalLayout_4.addWidget(self.date_begin_date_edit)
+        self.verticalLayout.addLayout(self.horizontalLayout_4)
+        self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        self.label_6 = QtWidgets.QLabel(parent=self.layoutWidget)
+        self.label_6.setObjectName("label_6")
+        self.horizontalLayout_3.addWidget(self.label_6)
+        self.date_end_date_edit = QtWidgets.QDateEdit(parent=self.layoutWidget)
+        self.date_end_date_edit.setCalendarPopup(True)
+        self.date_end_date_edit.setObjectName("date_end_date_edit")
+        self.horizontalLayout_3.addWidget(self.date_end_date_edit)
+        self.verticalLayout.addLayout(self.horizontalLayout_3)
+        self.horizontalLayout_2 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_2.setObjectName("horizontalLayout_2")
+        self.label_7 = QtWidgets.QLabel(parent=self.layoutWidget)
+        self.label_7.setObjectName("label_7")
+        self.horizontalLayout_2.addWidget(self.label_7)
+        self.filter_line_edit = QtWidgets.QLineEdit(parent=self.layoutWidget)
+        self.filter_line_edit.setText("")
+        self.filter_line_edit.setObjectName("filter_line_edit")
+        self.horizontalLayout_2.addWidget(self.filter_line_edit)
+        self.verticalLayout.addLayout(self.horizontalLayout_2)
+        self.horizontalLayout = QtWidgets.QHBoxLayout()
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.unload_combobox = QtWidgets.QComboBox(parent=self.layoutWidget)
+        self.unload_combobox.setObjectName("unload_combobox")
+        self.unload_combobox.addItem("")
+        self.unload_combobox.addItem("")
+        self.unload_combobox.addItem("")
+        self.unload_combobox.addItem("")
+        self.horizontalLayout.addWidget(self.unload_combobox)
+        self.unload_push_button = QtWidgets.QPushButton(parent=self.layoutWidget)
+        self.unload_push_button.setObjectName("unload_push_button")
+        self.horizontalLayout.addWidget(self.unload_push_button)
+        self.cancel_push_button = QtWidgets.QPushButton(parent=self.layoutWidget)
+        self.cancel_push_button.setEnabled(False)
+        self.cancel_push_button.setObjectName("cancel_push_button")
+        self.horizontalLayout.addWidget(self.cancel_push_button)
+        self.verticalLayout.addLayout(self.horizontalLayout)
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.statusbar = QtWidgets.QStatusBar(parent=MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+
+        self.retranslateUi(MainWindow)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "Выгрузка из УРМ"))
+        self.loginLabel.setText(_translate("MainWindow", "Логин"))
+        self.login_line_edit.setText(_translate("MainWindow", "SYSDBA"))
+        self.passwordLabel.setText(_translate("MainWindow", "Пароль"))
+        self.password_line_edit.setText(_translate("MainWindow", "masterkey"))
+        self.databasePathLabel.setText(_translate("MainWindow", "Путь до базы УРМ"))
+        self.database_path_tool_button.setText(_translate("MainWindow", "..."))
+        self.label_4.setText(_translate("MainWindow", "Каталог выгрузки"))
+        self.unload_dir_line_edit.setText(_translate("MainWindow", "C:\\"))
+        self.unload_dir_tool_button.setText(_translate("MainWindow", "..."))
+        self.label_5.setText(_translate("MainWindow", "Дата начала выборки"))
+        self.date_begin_date_edit.setDisplayFormat(_translate("MainWindow", "dd.MM.yyyy"))
+        self.label_6.setText(_translate("MainWindow", "Дата конца выборки"))
+        self.date_end_date_edit.setDisplayFormat(_translate("MainWindow", "dd.MM.yyyy"))
+        self.label_7.setText(_translate("MainWindow", "Фильтр по лицевому счету"))
+        self.unload_combobox.setItemText(0, _translate("MainWindow", "Платёжные поручения"))
+        self.unload_combobox.setItemText(1, _translate("MainWindow", "Сметные назначения"))
+        self.unload_combobox.setItemText(2, _translate("MainWindow", "Реестр обязательств"))
+        self.unload_combobox.setItemText(3, _translate("MainWindow", "Реестр обязательств (итоги)"))
+        self.unload_push_button.setText(_translate("MainWindow", "Выгрузить"))
+        self.cancel_push_button.setText(_translate("MainWindow", "Отменить"))
+
+
+UI_SOURCE_HASH = 'cb8d7d53212ffc860ca3e96c29699743801a17b8'
@@ -0,0 +1,373 @@
+"""Главное окно выгрузки и точка входа приложения.
+
+Модуль загружает только PyQt6 и форму окна, чтобы окно появлялось быстро: форма
+берётся из собранного build_ui.py модуля krista_ui, а драйвер базы и модули dbf
+(main1 и создатели файлов) импортируются при первой выгрузке.
+"""
+import configparser
+import multiprocessing
+import os
+import sys
+from datetime import datetime
+
+from PyQt6.QtCore import QThreadPool
+from PyQt6.QtWidgets import (
+    QApplication,
+    QFileDialog,
+    QMainWindow,
+    QMessageBox,
+    QProgressBar,
+)
+
+from build_ui import ui_source_hash
+from cancellation import CancellationToken, UnloadCancelled
+from estimates import UnloadPreflight
+from info_strings import CANCEL_UNLOAD, UNLOAD_CANCELLED
+from settings import DATABASE_PATH_SEPARATOR, DATE_FORMAT, PREFLIGHT_ESTIMATES, QUERY_PROFILES_FILE, UI_FILE
+
+try:
+    from krista_ui import UI_SOURCE_HASH, Ui_MainWindow
+except ImportError:
+    UI_SOURCE_HASH, Ui_MainWindow = None, None
+
+
+def load_ui(window):
+    """Строит форму в окне.
+
+    Собранный модуль используется, если рядом нет формы (exe) или он собран из неё же,
+    иначе форма разбирается uic.loadUi. Виджеты в обоих случаях становятся атрибутами окна.
+
+    Args:
+        window (QMainWindow): Окно.
+    """
+    if Ui_MainWindow is not None and (not os.path.isfile(UI_FILE) or ui_source_hash(UI_FILE) == UI_SOURCE_HASH):
+        ui = Ui_MainWindow()
+        ui.setupUi(window)
+        for name, widget in vars(ui).items():
+            setattr(window, name, widget)
+        return
+
+    from PyQt6 import uic
+
+    uic.loadUi(UI_FILE, window)
+
+
+class DynamicConfigFile:
+    """Класс файла конфигурации может быть только один, для удобства обращения.
+    Отвечает за чтение и запись данных окна.
+
+    Attributes:
+        instance: объект класса, после инициализации при обращении всегда возвращается он
+        config: парсер конфига
+        host: хост
+        login: имя пользователя
+        password: пароль
+        unload_dir: директория для выгрузки
+        database_path: путь к базе данных
+        date_begin: дата начала выгрузки
+        date_end: дата завершения выгрузки
+    """
+
+    file_name = 'krista.ini'
+    section_name = 'krista'
+
+    instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls.instance:
+            cls.instance = super().__new__(cls, *args, **kwargs)
+
+        return cls.instance
+
+    def __init__(self):
+        self.config = configparser.ConfigParser()
+        self.host = None
+        self.login = None
+        self.password = None
+        self.unload_dir = None
+        self.database_path = None
+        self.filter = None
+        self.date_begin = None
+        self.date_end = None
+
+    def read_item(self, item, section='krista'):
+        """Чтение значения элемента из конфигурационного файла.
+
+        Args:
+            item (str): Имя элемента для чтения.
+            section (str, optional): Имя секции в конфигурационном файле. По умолчанию 'krista'.
+
+        Returns:
+            str or None: Значение элемента, если он существует. Иначе None.
+        """
+        result = None
+        try:
+            result = self.config[section][item]
+        except KeyError:
+            pass
+
+        return result
+
+    def exists(self):
+        return os.path.isfile(os.getcwd() + os.sep + self.file_name)
+
+    def read(self):
+        if self.exists():
+            self.config.read(self.file_name)
+            self.host = self.read_item('host')
+            self.login = self.read_item('login')
+            self.password = self.read_item('password')
+            self.unload_dir = self.read_item('unload_dir')
+            self.database_path = self.read_item('database_path')
+            self.filter = self.read_item('filter')
+            self.date_begin = self.read_item('date_begin')
+            self.date_end = self.read_item('date_end')
+
+    def write(self, login, password, unload_dir, database_path, filter, date_begin, date_end, host='127.0.0.1'):
+        """Запись конфигурационных данных в файл.
+
+        Args:
+            login (str): Логин для подключения к базе данных.
+            password (str): Пароль для подключения к базе данных.
+            unload_dir (str): Директория для выгрузки данных.
+            database_path (str): Путь к базе данных.
+            filter (str): Дополнительный фильтр для SQL-запросов.
+            date_begin (QDate): Дата начала выгрузки.
+            date_end (QDate): Дата окончания выгрузки.
+            host (str, optional): Хост для подключения к базе данных. По умолчанию '127.0.0.1'.
+
+        Returns:
+            None
+        """
+        config = configparser.ConfigParser()
+        config.add_section('krista')
+        config[self.section_name]['host'] = host
+        config[self.section_name]['login'] = login
+        config[self.section_name]['password'] = password
+        config[self.section_name]['unload_dir'] = unload_dir
+        config[self.section_name]['database_path'] = database_path
+        config[self.section_name]['filter'] = filter
+        config[self.section_name]['date_begin'] = date_begin.toString(DATE_FORMAT)
+        config[self.section_name]['date_end'] = date_end.toString(DATE_FORMAT)
+
+        with open(self.file_name, 'w') as config_file:
+            config.write(config_file)
+
+
+class MainWindow(QMainWindow):
+    """Класс основного окна.
+
+    Из важного содержит метод unload, отвечающий за выгрузку в dbf.
+    """
+    # классы выгрузки из main1 по именам: модули выгрузки загружаются при первой выгрузке
+    UNLOAD_COMBOBOX_DATA = {
+        'Платёжные поручения': 'PlpUnload',
+        'Сметные назначения': 'PbsUnload',
+        'Реестр обязательств': 'ArgUnload',
+        'Реестр обязательств (итоги)': 'ArgTotalUnload',
+        # 'Прочие финансовые документы': 'BndUnload',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        load_ui(self)
+        self.threadpool = QThreadPool()
+        self.statusbar_progress_bar = QProgressBar()
+        self.statusbar.addPermanentWidget(self.statusbar_progress_bar)
+        self.database_path_tool_button.clicked.connect(self.select_database_path_dialog)
+        self.unload_dir_tool_button.clicked.connect(self.select_unload_dir_dialog)
+        self.unload_push_button.clicked.connect(self.unload)
+        self.cancel_push_button.clicked.connect(self.cancel_unload)
+        # токен отмены выполняемой выгрузки
+        self.cancel_token = None
+        self.set_default_status()
+
+    def fill_by_config(self, login, password, database_path, unload_dir, filter_, date_begin, date_end):
+        """Заполняет форму главного окна на основе данных конфигурации.
+
+        Args:
+            login (str): Логин для базы данных.
+            password (str): Пароль для базы данных.
+            database_path (str): Путь к базе данных.
+            unload_dir (str): Директория для выгрузки.
+            filter_ (str): Дополнительный фильтр.
+            date_begin (str): Дата начала в формате строки 'dd.mm.yyyy'.
+            date_end (str): Дата окончания в формате строки 'dd.mm.yyyy'.
+
+        Returns:
+            None
+        """
+        self.login_line_edit.setText(login)
+        self.password_line_edit.setText(password)
+        self.database_path_line_edit.setText(database_path)
+        self.unload_dir_line_edit.setText(unload_dir)
+        self.filter_line_edit.setText(filter_)
+        self.date_begin_date_edit.setDate(datetime.strptime(date_begin, '%d.%m.%Y'))
+        self.date_end_date_edit.setDate(datetime.strptime(date_end, '%d.%m.%Y'))
+
+    def select_database_path_dialog(self):
+        # можно выбрать несколько баз (по базе на год), выгрузка объединит их
+        fnames, _ = QFileDialog.getOpenFileNames(self, 'Путь к базе данных', os.getcwd(), filter='*.gdb')
+        if fnames:
+            self.database_path_line_edit.setText(DATABASE_PATH_SEPARATOR.join(fnames))
+
+    def select_unload_dir_dialog(self):
+        fname = QFileDialog.getExistingDirectory(self, 'Директория для выгрузки', os.getcwd())
+        self.unload_dir_line_edit.setText(fname)
+
+    def status_bar_showmessage(self, message):
+        self.statusbar.showMessage(message)
+
+    def set_statusbar_text(self, args):
+        message, step = args
+        self.status_bar_showmessage(message)
+        self.statusbar_progress_bar.setValue(self.statusbar_progress_bar.value() + step)
+
+    def set_default_status(self):
+        self.statusbar_progress_bar.setMaximum(1)
+        self.statusbar_progress_bar.setValue(0)
+        self.unload_push_button.setEnabled(True)
+        self.cancel_push_button.setEnabled(False)
+        self.cancel_token = None
+
+    def show_error_message(self, error_info_tuple):
+        from fdb import DatabaseError
+        from query_profiles import QueryProfilesNotFound
+
+        error_type, error_text = error_info_tuple
+        if error_type == UnloadCancelled:
+            self.status_bar_showmessage(UNLOAD_CANCELLED)
+        elif error_type == QueryProfilesNotFound:
+            QMessageBox.critical(
+                self,
+                'Профили запросов',
+                (
+                    f'{error_text}\nПоложите {QUERY_PROFILES_FILE} рядом с программой'
+                )
+            )
+        elif error_type == DatabaseError:
+            QMessageBox.critical(
+                self,
+                'Соединение с базой данных',
+                (
+                    f'Ошибка соединения с базой данных {self.database_path_line_edit.text()}'
+                )
+            )
+        elif error_type == FileNotFoundError:
+            QMessageBox.critical(
+                self,
+                'Ошибка создания архива',
+                (
+                    f'Проверьте доступность пути выгрузки {self.unload_dir_line_edit.text()}'
+                )
+            )
+
+    def unload(self):
+        # первая выгрузка загружает драйвер базы и модули dbf
+        import main1
+
+        unload_object_class = getattr(main1, self.UNLOAD_COMBOBOX_DATA[self.unload_combobox.currentText()])
+        self.unload_push_button.setEnabled(False)
+        DynamicConfigFile().write(
+            self.login_line_edit.text(),
+            self.password_line_edit.text(),
+            self.unload_dir_line_edit.text(),
+            self.database_path_line_edit.text(),
+            self.filter_line_edit.text(),
+            self.date_begin_date_edit.date(),
+            self.date_end_date_edit.date(),
+        )
+        unload = unload_object_class(
+            self.login_line_edit.text(),
+            self.password_line_edit.text(),
+            self.unload_dir_line_edit.text(),
+            self.database_path_line_edit.text(),
+            self.date_begin_date_edit.date(),
+            self.date_end_date_edit.date(),
+            self.filter_line_edit.text(),
+        )
+        self.cancel_token = unload.cancel_token = CancellationToken()
+        if PREFLIGHT_ESTIMATES:
+            # сначала оценка объёма: выгрузка начинается после подтверждения
+            preflight_object = main1.WorkerWrapper(UnloadPreflight(unload))
+            preflight_object.signals.progress.connect(self.set_statusbar_text)
+            preflight_object.signals.error.connect(self.preflight_failed)
+            preflight_object.signals.result.connect(lambda estimate: self.confirm_unload(unload, estimate))
+            self.threadpool.start(preflight_object)
+        else:
+            self.start_unload(unload)
+        self.cancel_push_button.setEnabled(True)
+
+    def start_unload(self, unload):
+        import main1
+
+        unload_object = main1.WorkerWrapper(unload)
+        unload_object.signals.set_progress_max.connect(self.statusbar_progress_bar.setMaximum)
+        unload_object.signals.progress.connect(self.set_statusbar_text)
+        unload_object.signals.error.connect(self.show_error_message)
+        unload_object.signals.result.connect(self.status_bar_showmessage)
+        unload_object.signals.finished.connect(self.set_default_status)
+        self.threadpool.start(unload_object)
+
+    def confirm_unload(self, unload, estimate):
+        """Показывает оценку выгрузки и запускает выгрузку, если пользователь согласен.
+
+        Args:
+            unload (UnloadAbs): Выгрузка, настроенная по оценке.
+            estimate (str): Оценка текстом.
+        """
+        if unload.cancel_token.cancelled:
+            self.status_bar_showmessage(UNLOAD_CANCELLED)
+            self.set_default_status()
+            return
+
+        self.status_bar_showmessage('')
+        answer = QMessageBox.question(self, 'Оценка выгрузки', f'{estimate}\n\nНачать выгрузку?')
+        if answer == QMessageBox.StandardButton.Yes and not unload.cancel_token.cancelled:
+            self.start_unload(unload)
+        else:
+            self.set_default_status()
+
+    def preflight_failed(self, error_info_tuple):
+        self.show_error_message(error_info_tuple)
+        self.set_default_status()
+
+    def cancel_unload(self):
+        """Отмена выгрузки: прерывает запрос на сервере, поток выгрузки удаляет созданные файлы."""
+        if self.cancel_token is None:
+            return
+
+        self.cancel_push_button.setEnabled(False)
+        self.status_bar_showmessage(CANCEL_UNLOAD)
+        self.cancel_token.cancel()
+
+
+def create_window():
+    """Главное окно, заполненное по файлу конфигурации."""
+    config_file = DynamicConfigFile()
+    config_file.read()
+
+    window = MainWindow()
+    window.fill_by_config(
+        config_file.login,
+        config_file.password,
+        config_file.database_path,
+        config_file.unload_dir,
+        config_file.filter,
+        config_file.date_begin,
+        config_file.date_end,
+    )
+    return window
+
+
+def main():
+    # процессы пула конвертации в собранном pyinstaller exe
+    multiprocessing.freeze_support()
+    app = QApplication(sys.argv)
+    window = create_window()
+    window.show()
+    sys.exit(app.exec())
+
+
+if __name__ == '__main__':
+    main()
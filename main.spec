@@ -1,14 +1,21 @@
 # -*- mode: python ; coding: utf-8 -*-
+import sys
 
+sys.path.insert(0, SPECPATH)
+from build_ui import build_ui
+
+# форма окна собирается в модуль krista_ui, exe не разбирает krista.ui при запуске
+build_ui()
 
 block_cipher = None
 
 
 a = Analysis(
-    ['main.py'],
+    ['krista_window.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    # условия запросов площадки; файл рядом с exe заменяет собранный (query_profiles.py)
+    datas=[('urmload.cfg', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
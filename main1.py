@@ -1,164 +1,124 @@
-import configparser
+import hashlib
 import os
+import shutil
+import struct
 import sys
 import zipfile
 from abc import (
     ABCMeta,
     abstractmethod,
 )
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from ctypes import byref
 from datetime import datetime
+from time import perf_counter
 
 import fdb
-from PyQt6 import QtWidgets, uic
 from PyQt6.QtCore import (
-    QThreadPool,
     QObject,
     pyqtSignal,
     QRunnable,
     pyqtSlot,
 )
-from PyQt6.QtWidgets import (
-    QApplication,
-    QFileDialog,
-    QMessageBox,
-    QProgressBar,
-)
 from fdb import DatabaseError
+from fdb.ibase import ISC_STATUS_ARRAY, fb_cancel_raise
 
 from creators import (
     ArgEstCreator,
     ArgFkrCreator,
     ArgMainCreator,
     ArgOrgCreator,
+    ArgTotalCreator,
     PbsFkrCreator,
     PbsMainCreator,
     PlpFkrCreator,
     PlpMainCreator,
     PlpOrgCreator,
 )
-from info_strings import DATABASE_CONNECTION, CREATE_MAIN, CREATE_FKR, CREATE_ORG, CREATE_ZIP, CREATE_EST
+from account_filter import parse_account_filter
+from cancellation import CancellationToken, UnloadCancelled
+from checkpoints import UnloadManifest
+from columnar import DbfBlockWriter, RecordBatch, RecordLayout, read_dbf_blocks, read_dbf_header, sort_dbf_file, split_dbf_file, unique_records
+from conversion_pool import ConversionPool
+from diagnostics import IO_STATS_KEYS, NULL_TRACE, QueryDiagnostics
+from fingerprints import FingerprintIndex, write_diff_files
+from metrics import FetchCounter, UnloadMetrics
+from formats import FORMAT_EXTENSIONS, check_formats, format_file_name, merge_table_files
+from ndx import write_ndx
+from query_profiles import query_profile
+from spool import RecordSpool
+from info_strings import DATABASE_CONNECTION, CREATE_MAIN, CREATE_FKR, CREATE_ORG, CREATE_ZIP, CREATE_EST, MERGE_DBF
 from krista_sql import (
+    SNAPSHOT_NUMBER_SQL,
+    ATTACHMENT_IO_STATS_SQL,
+    KEYSET_FIRST_PAGE_SQL,
+    KEYSET_NEXT_PAGE_SQL,
+    PLP_PAGE_KEY,
+    PBS_PAGE_KEY,
+    ARG_PAGE_KEY,
     ARG_BANK_SQL,
+    ARG_BANK_ORG_SQL,
     ARG_EST_SQL,
     ARG_ORG_SQL,
+    ARG_ORG_ORG_SQL,
+    ARG_TOTAL_SQL,
+    ARG_TOTAL_GROUP_SQL,
     ORG_INFO_SQL,
     PBS_SQL,
     PLP_IN_SQL,
+    PLP_IN_ORG_SQL,
     PLP_OUT_SQL,
-    PLP_ACCOUNT_FILTER,
-    PBS_ACCOUNT_FILTER,
-    ARG_ACCOUNT_FILTER,
+    PLP_OUT_ORG_SQL,
+    FILTER_COLUMN,
+    FILTER_ORG_ACCOUNTS_SQL,
+    FILTER_ORG_RANGE_ACCOUNTS_SQL,
+    PLP_FILTER_COLUMN,
+    PBS_FILTER_COLUMN,
+    ARG_FILTER_COLUMN,
+    with_filter_column,
+    count_query,
 )
 from settings import (
-    ARG_CONFIG,
     DATABASE_DATE_FORMAT,
-    DATE_FORMAT,
-    INCOMING_SQL_ADDITION,
-    OUTGOING_SQL_ADDITION,
-    PBS_CONFIG, FKR_KEYS,
+    FKR_KEYS,
+    COLUMNAR_CONVERSION,
+    COLUMNAR_BATCH_SIZE,
+    CONVERSION_PROCESSES,
+    READ_ONLY_SNAPSHOT,
+    ID_CHUNK_SIZE,
+    QUERY_DIAGNOSTICS,
+    ORG_FROM_MAIN_QUERY,
+    ORG_KEYS,
+    KEYSET_PAGE_SIZE,
+    RESUMABLE_UNLOADS,
+    PAGE_CHECKPOINT_SECONDS,
+    DATABASE_PATH_SEPARATOR,
+    SORTED_OUTPUT,
+    DIFF_ARCHIVES,
+    DBF_VOLUME_MAX_BYTES,
+    DBF_VOLUME_MAX_RECORDS,
+    DBF_INDEXES,
+    MEMORY_BUDGET,
+    OUTPUT_FORMATS,
 )
 
 
-class DynamicConfigFile:
-    """Класс файла конфигурации может быть только один, для удобства обращения.
-    Отвечает за чтение и запись данных окна.
-
-    Attributes:
-        instance: объект класса, после инициализации при обращении всегда возвращается он
-        config: парсер конфига
-        host: хост
-        login: имя пользователя
-        password: пароль
-        unload_dir: директория для выгрузки
-        database_path: путь к базе данных
-        date_begin: дата начала выгрузки
-        date_end: дата завершения выгрузки
-    """
-
-    file_name = 'krista.ini'
-    section_name = 'krista'
-
-    instance = None
-
-    def __new__(cls, *args, **kwargs):
-        if not cls.instance:
-            cls.instance = super().__new__(cls, *args, **kwargs)
-
-        return cls.instance
-
-    def __init__(self):
-        self.config = configparser.ConfigParser()
-        self.host = None
-        self.login = None
-        self.password = None
-        self.unload_dir = None
-        self.database_path = None
-        self.filter = None
-        self.date_begin = None
-        self.date_end = None
+PreparedQuery = namedtuple('PreparedQuery', ('cursor', 'statement'))
+# запрос выгрузки: текст, параметры и ключ постраничной выборки (выражение, колонка) или None
+QueryRequest = namedtuple('QueryRequest', ('sql', 'params', 'page_key'), defaults=(None,))
+# потребитель выгрузки для нескольких потребителей: имя, директория выгрузки (свой архив) и фильтр по счёту
+UnloadTarget = namedtuple('UnloadTarget', ('name', 'unload_dir', 'filter'))
 
-    def read_item(self, item, section='krista'):
-        """Чтение значения элемента из конфигурационного файла.
+# isc_tpb_at_snapshot_number из ibase.h Firebird 4, в fdb константы нет
+ISC_TPB_AT_SNAPSHOT_NUMBER = 23
 
-        Args:
-            item (str): Имя элемента для чтения.
-            section (str, optional): Имя секции в конфигурационном файле. По умолчанию 'krista'.
+# размер части файла при упаковке в архив: между частями проверяется отмена
+ZIP_CHUNK_SIZE = 1024 * 1024
 
-        Returns:
-            str or None: Значение элемента, если он существует. Иначе None.
-        """
-        result = None
-        try:
-            result = self.config[section][item]
-        except KeyError:
-            pass
-
-        return result
-
-    def exists(self):
-        return os.path.isfile(os.getcwd() + os.sep + self.file_name)
-
-    def read(self):
-        if self.exists():
-            self.config.read(self.file_name)
-            self.host = self.read_item('host')
-            self.login = self.read_item('login')
-            self.password = self.read_item('password')
-            self.unload_dir = self.read_item('unload_dir')
-            self.database_path = self.read_item('database_path')
-            self.filter = self.read_item('filter')
-            self.date_begin = self.read_item('date_begin')
-            self.date_end = self.read_item('date_end')
-
-    def write(self, login, password, unload_dir, database_path, filter, date_begin, date_end, host='127.0.0.1'):
-        """Запись конфигурационных данных в файл.
-
-        Args:
-            login (str): Логин для подключения к базе данных.
-            password (str): Пароль для подключения к базе данных.
-            unload_dir (str): Директория для выгрузки данных.
-            database_path (str): Путь к базе данных.
-            filter (str): Дополнительный фильтр для SQL-запросов.
-            date_begin (QDate): Дата начала выгрузки.
-            date_end (QDate): Дата окончания выгрузки.
-            host (str, optional): Хост для подключения к базе данных. По умолчанию '127.0.0.1'.
-
-        Returns:
-            None
-        """
-        config = configparser.ConfigParser()
-        config.add_section('krista')
-        config[self.section_name]['host'] = host
-        config[self.section_name]['login'] = login
-        config[self.section_name]['password'] = password
-        config[self.section_name]['unload_dir'] = unload_dir
-        config[self.section_name]['database_path'] = database_path
-        config[self.section_name]['filter'] = filter
-        config[self.section_name]['date_begin'] = date_begin.toString(DATE_FORMAT)
-        config[self.section_name]['date_end'] = date_end.toString(DATE_FORMAT)
-
-        with open(self.file_name, 'w') as config_file:
-            config.write(config_file)
+# оценка памяти строки организации (кортеж ORG_KEYS со строками в словаре организаций), байт
+ORG_ROW_MEMORY = 1024
 
 
 class DatabaseConnection:
@@ -167,6 +127,11 @@ class DatabaseConnection:
         Attributes:
             cursor: курсор
             connection: соединение
+            transaction: читающая транзакция выгрузки
+            statements: кэш подготовленных запросов текущей транзакции по тексту запроса
+            plans: планы подготовленных запросов по тексту запроса
+            diagnostics: диагностика запросов, если включена QUERY_DIAGNOSTICS
+            cancel_token: токен отмены выгрузки, которая использует соединение
             login: имя пользователя
             password: пароль
             database_path: путь в бд
@@ -175,9 +140,17 @@ class DatabaseConnection:
 
     """
 
-    def __init__(self, login, password, database_path, host='127.0.0.1', charset='WIN1251'):
+    def __init__(self, login, password, database_path, host='127.0.0.1', charset='WIN1251', snapshot_number=None):
         self.cursor = None
         self.connection = None
+        self.transaction = None
+        self.statements = {}
+        self.plans = {}
+        self.diagnostics = QueryDiagnostics() if QUERY_DIAGNOSTICS else None
+        self.cancel_token = CancellationToken()
+        self.fetch_counter = FetchCounter()
+        self.monitoring_transaction = None
+        self.snapshot_number = snapshot_number
         self.login = login
         self.password = password
         self.database_path = database_path
@@ -185,6 +158,12 @@ class DatabaseConnection:
         self.charset = charset
         self.connect()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def connect(self):
         """Устанавливаем соединение с бд."""
 
@@ -195,25 +174,270 @@ class DatabaseConnection:
             password=self.password,
             charset=self.charset,
         )
+        if READ_ONLY_SNAPSHOT:
+            self.begin_snapshot()
+
+    def begin_snapshot(self):
+        """Открываем читающую транзакцию уровня snapshot, общую для всех запросов выгрузки.
+
+        Все запросы соединения видят одно состояние базы. Транзакция snapshot, даже
+        читающая, удерживает OST: пока она открыта, сервер не убирает старые версии
+        записей, изменённых после её начала, и мусор в базе копится. Поэтому транзакция
+        выгрузки должна быть короткой и завершается сразу после выгрузки (end_transaction).
+        Если задан snapshot_number (Firebird 4+), транзакция открывается на том же
+        снимке, что и у другого соединения.
+        """
+        tpb = fdb.TPB()
+        tpb.access_mode = fdb.isc_tpb_read
+        tpb.isolation_level = fdb.isc_tpb_concurrency
+        tpb.lock_resolution = fdb.isc_tpb_wait
+        tpb = tpb.render()
+        if self.snapshot_number:
+            tpb += bytes((ISC_TPB_AT_SNAPSHOT_NUMBER, 8)) + struct.pack('<q', self.snapshot_number)
+
+        self.transaction = self.connection.trans(default_tpb=tpb)
+        self.transaction.begin()
+        if not self.snapshot_number:
+            self.snapshot_number = self.read_snapshot_number()
+
+    def read_snapshot_number(self):
+        """Номер снимка текущей транзакции, None для версий Firebird младше 4."""
+        cursor = self.transaction.cursor()
+        try:
+            cursor.execute(SNAPSHOT_NUMBER_SQL)
+            row = cursor.fetchone()
+        except DatabaseError:
+            return None
+        finally:
+            cursor.close()
+
+        return int(row[0]) if row and row[0] else None
+
+    def fork(self):
+        """Новое соединение с той же базой для параллельных запросов одной выгрузки.
 
-    def execute(self, sql):
+        Returns:
+            DatabaseConnection: Соединение, читающее тот же снимок данных (Firebird 4+).
+        """
+        return DatabaseConnection(
+            self.login,
+            self.password,
+            self.database_path,
+            host=self.host,
+            charset=self.charset,
+            snapshot_number=self.snapshot_number,
+        )
+
+    def new_cursor(self):
+        """Курсор в транзакции выгрузки, либо в транзакции соединения по умолчанию."""
+        return (self.transaction or self.connection).cursor()
+
+    def end_transaction(self):
+        """Завершаем транзакцию выгрузки, соединение остаётся открытым."""
+        for prepared in self.statements.values():
+            prepared.cursor.close()
+        self.statements = {}
+        if self.monitoring_transaction is not None and self.monitoring_transaction.active:
+            self.monitoring_transaction.rollback()
+        self.monitoring_transaction = None
+        if self.transaction is not None and self.transaction.active:
+            self.transaction.commit()
+        self.transaction = None
+        if self.connection is not None and not self.connection.closed and self.connection.main_transaction.active:
+            self.connection.commit()
+
+    def renew(self):
+        """Начинаем новую выгрузку на уже открытом соединении: новый снимок данных и новая диагностика."""
+        self.end_transaction()
+        self.plans = {}
+        self.diagnostics = QueryDiagnostics() if QUERY_DIAGNOSTICS else None
+        self.snapshot_number = None
+        if READ_ONLY_SNAPSHOT:
+            self.begin_snapshot()
+
+    def close(self):
+        """Завершаем транзакцию выгрузки и закрываем соединение."""
+        self.end_transaction()
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+
+    def cancel_operation(self):
+        """Прерывает запрос, который сервер выполняет для соединения (fb_cancel_operation, Firebird 2.5+).
+
+        Вызывается из другого потока: execute или fetch в потоке выгрузки завершается
+        ошибкой DatabaseError, соединение и транзакция остаются рабочими.
+        """
+        if self.connection is None or self.connection.closed:
+            return
+
+        # в fdb нет обёртки над fb_cancel_operation, вызываем функцию клиентской библиотеки
+        fdb.load_api().client_library.fb_cancel_operation(
+            ISC_STATUS_ARRAY(),
+            byref(self.connection._db_handle),
+            fb_cancel_raise,
+        )
+
+    def prepare(self, sql):
+        """Подготовленный запрос из кэша соединения.
+
+        Текст запроса разбирается и оптимизируется сервером один раз за транзакцию выгрузки:
+        повторные выполнения в ней (пачки id, страницы) используют готовый запрос.
+        Курсоры запросов принадлежат транзакции, end_transaction (и renew перед следующей
+        выгрузкой на соединении из пула) закрывает их, и запросы подготавливаются заново.
+
+        Args:
+            sql (str): SQL-запрос с параметрами ``?``.
+
+        Returns:
+            PreparedQuery: Курсор и подготовленный на нём запрос.
+        """
+        prepared = self.statements.get(sql)
+        if prepared is None:
+            cursor = self.new_cursor()
+            prepared = PreparedQuery(cursor, cursor.prep(sql))
+            self.statements[sql] = prepared
+            self.plans[sql] = prepared.statement.plan
+
+        return prepared
+
+    def run_prepared(self, sql, params=()):
+        """Выполнение подготовленного запроса, курсор запоминается в self.cursor."""
+        prepared = self.prepare(sql)
+        self.cursor = prepared.cursor
+        self.cursor.execute(prepared.statement, params)
+        return self.cursor
+
+    def execute(self, sql, params=()):
         """Получение данных запроса и вывод в виде словаря.
 
         Args:
             sql (str): SQL-запрос для выполнения.
+            params (tuple): Значения параметров запроса.
 
         Returns:
             list[dict]: Список словарей, где ключи - это названия колонок, а значения - это соответствующие данные.
         """
-        self.cursor = self.connection.cursor()
-        self.cursor.execute(sql)
-        columns = [col[0] for col in self.cursor.description]
+        columns, rows = self.fetch_rows(sql, params)
         result = [
             dict(zip(columns, row))
-            for row in self.cursor.fetchall()
+            for row in rows
         ]
         return result
 
+    def fetch_rows(self, sql, params=()):
+        """Получение всех строк запроса в виде кортежей.
+
+        Args:
+            sql (str): SQL-запрос для выполнения.
+            params (tuple): Значения параметров запроса.
+
+        Returns:
+            tuple: Имена колонок и список строк.
+        """
+        trace = self.trace(sql, params)
+        started = perf_counter()
+        self.run_prepared(sql, params)
+        trace.executed()
+        columns = [col[0] for col in self.cursor.description]
+        rows = []
+        while True:
+            self.cancel_token.check()
+            chunk = self.cursor.fetchmany(COLUMNAR_BATCH_SIZE)
+            if not chunk:
+                break
+            rows.extend(chunk)
+        self.fetch_counter.add(len(rows), perf_counter() - started)
+        trace.add_rows(len(rows))
+        trace.finish()
+        return columns, rows
+
+    def fetch_batches(self, sql, params=(), batch_size=COLUMNAR_BATCH_SIZE):
+        """Получение данных запроса пакетами для колоночной конвертации.
+
+        Args:
+            sql (str): SQL-запрос для выполнения.
+            params (tuple): Значения параметров запроса.
+            batch_size (int): Количество строк в пакете.
+
+        Yields:
+            RecordBatch: Непустые пакеты строк в порядке курсора.
+        """
+        trace = self.trace(sql, params)
+        started = perf_counter()
+        self.run_prepared(sql, params)
+        trace.executed()
+        # время выборки без обработки пакетов потребителем
+        fetch_time = perf_counter() - started
+        row_count = 0
+        columns = [col[0] for col in self.cursor.description]
+        try:
+            while True:
+                self.cancel_token.check()
+                started = perf_counter()
+                rows = self.cursor.fetchmany(batch_size)
+                fetch_time += perf_counter() - started
+                if not rows:
+                    break
+                row_count += len(rows)
+                trace.add_rows(len(rows))
+                yield RecordBatch(columns, rows)
+        finally:
+            self.fetch_counter.add(row_count, fetch_time)
+            trace.finish()
+
+    def trace(self, sql, params):
+        """Замер выполнения запроса для диагностики, заглушка если диагностика выключена."""
+        if self.diagnostics is None:
+            return NULL_TRACE
+
+        return self.diagnostics.trace(self, sql, params)
+
+    def io_stats(self):
+        """Статистика ввода-вывода соединения из MON$ таблиц.
+
+        Читается в отдельной транзакции read committed, которая сразу завершается:
+        снимок мониторинга фиксируется на время транзакции.
+
+        Returns:
+            dict or None: Счётчики IO_STATS_KEYS, None если статистика недоступна.
+        """
+        if self.monitoring_transaction is None:
+            self.monitoring_transaction = self.connection.trans(default_tpb=fdb.ISOLATION_LEVEL_READ_COMMITED_RO)
+
+        self.monitoring_transaction.begin()
+        cursor = self.monitoring_transaction.cursor()
+        try:
+            cursor.execute(ATTACHMENT_IO_STATS_SQL)
+            row = cursor.fetchone()
+        except DatabaseError:
+            row = None
+        finally:
+            cursor.close()
+            self.monitoring_transaction.commit()
+
+        return dict(zip(IO_STATS_KEYS, row)) if row else None
+
+    def fetch_metadata(self, sql, params=()):
+        """Строки служебного запроса (метаданные), без кэша и диагностики."""
+        cursor = self.new_cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def write_diagnostics(self, file_path):
+        """Записывает отчёт диагностики запросов, если она включена.
+
+        Args:
+            file_path (str): Путь к файлу отчёта.
+        """
+        if self.diagnostics is None:
+            return
+
+        self.diagnostics.check_indexes(self)
+        self.diagnostics.write(file_path)
+
 
 class WorkerSignals(QObject):
     """Сигналы нашего потока исполнения."""
@@ -248,10 +472,11 @@ class WorkerWrapper(QRunnable):
 
 class UnloadAbs(metaclass=ABCMeta):
     """Базовый класс для общей логики выгрузки.
-    Содержит обязательный метод run в котором должна содержаться логика создания файлов dbf
+    Содержит обязательный метод create_files в котором должна содержаться логика создания файлов dbf
 
     Attributes:
         prefix: префикс названия zip файла
+        creator_classes: создатели dbf-файлов выгрузки
         dbf_files_names: список имен файлов которые необходимо включить в архив
         login: имя пользователя
         password: пароль
@@ -260,10 +485,30 @@ class UnloadAbs(metaclass=ABCMeta):
         date_begin: дата начала выгрузки
         date_end: дата завершения выгрузки
         filter: доп фильтрация запроса
+        account_filter: разобранный фильтр по счетам и организациям (account_filter.AccountFilter) или None
+        filter_column: выражение колонки счёта, по которой фильтруются основные запросы
+        profile_section: секция условий основных запросов в профиле запросов (query_profiles.py)
+        checkpoint_attributes: атрибуты, которые сохраняются в манифест после каждого этапа
+        manifest: манифест выгрузки с контрольными точками
+        cancel_token: токен отмены выгрузки
+        memory_budget: бюджет памяти записей выборки и строк организаций, байт
+        output_formats: дополнительные форматы файлов рядом с dbf (formats.FORMAT_EXTENSIONS)
+        prefetched: строки основных запросов, уже выбранные MultiTargetUnload, по page_checkpoint_name
+            запроса; если задано, основные запросы выбираются без фильтра по счёту
+        metrics: метрики запуска (metrics.UnloadMetrics), пишутся по окончании run
+        snapshot_connection: соединение другой выгрузки той же базы, снимок которого читает выгрузка:
+            её соединение открывается DatabaseConnection.fork()
+        page_size: строк на страницу постраничной выборки основных запросов, 0 - одним запросом
+        database_budgets: бюджеты памяти баз при выгрузке из нескольких баз по их путям,
+            иначе бюджет делится поровну (выбираются по оценке, estimates.apply_estimate)
     """
 
     prefix = None
+    creator_classes = ()
     dbf_files_names = ()
+    filter_column = None
+    profile_section = None
+    checkpoint_attributes = ()
 
     def __init__(self, login, password, unload_dir, database_path, date_begin, date_end, filter):
         self.login = login
@@ -273,11 +518,45 @@ class UnloadAbs(metaclass=ABCMeta):
         self.date_begin = date_begin
         self.date_end = date_end
         self.filter = filter
+        self.account_filter = parse_account_filter(filter)
+
+        # последний выбранный ключ постраничных запросов по имени контрольной точки
+        self.page_checkpoints = {}
+        self.manifest = UnloadManifest(
+            unload_dir,
+            self.prefix,
+            {
+                'database_path': database_path,
+                'date_begin': date_begin.toString(DATABASE_DATE_FORMAT),
+                'date_end': date_end.toString(DATABASE_DATE_FORMAT),
+                'filter': filter,
+            },
+            enabled=RESUMABLE_UNLOADS,
+        )
 
         # в дальнейшем надо выделить сигналы прогресса из основного кода
         self.progress_emiter = None
         self.progress_max_emiter = None
-        DynamicConfigFile().write(login, password, unload_dir, database_path, filter, date_begin, date_end)
+        # тёплые соединения, справочники и ограничение тяжёлых запросов задаёт планировщик
+        self.connection_pool = None
+        self.reference_cache = None
+        self.query_slots = nullcontext()
+        self.cancel_token = CancellationToken()
+        # архив, который упаковывается сейчас: при отмене удаляется недописанным
+        self.zip_path = None
+        self.memory_budget = MEMORY_BUDGET
+        self.output_formats = tuple(OUTPUT_FORMATS)
+        self.prefetched = None
+        self.snapshot_connection = None
+        self.page_size = KEYSET_PAGE_SIZE
+        self.database_budgets = {}
+        self.metrics = UnloadMetrics(
+            self.prefix,
+            database_path,
+            unload_dir,
+            date_begin.toString(DATABASE_DATE_FORMAT),
+            date_end.toString(DATABASE_DATE_FORMAT),
+        )
 
     def statusbar_max_info(self):
         if self.progress_max_emiter:
@@ -289,26 +568,802 @@ class UnloadAbs(metaclass=ABCMeta):
             self.progress_emiter.emit((message, 1))
 
     @abstractmethod
-    def run(self):
+    def create_files(self):
         pass
 
+    def run(self):
+        """Выгрузка; при отмене удаляет созданные файлы и завершается исключением UnloadCancelled.
+
+        Метрики запуска записываются при любом итоге.
+
+        Returns:
+            str or None: Имя созданного архива.
+        """
+        self.metrics.start()
+        try:
+            result = self.unload()
+        except Exception as error:
+            self.metrics.finish(error, self.cancel_token.cancelled)
+            if not self.cancel_token.cancelled:
+                raise
+
+            # запрос, прерванный на сервере, завершается ошибкой базы данных - это тоже отмена
+            self.discard_files()
+            if isinstance(error, UnloadCancelled):
+                raise
+            raise UnloadCancelled() from error
+        else:
+            self.metrics.finish()
+            return result
+        finally:
+            self.metrics.write()
+
+    def unload(self):
+        check_formats(self.output_formats)
+        self.statusbar_max_info()
+        database_paths = self.database_paths()
+        if len(database_paths) > 1:
+            self.create_files_fan_out(database_paths)
+        else:
+            self.create_files()
+
+        if SORTED_OUTPUT:
+            with self.metrics.phase('sort'):
+                self.sort_files()
+
+        self.step_info(CREATE_ZIP)
+        with self.metrics.phase('zip'):
+            return self.zip_files()
+
+    def discard_files(self):
+        """Удаляет файлы отменённой выгрузки: dbf-файлы, их тома, файлы изменений, индексы и
+        файлы дополнительных форматов, директории отдельных баз, недописанный архив и манифест.
+        """
+        extensions = ('.dbf', '.ndx') + tuple(FORMAT_EXTENSIONS.values())
+        for file_name in os.listdir(self.unload_dir):
+            file_path = os.path.join(self.unload_dir, file_name)
+            base, extension = os.path.splitext(file_name)
+            if extension == '.tmp':
+                base, extension = os.path.splitext(base)
+            if extension.lower() in extensions and self.creator_class_for(base + extension) is not None:
+                os.remove(file_path)
+            elif file_name.startswith(f'{self.prefix}_part') and os.path.isdir(file_path):
+                shutil.rmtree(file_path, ignore_errors=True)
+
+        if self.zip_path and os.path.isfile(self.zip_path):
+            os.remove(self.zip_path)
+        self.manifest.remove()
+
+    def database_paths(self):
+        """Базы данных выгрузки: database_path может содержать несколько баз через DATABASE_PATH_SEPARATOR."""
+        return [path.strip() for path in self.database_path.split(DATABASE_PATH_SEPARATOR) if path.strip()]
+
+    def create_files_fan_out(self, database_paths):
+        """Выгрузка из нескольких баз (база на бюджетный год) с объединением в один набор файлов.
+
+        Каждая база выгружается параллельно своим соединением во вложенную директорию,
+        затем файлы объединяются: записи основных файлов - подряд в порядке баз,
+        справочники fkr и org - без повторов по unique_field создателя.
+
+        Args:
+            database_paths (list[str]): Пути к базам данных.
+        """
+        self.step_info(DATABASE_CONNECTION)
+        parts = []
+        for number, database_path in enumerate(database_paths):
+            part_dir = os.path.join(self.unload_dir, f'{self.prefix}_part{number}')
+            os.makedirs(part_dir, exist_ok=True)
+            part = self.database_part(part_dir, database_path)
+            # базы выгружаются одновременно и делят бюджет памяти
+            part.memory_budget = self.database_budgets.get(database_path, self.memory_budget // len(database_paths))
+            parts.append(part)
+
+        try:
+            with self.metrics.phase('databases'), ThreadPoolExecutor(max_workers=len(parts)) as executor:
+                # list: дожидаемся всех баз и получаем исключение первой упавшей
+                list(executor.map(lambda part: part.create_files(), parts))
+        finally:
+            for part in parts:
+                self.metrics.add_fetch(part.metrics.fetch_rows, part.metrics.fetch_seconds)
+
+        part_dirs = [part.unload_dir for part in parts]
+        with self.metrics.phase('merge'):
+            self.merge_files(part_dirs)
+        for number, part_dir in enumerate(part_dirs):
+            part_diagnostics = os.path.join(part_dir, f'{self.prefix}_diagnostics.json')
+            if os.path.isfile(part_diagnostics):
+                os.replace(part_diagnostics, os.path.join(self.unload_dir, f'{self.prefix}_diagnostics_{number}.json'))
+            shutil.rmtree(part_dir)
+
+    def database_part(self, unload_dir, database_path):
+        """Выгрузка одной базы из нескольких с общими соединениями, отменой и настройками.
+
+        Args:
+            unload_dir (str): Директория выгрузки базы.
+            database_path (str): База данных.
+
+        Returns:
+            UnloadAbs: Выгрузка того же типа.
+        """
+        part = type(self)(
+            self.login,
+            self.password,
+            unload_dir,
+            database_path,
+            self.date_begin,
+            self.date_end,
+            self.filter,
+        )
+        part.connection_pool = self.connection_pool
+        part.query_slots = self.query_slots
+        part.cancel_token = self.cancel_token
+        part.memory_budget = self.memory_budget
+        part.output_formats = self.output_formats
+        part.page_size = self.page_size
+        if self.connection_pool is not None:
+            part.reference_cache = self.connection_pool.reference_cache(database_path)
+
+        return part
+
+    def count_rows(self, database_path):
+        """Количество строк основных запросов в базе (предварительная оценка, estimates.py).
+
+        Организации фильтра по счёту заменяются счетами этой базы в отдельной выгрузке,
+        поэтому фильтр самой выгрузки не меняется.
+
+        Args:
+            database_path (str): Одна из баз выгрузки.
+
+        Returns:
+            int: Строки всех основных запросов.
+        """
+        part = self.database_part(self.unload_dir, database_path)
+        rows = 0
+        with part.connect() as connection:
+            for request in part.main_requests():
+                with self.query_slots:
+                    _, result = connection.fetch_rows(count_query(request.sql), request.params)
+                rows += result[0][0]
+
+        return rows
+
+    def creator_class_for(self, file_name):
+        """Создатель, к файлу которого относится файл архива (сам файл, его том, файл изменений или формата)."""
+        for creator_class in self.creator_classes:
+            base = os.path.splitext(creator_class.file_name)[0]
+            if os.path.splitext(file_name)[0] == base or file_name.startswith(base + '_'):
+                return creator_class
+
+        return None
+
+    def format_files(self, file_names):
+        """Имена файлов дополнительных форматов для dbf-файлов."""
+        return tuple(
+            format_file_name(file_name, output_format)
+            for file_name in file_names
+            for output_format in self.output_formats
+        )
+
+    def create_indexes(self, file_names):
+        """Строит индексы .ndx по index_fields создателей для файлов архива.
+
+        Индекс строится по окончательному файлу (после сортировки и деления на тома),
+        чтобы номера записей в нём совпадали с файлом в архиве.
+
+        Args:
+            file_names (list[str]): Имена dbf-файлов архива.
+
+        Returns:
+            list[str]: Имена созданных индексов.
+        """
+        result = []
+        for file_name in file_names:
+            creator_class = self.creator_class_for(file_name)
+            if creator_class is None:
+                continue
+
+            self.cancel_token.check()
+            file_path = os.path.join(self.unload_dir, file_name)
+            field_names = {field.name for field in read_dbf_header(file_path)[3]}
+            for field_name in creator_class.index_fields:
+                if field_name in field_names:
+                    index_name = f'{os.path.splitext(file_name)[0]}_{field_name.lower()}.ndx'
+                    write_ndx(file_path, field_name, os.path.join(self.unload_dir, index_name))
+                    result.append(index_name)
+
+        return result
+
+    def split_volumes(self, file_names, track=True):
+        """Делит крупные файлы на тома по DBF_VOLUME_MAX_BYTES и DBF_VOLUME_MAX_RECORDS.
+
+        Args:
+            file_names (tuple): Имена файлов архива.
+            track (bool): Запоминать тома в манифесте (для файлов этапов выгрузки).
+
+        Returns:
+            list[str]: Имена файлов архива с учётом томов.
+        """
+        result = []
+        for file_name in file_names:
+            self.cancel_token.check()
+            file_path = os.path.join(self.unload_dir, file_name)
+            if not os.path.isfile(file_path):
+                result.extend(self.manifest.volumes[file_name])
+                continue
+
+            volumes = split_dbf_file(file_path, DBF_VOLUME_MAX_BYTES, DBF_VOLUME_MAX_RECORDS)
+            if volumes == [file_path]:
+                result.append(file_name)
+                continue
+
+            volumes = [os.path.basename(volume) for volume in volumes]
+            if track:
+                self.manifest.set_volumes(file_name, volumes)
+            os.remove(file_path)
+            result.extend(volumes)
+
+        return result
+
+    def create_diff_files(self):
+        """Создаёт файлы изменений относительно прошлой выгрузки (DIFF_ARCHIVES).
+
+        Документом считается первое поле sort_fields создателя. Индекс отпечатков
+        прошлой выгрузки хранится в директории выгрузки, новый индекс сохраняется после упаковки.
+
+        Returns:
+            tuple: Индекс с новыми отпечатками и имена файлов изменений.
+        """
+        fingerprint_index = FingerprintIndex(os.path.join(self.unload_dir, f'{self.prefix}_fingerprints.json.gz'))
+        diff_files = []
+        for creator_class in self.creator_classes:
+            self.cancel_token.check()
+            layout = RecordLayout(creator_class.dbf_schema_and_getter_map.keys())
+            names, fingerprints = write_diff_files(
+                os.path.join(self.unload_dir, creator_class.file_name),
+                layout,
+                creator_class.sort_fields[0],
+                fingerprint_index.files.get(creator_class.file_name, {}),
+            )
+            fingerprint_index.files[creator_class.file_name] = fingerprints
+            diff_files.extend(names)
+
+        return fingerprint_index, diff_files
+
+    def sort_files(self):
+        """Упорядочивает записи готовых dbf-файлов по sort_fields создателей.
+
+        Порядок не зависит от плана запроса и порядка обхода множеств fkr_list и
+        organizations_ids, поэтому архивы одинаковых данных совпадают побайтно
+        (кроме даты в заголовке).
+        """
+        for creator_class in self.creator_classes:
+            self.cancel_token.check()
+            file_path = os.path.join(self.unload_dir, creator_class.file_name)
+            if os.path.isfile(file_path):
+                layout = RecordLayout(creator_class.dbf_schema_and_getter_map.keys())
+                sort_dbf_file(file_path, layout, creator_class.sort_fields)
+
+    def merge_files(self, part_dirs):
+        """Объединяет одноимённые dbf-файлы из директорий баз в директорию выгрузки.
+
+        Для справочников (unique_field) при повторе ключа остаётся запись последней базы из списка.
+
+        Args:
+            part_dirs (list[str]): Директории выгрузок отдельных баз.
+        """
+        for creator_class in self.creator_classes:
+            self.step_info(MERGE_DBF.format(creator_class.file_name))
+            paths = [
+                os.path.join(part_dir, creator_class.file_name)
+                for part_dir in part_dirs
+                if os.path.isfile(os.path.join(part_dir, creator_class.file_name))
+            ]
+            if not paths:
+                continue
+
+            layout = RecordLayout(creator_class.dbf_schema_and_getter_map.keys())
+            seen_keys = set()
+            if creator_class.unique_field:
+                paths.reverse()
+            with DbfBlockWriter(os.path.join(self.unload_dir, creator_class.file_name), layout) as writer:
+                for path in paths:
+                    blocks = self.cancel_token.guard(read_dbf_blocks(path, layout))
+                    if creator_class.unique_field:
+                        blocks = unique_records(blocks, layout, creator_class.unique_field, seen_keys)
+                    for block, record_count in blocks:
+                        writer.write_block(block, record_count)
+
+            for output_format in self.output_formats:
+                merge_table_files(creator_class, output_format, part_dirs, self.unload_dir, self.cancel_token)
+
+    @contextmanager
+    def connect(self):
+        """Соединение выгрузки: новое, на снимке snapshot_connection, либо тёплое соединение из пула планировщика.
+
+        Пока соединение занято выгрузкой, отмена прерывает выполняемый им запрос на сервере.
+
+        Yields:
+            DatabaseConnection: Соединение.
+        """
+        if self.snapshot_connection is not None:
+            connection_context = self.snapshot_connection.fork()
+        elif self.connection_pool is None:
+            connection_context = DatabaseConnection(self.login, self.password, self.database_path)
+        else:
+            connection_context = self.connection_pool.connection(self.login, self.password, self.database_path)
+
+        with connection_context as connection:
+            connection.cancel_token = self.cancel_token
+            # соединение из пула считает строки всех своих выгрузок, в метрики идёт прирост
+            fetched_rows, fetch_seconds = connection.fetch_counter.snapshot()
+            try:
+                with self.cancel_token.on_cancel(connection.cancel_operation):
+                    self.resolve_account_filter(connection)
+                    yield connection
+            finally:
+                connection.cancel_token = CancellationToken()
+                self.metrics.add_fetch(
+                    connection.fetch_counter.rows - fetched_rows,
+                    connection.fetch_counter.seconds - fetch_seconds,
+                )
+
+    def run_stage(self, stage, message, files, create, *args):
+        """Выполняет этап выгрузки, если он не был завершён в прошлом запуске.
+
+        Для завершённого этапа восстанавливаются сохранённые атрибуты checkpoint_attributes.
+        Этап выполняется заново, если нет файлов дополнительных форматов его dbf-файлов.
+
+        Args:
+            stage (str): Имя этапа в манифесте.
+            message (str): Сообщение прогресса.
+            files (tuple): Файлы, которые создаёт этап.
+            create (callable): Метод этапа.
+            *args: Аргументы метода.
+        """
+        self.step_info(message)
+        if self.manifest.is_done(stage) and self.manifest.files_exist(self.format_files(self.manifest.stages[stage]['files'])):
+            for name, value in self.manifest.state(stage).items():
+                setattr(self, name, value)
+            return
+
+        with self.metrics.phase(stage):
+            create(*args)
+        self.manifest.complete(
+            stage,
+            files,
+            {name: getattr(self, name) for name in self.checkpoint_attributes},
+        )
+
+    def prepare_sql(self, blank, condition, page_key=None):
+        """Подготавливаем запрос
+
+        :param blank: основной запрос
+        :param condition: имя условия в секции profile_section профиля запросов (query_profiles.py)
+        :param page_key: ключ постраничной выборки из krista_sql (*_PAGE_KEY)
+        :return: QueryRequest с запросом и значениями параметров для передачи в бд
+        """
+        result = query_profile(self.profile_section).query(blank, condition)
+        params = [
+            int(self.date_begin.toString(DATABASE_DATE_FORMAT)),
+            int(self.date_end.toString(DATABASE_DATE_FORMAT)),
+        ]
+
+        if self.prefetched is not None:
+            # выборка для нескольких потребителей: фильтр по счёту применяется на клиенте
+            result = with_filter_column(result, self.filter_column)
+        elif self.account_filter is not None:
+            condition, values = self.account_filter.predicate(self.filter_column)
+            result += condition
+            params.extend(values)
+
+        return QueryRequest(result, tuple(params), page_key)
+
+    def resolve_account_filter(self, connection):
+        """Заменяет организации фильтра по счёту их лицевыми счетами в базе соединения.
+
+        :param connection: соединение
+        """
+        account_filter = self.account_filter
+        if account_filter is None or account_filter.resolved:
+            return
+
+        requests = self.id_requests(FILTER_ORG_ACCOUNTS_SQL, account_filter.organizations)
+        requests.extend(
+            QueryRequest(FILTER_ORG_RANGE_ACCOUNTS_SQL, tuple(organization_range))
+            for organization_range in account_filter.organization_ranges
+        )
+        accounts = set()
+        for request in requests:
+            _, rows = connection.fetch_rows(request.sql, request.params)
+            accounts.update(row[0] for row in rows)
+
+        self.account_filter = account_filter.with_organization_accounts(accounts)
+
+    def main_requests(self):
+        """Основные запросы выгрузки (с фильтром по счёту), результат prepare_sql.
+
+        Returns:
+            tuple: Запросы QueryRequest.
+        """
+        return ()
+
+    @staticmethod
+    def id_requests(blank, ids):
+        """Запросы по списку id пачками фиксированного размера.
+
+        Последняя пачка дополняется повтором последнего id, поэтому для всех пачек
+        используется один подготовленный запрос.
+
+        :param blank: запрос с местом под список параметров ``in ({})``
+        :param ids: id
+        :return: список запросов с параметрами
+        """
+        ids = sorted(item_id for item_id in ids if item_id is not None)
+        sql = blank.format(', '.join('?' * ID_CHUNK_SIZE))
+        requests = []
+        for start in range(0, len(ids), ID_CHUNK_SIZE):
+            chunk = ids[start:start + ID_CHUNK_SIZE]
+            chunk += chunk[-1:] * (ID_CHUNK_SIZE - len(chunk))
+            requests.append(QueryRequest(sql, tuple(chunk)))
+
+        return requests
+
+    def org_requests(self, organizations_ids):
+        """Запросы ORG_INFO_SQL пачками id фиксированного размера."""
+        return self.id_requests(ORG_INFO_SQL, organizations_ids)
+
+    def fetch(self, connection, *requests):
+        """Получение записей нескольких запросов подряд.
+
+        Запросы с ключом страниц выбираются постранично, если задан page_size, остальные -
+        пакетами курсора в обоих режимах конвертации. Записи сверх memory_budget
+        сбрасываются во временный файл в директории выгрузки по мере выборки.
+
+        Args:
+            connection (DatabaseConnection): Соединение.
+            *requests (QueryRequest): Запросы, результат prepare_sql или id_requests.
+
+        Returns:
+            RecordSpool: Пакеты RecordBatch в колоночном режиме, иначе словари.
+        """
+        result = RecordSpool(self.memory_budget, self.unload_dir)
+        for request in requests:
+            pages = self.prefetched_pages(request)
+            if pages is not None:
+                with pages:
+                    for batch in pages:
+                        result.extend(self.page_records(batch.columns, batch.rows))
+            elif request.page_key and self.page_size:
+                for columns, rows in self.fetch_pages(connection, request):
+                    result.extend(self.page_records(columns, rows))
+            elif COLUMNAR_CONVERSION:
+                with self.query_slots:
+                    result.extend(connection.fetch_batches(request.sql, request.params))
+            else:
+                with self.query_slots:
+                    for batch in connection.fetch_batches(request.sql, request.params):
+                        result.extend(self.page_records(batch.columns, batch.rows))
+
+        return result
+
+    @staticmethod
+    def page_records(columns, rows):
+        """Строки страницы в виде записей выбранного режима конвертации.
+
+        Returns:
+            list: Пакеты RecordBatch в колоночном режиме, иначе список словарей.
+        """
+        if COLUMNAR_CONVERSION:
+            return [
+                RecordBatch(columns, rows[start:start + COLUMNAR_BATCH_SIZE])
+                for start in range(0, len(rows), COLUMNAR_BATCH_SIZE)
+            ]
+
+        return [dict(zip(columns, row)) for row in rows]
+
+    @staticmethod
+    def page_checkpoint_name(request):
+        """Имя контрольной точки постраничной выборки: зависит от текста запроса и параметров."""
+        return hashlib.sha1(repr((request.sql, request.params)).encode()).hexdigest()[:16]
+
+    def prefetched_pages(self, request):
+        """Строки запроса, выбранные заранее MultiTargetUnload; забираются один раз.
+
+        Returns:
+            RecordSpool or None: Пакеты RecordBatch или None, если запрос выбирается из базы.
+        """
+        if not self.prefetched:
+            return None
+
+        return self.prefetched.pop(self.page_checkpoint_name(request), None)
+
+    def request_pages(self, connection, request):
+        """Строки запроса порциями: постранично, если задан ключ страниц, иначе пакетами курсора.
+
+        Yields:
+            tuple: Имена колонок и строки порции.
+        """
+        if request.page_key and self.page_size:
+            yield from self.fetch_pages(connection, request)
+            return
+
+        with self.query_slots:
+            for batch in connection.fetch_batches(request.sql, request.params):
+                yield batch.columns, batch.rows
+
+    def fetch_pages(self, connection, request):
+        """Постраничная выборка запроса по возрастанию ключа (keyset pagination).
+
+        Каждая страница - отдельный короткий запрос ``ключ > последний ключ order by ключ rows N``.
+        Строки последнего ключа неполной страницы отбрасываются и выбираются следующей
+        страницей целиком; если вся страница приходится на один ключ, размер страницы удваивается.
+        Последний выбранный ключ запоминается в page_checkpoints, с него выборка продолжается.
+
+        Args:
+            connection (DatabaseConnection): Соединение.
+            request (QueryRequest): Запрос с page_key.
+
+        Yields:
+            tuple: Имена колонок и строки страницы.
+        """
+        pages = self.prefetched_pages(request)
+        if pages is not None:
+            with pages:
+                for batch in pages:
+                    yield batch.columns, batch.rows
+            return
+
+        expression, column = request.page_key
+        checkpoint_name = self.page_checkpoint_name(request)
+        last_key = self.page_checkpoints.get(checkpoint_name)
+        page_size = self.page_size
+        while True:
+            if last_key is None:
+                sql = request.sql + KEYSET_FIRST_PAGE_SQL.format(expression)
+                params = request.params + (page_size,)
+            else:
+                sql = request.sql + KEYSET_NEXT_PAGE_SQL.format(expression)
+                params = request.params + (last_key, page_size)
+
+            with self.query_slots:
+                columns, rows = connection.fetch_rows(sql, params)
+            if not rows:
+                break
+
+            key_index = columns.index(column)
+            complete = len(rows)
+            if len(rows) == page_size:
+                boundary = rows[-1][key_index]
+                while complete and rows[complete - 1][key_index] == boundary:
+                    complete -= 1
+                if not complete:
+                    page_size *= 2
+                    continue
+
+            last_key = rows[complete - 1][key_index]
+            self.page_checkpoints[checkpoint_name] = last_key
+            yield columns, rows[:complete]
+            if len(rows) < page_size:
+                break
+
+    @staticmethod
+    def table_records(keys, rows):
+        """Записи для dbf из собранных при выгрузке строк (fkr, организации).
+
+        Args:
+            keys (tuple): Имена колонок.
+            rows: Строки-кортежи в порядке keys.
+
+        Returns:
+            list: Пакеты RecordBatch в колоночном режиме, иначе список словарей.
+        """
+        rows = list(rows)
+        if COLUMNAR_CONVERSION:
+            # пустой пакет не кодируется, пустой файл создаётся и без него
+            return [RecordBatch(keys, rows)] if rows else []
+
+        return [dict(zip(keys, row)) for row in rows]
+
+    def fkr_records(self, fkr_list):
+        """Записи для fkr.dbf из собранного списка кодов."""
+        return self.table_records(FKR_KEYS, fkr_list)
+
+    def org_records(self, connection, organizations, organizations_ids):
+        """Записи для org.dbf.
+
+        Если основной запрос выбрал атрибуты организаций (ORG_FROM_MAIN_QUERY), записи
+        берутся из собранного при выгрузке словаря id -> строка; организации, которых
+        в словаре нет (словарь ограничен бюджетом памяти), запрашиваются ORG_INFO_SQL.
+
+        :param connection: соединение
+        :param organizations: словарь id -> строка в порядке ORG_KEYS
+        :param organizations_ids: id организаций
+        :return: записи для write_dbf
+        """
+        organizations = organizations or {}
+        missing_ids = [org_id for org_id in organizations_ids if org_id is not None and org_id not in organizations]
+        records = self.table_records(ORG_KEYS, organizations.values()) if organizations else []
+        if not missing_ids:
+            return records
+
+        if self.reference_cache is not None:
+            records.extend(self.table_records(ORG_KEYS, self.reference_cache.organization_rows(self, connection, missing_ids)))
+        else:
+            records.extend(self.fetch(connection, *self.org_requests(missing_ids)))
+
+        return records
+
+    def limit_side_data(self, creator):
+        """Ограничивает строки организаций, которые создатель запоминает, четвертью бюджета памяти.
+
+        Returns:
+            DbfCreatorABS: Тот же создатель.
+        """
+        if self.memory_budget:
+            creator.organizations_limit = max(1, self.memory_budget // 4 // ORG_ROW_MEMORY)
+
+        return creator
+
+    def open_dbf(self, creator, create_new_file=True):
+        """Открывает dbf-файл создателя для записи порциями в выбранном режиме конвертации."""
+        return creator.open(
+            self.unload_dir,
+            create_new_file,
+            columnar=COLUMNAR_CONVERSION,
+            cancel_token=self.cancel_token,
+            formats=self.output_formats,
+        )
+
+    def write_dbf(self, creator, db_records, create_new_file=True):
+        """Запись dbf-файла создателем в выбранном режиме конвертации.
+
+        Args:
+            creator (DbfCreatorABS): Создатель файла.
+            db_records (list): Результат fetch или fkr_records.
+            create_new_file (bool): Флаг, нужно ли создавать новый файл.
+        """
+        # мелкие файлы (один пакет) в пул не отдаём
+        single_batch = isinstance(db_records, (list, RecordSpool)) and len(db_records) < 2
+        if COLUMNAR_CONVERSION and CONVERSION_PROCESSES != 0 and not single_batch:
+            with ConversionPool(CONVERSION_PROCESSES) as pool:
+                creator.create_columnar(
+                    db_records,
+                    unload_dir=self.unload_dir,
+                    create_new_file=create_new_file,
+                    pool=pool,
+                    cancel_token=self.cancel_token,
+                    formats=self.output_formats,
+                )
+        elif COLUMNAR_CONVERSION:
+            creator.create_columnar(
+                db_records,
+                unload_dir=self.unload_dir,
+                create_new_file=create_new_file,
+                cancel_token=self.cancel_token,
+                formats=self.output_formats,
+            )
+        else:
+            creator.create(
+                db_records,
+                unload_dir=self.unload_dir,
+                create_new_file=create_new_file,
+                cancel_token=self.cancel_token,
+                formats=self.output_formats,
+            )
+
+    def write_pages(self, connection, creator, stage, *requests):
+        """Постраничная запись dbf-файла с контрольными точками в манифесте.
+
+        Контрольная точка сохраняется после страницы, если с прошлой прошло не меньше
+        PAGE_CHECKPOINT_SECONDS: манифест не переписывается на каждой странице.
+        Если файл этапа был начат в прошлом запуске, он дописывается: восстанавливаются
+        ключи страниц и побочные данные создателя, записи после контрольной точки отбрасываются.
+        Файл создаётся только при наличии записей, как и при записи одним запросом.
+        С дополнительными форматами файл после сбоя пишется заново: их файлы не обрезаются до контрольной точки.
+        Так же и при выборке, сделанной заранее MultiTargetUnload: она не продолжается с контрольной точки.
+
+        Args:
+            connection (DatabaseConnection): Соединение.
+            creator (DbfCreatorABS): Создатель файла.
+            stage (str): Имя этапа в манифесте.
+            *requests (QueryRequest): Запросы с page_key.
+        """
+        sink = None
+        progress = None
+        if not self.output_formats and self.prefetched is None:
+            progress = self.manifest.page_progress(stage, creator.file_name)
+        if progress:
+            self.page_checkpoints.update(progress['keys'])
+            creator.merge_side_data(progress['state'])
+            sink = self.open_dbf(creator, create_new_file=False)
+            sink.truncate(progress['records'])
+        else:
+            self.manifest.begin_pages()
+
+        checkpoint_time = perf_counter()
+        try:
+            for request in requests:
+                for columns, rows in self.fetch_pages(connection, request):
+                    if sink is None:
+                        sink = self.open_dbf(creator)
+                    sink.write(self.page_records(columns, rows))
+                    if perf_counter() - checkpoint_time < PAGE_CHECKPOINT_SECONDS:
+                        continue
+
+                    sink.flush()
+                    self.manifest.save_pages(
+                        stage,
+                        creator.file_name,
+                        self.page_checkpoints,
+                        sink.record_count,
+                        creator.side_data(),
+                    )
+                    checkpoint_time = perf_counter()
+        finally:
+            if sink is not None:
+                sink.close()
+
+    def diagnostics_path(self):
+        """Путь к отчёту диагностики запросов в директории выгрузки (в архив не входит)."""
+        return os.path.join(self.unload_dir, f'{self.prefix}_diagnostics.json')
+
+    def write_zip_member(self, zip_file, file_path, name):
+        """Добавляет файл в архив частями, проверяя отмену между частями; размеры и записи файла идут в метрики."""
+        rows = read_dbf_header(file_path)[0] if name.lower().endswith('.dbf') else None
+        with open(file_path, 'rb') as source, zip_file.open(zipfile.ZipInfo.from_file(file_path, name), 'w') as target:
+            while True:
+                self.cancel_token.check()
+                chunk = source.read(ZIP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                target.write(chunk)
+
+        info = zip_file.getinfo(name)
+        self.metrics.add_file(name, rows, info.file_size, info.compress_size)
+
     def zip_files(self):
         result = None
         current_date = datetime.now().strftime('%Y%m%d')
         zip_file_name = f'{self.prefix}_{current_date}.zip'
 
-        main_ = os.getcwd()
-        os.chdir(self.unload_dir)
+        # без смены текущей директории: выгрузки планировщика идут в потоках одного процесса
+        dbf_paths = [os.path.join(self.unload_dir, file_name) for file_name in self.dbf_files_names]
 
-        check_exists_function = os.path.isfile
+        # файл может быть уже разделён на тома в прерванном запуске, это учитывает манифест
+        check_exists_function = self.manifest.file_exists
         if all([check_exists_function(file_name) for file_name in self.dbf_files_names]):
-            with zipfile.ZipFile(zip_file_name, 'w') as plp_zip_file:
-                for dbf_file in self.dbf_files_names:
-                    plp_zip_file.write(dbf_file)
-                    os.remove(dbf_file)
+            archive_files = self.dbf_files_names
+            fingerprint_index = None
+            if DIFF_ARCHIVES:
+                fingerprint_index, archive_files = self.create_diff_files()
+                zip_file_name = f'{self.prefix}_{current_date}_diff.zip'
+
+            archive_files = self.split_volumes(archive_files, track=fingerprint_index is None)
+            if DBF_INDEXES:
+                archive_files = archive_files + self.create_indexes(archive_files)
+            archive_files = archive_files + [
+                file_name
+                for file_name in self.format_files(self.dbf_files_names)
+                if os.path.isfile(os.path.join(self.unload_dir, file_name))
+            ]
+
+            self.zip_path = os.path.join(self.unload_dir, zip_file_name)
+            with zipfile.ZipFile(self.zip_path, 'w') as plp_zip_file:
+                for dbf_file in archive_files:
+                    dbf_path = os.path.join(self.unload_dir, dbf_file)
+                    self.write_zip_member(plp_zip_file, dbf_path, dbf_file)
+                    os.remove(dbf_path)
+
+            if fingerprint_index is not None:
+                # в архив попали только изменения, полные файлы остаются лишь в индексе отпечатков
+                for dbf_path in dbf_paths:
+                    os.remove(dbf_path)
+                fingerprint_index.save()
             result = zip_file_name
+            self.metrics.archive = {'name': zip_file_name, 'bytes': os.path.getsize(self.zip_path)}
 
-        os.chdir(main_)
+        if result:
+            self.manifest.remove()
 
         return result
 
@@ -317,53 +1372,47 @@ class PlpUnload(UnloadAbs):
     """Выгрузка платежных поручений."""
 
     prefix = 'plp'
-    dbf_files_names = (PlpMainCreator.file_name, PlpFkrCreator.file_name, PlpOrgCreator.file_name)
+    creator_classes = (PlpMainCreator, PlpFkrCreator, PlpOrgCreator)
+    dbf_files_names = tuple(creator_class.file_name for creator_class in creator_classes)
+    filter_column = PLP_FILTER_COLUMN
+    profile_section = 'plp'
+    checkpoint_attributes = ('fkr_list', 'organizations_ids', 'organizations')
 
     def __init__(self, login, password, unload_dir, database_path, date_begin, date_end, sql_filter):
         super().__init__(login, password, unload_dir, database_path, date_begin, date_end, sql_filter)
-        self.organizations_ids = self.fkr_list = None
-
-    def prepare_sql(self, blank, addition):
-        """Подготавливаем запрос
+        self.organizations_ids = self.fkr_list = self.organizations = None
 
-        :param blank: основной запрос
-        :param addition: дополнительные дынные из settings
-        :return: запрос для передачи в бд
-        """
-        result = blank.format(
-            self.date_begin.toString(DATABASE_DATE_FORMAT),
-            self.date_end.toString(DATABASE_DATE_FORMAT),
+    def main_requests(self):
+        outgoing_request = self.prepare_sql(
+            PLP_OUT_ORG_SQL if ORG_FROM_MAIN_QUERY else PLP_OUT_SQL,
+            'outgoing',
+            PLP_PAGE_KEY,
         )
-        if addition:
-            result += addition
-
-        if self.filter:
-            result += PLP_ACCOUNT_FILTER.format(self.filter)
-
-        return result
+        incoming_request = self.prepare_sql(
+            PLP_IN_ORG_SQL if ORG_FROM_MAIN_QUERY else PLP_IN_SQL,
+            'incoming',
+            PLP_PAGE_KEY,
+        )
+        return outgoing_request, incoming_request
 
     def create_main(self, connection):
         """Подготавливаем запрос передаём, получаем данные из бд, создаем файл plp_main.dbf
 
         :param connection: соединение
         """
-        outgoing_request = self.prepare_sql(
-            PLP_OUT_SQL,
-            OUTGOING_SQL_ADDITION,
-        )
-        db_records = connection.execute(outgoing_request)
-
-        incoming_request = self.prepare_sql(
-            PLP_IN_SQL,
-            INCOMING_SQL_ADDITION,
-        )
-        db_records.extend(connection.execute(incoming_request))
+        outgoing_request, incoming_request = self.main_requests()
+        main_creator = self.limit_side_data(PlpMainCreator())
+        if self.page_size:
+            self.write_pages(connection, main_creator, 'main', outgoing_request, incoming_request)
+        else:
+            with self.fetch(connection, outgoing_request, incoming_request) as db_records:
+                if db_records:
+                    self.write_dbf(main_creator, db_records)
 
-        if db_records:
-            main_creator = PlpMainCreator()
-            main_creator.create(db_records, unload_dir=self.unload_dir)
+        if main_creator.fkr_list:
             self.fkr_list = main_creator.fkr_list
             self.organizations_ids = main_creator.organizations_ids
+            self.organizations = main_creator.organizations
 
     def create_org(self, connection):
         """Подготавливаем запрос передаём, получаем данные из бд, создаем файл plp_org.dbf
@@ -371,10 +1420,9 @@ class PlpUnload(UnloadAbs):
         :param connection: соединение
         """
         if self.organizations_ids:
-            dest_org_request = ORG_INFO_SQL.format(tuple(self.organizations_ids))
-            db_records = connection.execute(dest_org_request)
+            db_records = self.org_records(connection, self.organizations, self.organizations_ids)
             org_creator = PlpOrgCreator()
-            org_creator.create(db_records, unload_dir=self.unload_dir)
+            self.write_dbf(org_creator, db_records)
 
     def create_kfr(self):
         """Подготавливаем запрос передаём, получаем данные из бд, создаем файл plp_fkr.dbf
@@ -382,326 +1430,325 @@ class PlpUnload(UnloadAbs):
         :param connection: соединение
         """
 
-        def prepare_record_fkr(data):
-            result = [
-                dict(zip(FKR_KEYS, fkr_item)) for fkr_item in list(data)
-            ]
-
-            return result
-
         if self.fkr_list:
             fkr_wirter = PlpFkrCreator()
-            fkr_wirter.create(db_records=prepare_record_fkr(self.fkr_list), unload_dir=self.unload_dir)
+            self.write_dbf(fkr_wirter, self.fkr_records(self.fkr_list))
 
-    def run(self):
-        self.statusbar_max_info()
+    def create_files(self):
         self.step_info(DATABASE_CONNECTION)
-        connection = DatabaseConnection(
-            self.login,
-            self.password,
-            self.database_path,
-        )
-
-        self.step_info(CREATE_MAIN)
-        self.create_main(connection)
-
-        self.step_info(CREATE_FKR)
-        self.create_kfr()
-
-        self.step_info(CREATE_ORG)
-        self.create_org(connection)
-
-        self.step_info(CREATE_ZIP)
-        return self.zip_files()
+        with self.connect() as connection:
+            self.run_stage('main', CREATE_MAIN, (PlpMainCreator.file_name,), self.create_main, connection)
+            self.run_stage('fkr', CREATE_FKR, (PlpFkrCreator.file_name,), self.create_kfr)
+            self.run_stage('org', CREATE_ORG, (PlpOrgCreator.file_name,), self.create_org, connection)
+            connection.write_diagnostics(self.diagnostics_path())
 
 
 class PbsUnload(UnloadAbs):
     """Cметные назначения."""
 
     prefix = 'pbs'
-    dbf_files_names = (PbsMainCreator.file_name, PbsFkrCreator.file_name)
+    creator_classes = (PbsMainCreator, PbsFkrCreator)
+    dbf_files_names = tuple(creator_class.file_name for creator_class in creator_classes)
+    filter_column = PBS_FILTER_COLUMN
+    profile_section = 'pbs'
+    checkpoint_attributes = ('fkr_list',)
 
     def __init__(self, login, password, unload_dir, database_path, date_begin, date_end, sql_filter):
         super().__init__(login, password, unload_dir, database_path, date_begin, date_end, sql_filter)
         self.fkr_list = None
 
-    def prepare_sql(self, blank, addition):
-        result = blank.format(
-            self.date_begin.toString(DATABASE_DATE_FORMAT),
-            self.date_end.toString(DATABASE_DATE_FORMAT),
-        )
-        if addition:
-            result += addition
-
-        if self.filter:
-            result += PBS_ACCOUNT_FILTER.format(self.filter)
-
-        return result
+    def main_requests(self):
+        return (self.prepare_sql(PBS_SQL, 'config', PBS_PAGE_KEY),)
 
     def create_main(self, connection):
-        outgoing_request = self.prepare_sql(
-            PBS_SQL,
-            PBS_CONFIG,
-        )
-        db_records = connection.execute(outgoing_request)
+        outgoing_request, = self.main_requests()
         main_creator = PbsMainCreator()
-        main_creator.create(db_records, unload_dir=self.unload_dir)
+        if self.page_size:
+            self.write_pages(connection, main_creator, 'main', outgoing_request)
+        else:
+            self.write_dbf(main_creator, self.fetch(connection, outgoing_request))
 
         self.fkr_list = main_creator.fkr_list
 
     def create_fkr(self):
-        def prepare_record_fkr(data):
-            result = [
-                dict(zip(FKR_KEYS, fkr_item)) for fkr_item in list(data)
-            ]
-
-            return result
-
         fkr_wirter = PbsFkrCreator()
-        fkr_wirter.create(db_records=prepare_record_fkr(self.fkr_list), unload_dir=self.unload_dir)
+        self.write_dbf(fkr_wirter, self.fkr_records(self.fkr_list))
 
-    def run(self):
-        self.statusbar_max_info()
+    def create_files(self):
         self.step_info(DATABASE_CONNECTION)
-        connection = DatabaseConnection(
-            self.login,
-            self.password,
-            self.database_path,
-        )
-
-        self.step_info(CREATE_MAIN)
-        self.create_main(connection)
+        with self.connect() as connection:
+            self.run_stage('main', CREATE_MAIN, (PbsMainCreator.file_name,), self.create_main, connection)
+            connection.write_diagnostics(self.diagnostics_path())
 
-        self.step_info(CREATE_FKR)
-        self.create_fkr()
-
-        self.step_info(CREATE_ZIP)
-        return self.zip_files()
+        self.run_stage('fkr', CREATE_FKR, (PbsFkrCreator.file_name,), self.create_fkr)
 
 
 class ArgUnload(UnloadAbs):
     """Реестр обязательств."""
 
     prefix = 'arg'
-    dbf_files_names = (
-        ArgMainCreator.file_name,
-        ArgOrgCreator.file_name,
-        ArgEstCreator.file_name,
-        ArgFkrCreator.file_name,
-    )
+    creator_classes = (ArgMainCreator, ArgOrgCreator, ArgEstCreator, ArgFkrCreator)
+    dbf_files_names = tuple(creator_class.file_name for creator_class in creator_classes)
+    filter_column = ARG_FILTER_COLUMN
+    profile_section = 'agr'
+    checkpoint_attributes = ('fkr_list', 'organizations_ids', 'organizations')
 
     def __init__(self, login, password, unload_dir, database_path, date_begin, date_end, sql_filter):
         super().__init__(login, password, unload_dir, database_path, date_begin, date_end, sql_filter)
-        self.organizations_ids = self.fkr_list = None
+        self.organizations_ids = self.fkr_list = self.organizations = None
 
-    def prepare_sql(self, blank, addition):
-        result = blank.format(
-            self.date_begin.toString(DATABASE_DATE_FORMAT),
-            self.date_end.toString(DATABASE_DATE_FORMAT),
+    def main_requests(self):
+        bank_request = self.prepare_sql(
+            ARG_BANK_ORG_SQL if ORG_FROM_MAIN_QUERY else ARG_BANK_SQL,
+            'config',
+            ARG_PAGE_KEY,
+        )
+        org_request = self.prepare_sql(
+            ARG_ORG_ORG_SQL if ORG_FROM_MAIN_QUERY else ARG_ORG_SQL,
+            'config',
+            ARG_PAGE_KEY,
         )
-        if addition:
-            result += addition
+        return bank_request, org_request
 
-        if self.filter:
-            result += ARG_ACCOUNT_FILTER.format(self.filter)
+    def create_main(self, connection):
+        bank_request, org_request = self.main_requests()
+        db_records = self.fetch(connection, bank_request, org_request)
 
-        return result
+        with db_records, self.open_dbf(ArgEstCreator()) as est_sink:
+            if db_records:
+                main_creator = self.limit_side_data(ArgMainCreator())
+                self.write_dbf(main_creator, self.stream_estimates(connection, db_records, est_sink))
 
-    def create_main(self, connection):
-        request = self.prepare_sql(
-            ARG_BANK_SQL,
-            ARG_CONFIG,
-        )
-        db_records = connection.execute(request)
-        request = self.prepare_sql(
-            ARG_ORG_SQL,
-            ARG_CONFIG,
-        )
-        db_records.extend(connection.execute(request))
+                self.fkr_list = main_creator.fkr_list
+                self.organizations_ids = main_creator.organizations_ids
+                self.organizations = main_creator.organizations
 
-        if db_records:
-            main_creator = ArgMainCreator()
-            main_creator.create(db_records, unload_dir=self.unload_dir)
-            main_creator.create(db_records, create_new_file=False, unload_dir=self.unload_dir)
+    def stream_estimates(self, connection, db_records, est_sink):
+        """Пропускает записи main.dbf и по ходу записи выгружает сметы выгруженных договоров.
 
-            self.fkr_list = main_creator.fkr_list
-            self.organizations_ids = main_creator.organizations_ids
+        Id договоров набираются в пачки ID_CHUNK_SIZE; по каждой полной пачке сметы
+        запрашиваются ARG_EST_SQL и дописываются в arg_est.dbf, пока main.dbf ещё пишется.
+
+        :param connection: соединение
+        :param db_records: записи main.dbf (словари или пакеты RecordBatch)
+        :param est_sink: открытый arg_est.dbf
+        """
+        written_ids = set()
+        pending_ids = []
+        for item in db_records:
+            ids = item.column('ID') if isinstance(item, RecordBatch) else (item['ID'],)
+            for agreement_id in ids:
+                if agreement_id not in written_ids:
+                    written_ids.add(agreement_id)
+                    pending_ids.append(agreement_id)
+
+            yield item
+
+            if len(pending_ids) >= ID_CHUNK_SIZE:
+                est_sink.write(self.fetch(connection, *self.id_requests(ARG_EST_SQL, pending_ids)))
+                pending_ids = []
+
+        if pending_ids:
+            est_sink.write(self.fetch(connection, *self.id_requests(ARG_EST_SQL, pending_ids)))
 
     def create_org(self, connection):
-        request = ORG_INFO_SQL.format(tuple(self.organizations_ids))
-        db_records = connection.execute(request)
-        ArgOrgCreator().create(db_records, unload_dir=self.unload_dir)
+        db_records = self.org_records(connection, self.organizations, self.organizations_ids or ())
+        self.write_dbf(ArgOrgCreator(), db_records)
 
     def create_fkr(self):
-        def prepare_record_fkr(data):
-            result = [
-                dict(zip(FKR_KEYS, fkr_item)) for fkr_item in list(data)
-            ]
+        fkr_wirter = ArgFkrCreator()
+        # основные запросы ничего не выбрали (например, фильтр без лицевых счетов): fkr_list не собран
+        self.write_dbf(fkr_wirter, self.fkr_records(self.fkr_list or ()))
 
-            return result
+    def create_files(self):
+        self.step_info(DATABASE_CONNECTION)
+        with self.connect() as connection:
+            # arg_est.dbf пишется вместе с main.dbf, поэтому этап main включает оба файла
+            self.run_stage(
+                'main',
+                CREATE_MAIN,
+                (ArgMainCreator.file_name, ArgEstCreator.file_name),
+                self.create_main,
+                connection,
+            )
+            self.run_stage('org', CREATE_ORG, (ArgOrgCreator.file_name,), self.create_org, connection)
+            self.run_stage('fkr', CREATE_FKR, (ArgFkrCreator.file_name,), self.create_fkr)
+            connection.write_diagnostics(self.diagnostics_path())
 
-        fkr_wirter = ArgFkrCreator()
-        fkr_wirter.create(db_records=prepare_record_fkr(self.fkr_list), unload_dir=self.unload_dir)
+        # arg_est.dbf записан вместе с main.dbf
+        self.step_info(CREATE_EST)
 
-    def create_est(self, connection):
-        request = self.prepare_sql(
-            ARG_EST_SQL,
-            ARG_CONFIG,
-        )
-        db_records = connection.execute(request)
-        ArgEstCreator().create(db_records, unload_dir=self.unload_dir)
 
-    def run(self):
-        self.statusbar_max_info()
-        self.step_info(DATABASE_CONNECTION)
-        connection = DatabaseConnection(
-            self.login,
-            self.password,
-            self.database_path,
-        )
+class ArgTotalUnload(UnloadAbs):
+    """Итоги реестра обязательств: суммы месяцев графиков платежей по договору, ФКР и КОСГУ.
 
-        self.step_info(CREATE_MAIN)
-        self.create_main(connection)
+    Строки графиков складываются на сервере (ARG_TOTAL_SQL), вместо строки на каждую
+    строку графика выбирается строка на группу; реквизиты договоров и организаций не выгружаются.
+    Выборка группировки не делится на страницы, page_size не применяется.
+    """
 
-        self.step_info(CREATE_ORG)
-        self.create_org(connection)
+    prefix = 'arg_total'
+    creator_classes = (ArgTotalCreator, ArgFkrCreator)
+    dbf_files_names = tuple(creator_class.file_name for creator_class in creator_classes)
+    filter_column = ARG_FILTER_COLUMN
+    profile_section = 'agr'
+    checkpoint_attributes = ('fkr_list',)
 
-        self.step_info(CREATE_FKR)
-        self.create_fkr()
+    def __init__(self, login, password, unload_dir, database_path, date_begin, date_end, sql_filter):
+        super().__init__(login, password, unload_dir, database_path, date_begin, date_end, sql_filter)
+        self.fkr_list = None
 
-        self.step_info(CREATE_EST)
-        self.create_est(connection)
+    def main_requests(self):
+        request = self.prepare_sql(ARG_TOTAL_SQL, 'config')
+        # группировка после условий профиля и фильтра по счёту
+        return (request._replace(sql=request.sql + ARG_TOTAL_GROUP_SQL),)
 
-        self.step_info(CREATE_ZIP)
-        return self.zip_files()
+    def create_main(self, connection):
+        total_request, = self.main_requests()
+        total_creator = ArgTotalCreator()
+        self.write_dbf(total_creator, self.fetch(connection, total_request))
+        self.fkr_list = total_creator.fkr_list
 
+    def create_fkr(self):
+        self.write_dbf(ArgFkrCreator(), self.fkr_records(self.fkr_list or ()))
+
+    def create_files(self):
+        self.step_info(DATABASE_CONNECTION)
+        with self.connect() as connection:
+            self.run_stage('main', CREATE_MAIN, (ArgTotalCreator.file_name,), self.create_main, connection)
+            connection.write_diagnostics(self.diagnostics_path())
 
-class MainWindow(QtWidgets.QMainWindow):
-    """Класс основного окна.
+        self.run_stage('fkr', CREATE_FKR, (ArgFkrCreator.file_name,), self.create_fkr)
 
-    Из важного содержит метод unload, отвечающий за выгрузку в dbf.
+
+class MultiTargetUnload:
+    """Выгрузка одного периода для нескольких потребителей с разными фильтрами по счёту одной выборкой.
+
+    Основные запросы выполняются один раз без фильтра по счёту, каждая строка по колонке
+    счёта FILTER_COLUMN попадает в выборки всех потребителей, фильтр которых ей подходит
+    (пустой фильтр - все строки). Затем выгрузки потребителей выполняются параллельно,
+    каждая в свою директорию и свой архив; основные запросы они не повторяют, справочники
+    (fkr, организации, сметы) собирают по своим строкам. Соединения потребителей
+    открываются на снимке общей выборки (DatabaseConnection.fork), поэтому справочники
+    соответствуют её строкам; на Firebird младше 4 у каждого соединения свой снимок.
+
+    Attributes:
+        unload_class: класс выгрузки (PlpUnload, PbsUnload, ArgUnload)
+        targets: потребители UnloadTarget
+        connection_pool, reference_cache, query_slots, cancel_token, memory_budget, output_formats:
+            передаются выгрузкам потребителей, как в UnloadAbs
     """
-    UNLOAD_COMBOBOX_DATA = {
-        'Платёжные поручения': PlpUnload,
-        'Сметные назначения': PbsUnload,
-        'Реестр обязательств': ArgUnload,
-        # 'Прочие финансовые документы': BndUnload,
-    }
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        uic.loadUi('krista.ui', self)
-        self.threadpool = QThreadPool()
-        self.statusbar_progress_bar = QProgressBar()
-        self.statusbar.addPermanentWidget(self.statusbar_progress_bar)
-        self.database_path_tool_button.clicked.connect(self.select_database_path_dialog)
-        self.unload_dir_tool_button.clicked.connect(self.select_unload_dir_dialog)
-        self.unload_push_button.clicked.connect(self.unload)
-        self.set_default_status()
-
-    def fill_by_config(self, login, password, database_path, unload_dir, filter_, date_begin, date_end):
-        """Заполняет форму главного окна на основе данных конфигурации.
 
-        Args:
-            login (str): Логин для базы данных.
-            password (str): Пароль для базы данных.
-            database_path (str): Путь к базе данных.
-            unload_dir (str): Директория для выгрузки.
-            filter_ (str): Дополнительный фильтр.
-            date_begin (str): Дата начала в формате строки 'dd.mm.yyyy'.
-            date_end (str): Дата окончания в формате строки 'dd.mm.yyyy'.
+    def __init__(self, unload_class, login, password, database_path, date_begin, date_end, targets):
+        if not targets:
+            raise ValueError('Не заданы потребители выгрузки')
+        if unload_class.filter_column is None:
+            raise ValueError(f'Выгрузка {unload_class.prefix} не поддерживает несколько потребителей')
+        if len({os.path.normcase(os.path.abspath(target.unload_dir)) for target in targets}) < len(targets):
+            raise ValueError('У каждого потребителя должна быть своя директория выгрузки')
 
-        Returns:
-            None
-        """
-        self.login_line_edit.setText(login)
-        self.password_line_edit.setText(password)
-        self.database_path_line_edit.setText(database_path)
-        self.unload_dir_line_edit.setText(unload_dir)
-        self.filter_line_edit.setText(filter_)
-        self.date_begin_date_edit.setDate(datetime.strptime(date_begin, '%d.%m.%Y'))
-        self.date_end_date_edit.setDate(datetime.strptime(date_end, '%d.%m.%Y'))
-
-    def select_database_path_dialog(self):
-        fname, _ = QFileDialog.getOpenFileName(self, 'Путь к базе данных', os.getcwd(), filter='*.gdb')
-        self.database_path_line_edit.setText(fname)
-
-    def select_unload_dir_dialog(self):
-        fname = QFileDialog.getExistingDirectory(self, 'Директория для выгрузки', os.getcwd())
-        self.unload_dir_line_edit.setText(fname)
-
-    def status_bar_showmessage(self, message):
-        self.statusbar.showMessage(message)
-
-    def set_statusbar_text(self, args):
-        message, step = args
-        self.status_bar_showmessage(message)
-        self.statusbar_progress_bar.setValue(self.statusbar_progress_bar.value() + step)
-
-    def set_default_status(self):
-        self.statusbar_progress_bar.setMaximum(1)
-        self.statusbar_progress_bar.setValue(0)
-        self.unload_push_button.setEnabled(True)
-
-    def show_error_message(self, error_info_tuple):
-        error_type, error_text = error_info_tuple
-        if error_type == DatabaseError:
-            QMessageBox.critical(
-                self,
-                'Соединение с базой данных',
-                (
-                    f'Ошибка соединения с базой данных {self.database_path_line_edit.text()}'
-                )
-            )
-        elif error_type == FileNotFoundError:
-            QMessageBox.critical(
-                self,
-                'Ошибка создания архива',
-                (
-                    f'Проверьте доступность пути выгрузки {self.unload_dir_line_edit.text()}'
-                )
-            )
+        self.unload_class = unload_class
+        self.login = login
+        self.password = password
+        self.database_path = database_path
+        self.date_begin = date_begin
+        self.date_end = date_end
+        self.targets = tuple(targets)
 
-    def unload(self):
-        unload_object_class = self.UNLOAD_COMBOBOX_DATA[self.unload_combobox.currentText()]
-        self.unload_push_button.setEnabled(False)
-        unload_object = WorkerWrapper(
-            unload_object_class(
-                self.login_line_edit.text(),
-                self.password_line_edit.text(),
-                self.unload_dir_line_edit.text(),
-                self.database_path_line_edit.text(),
-                self.date_begin_date_edit.date(),
-                self.date_end_date_edit.date(),
-                self.filter_line_edit.text(),
-            )
+        self.progress_emiter = None
+        self.progress_max_emiter = None
+        self.connection_pool = None
+        self.reference_cache = None
+        self.query_slots = nullcontext()
+        self.cancel_token = CancellationToken()
+        self.memory_budget = MEMORY_BUDGET
+        self.output_formats = tuple(OUTPUT_FORMATS)
+
+    def create_unload(self, unload_dir, sql_filter, memory_budget):
+        """Выгрузка с общими для всех потребителей соединениями, отменой и форматами."""
+        os.makedirs(unload_dir, exist_ok=True)
+        unload = self.unload_class(
+            self.login,
+            self.password,
+            unload_dir,
+            self.database_path,
+            self.date_begin,
+            self.date_end,
+            sql_filter,
         )
-        unload_object.signals.set_progress_max.connect(self.statusbar_progress_bar.setMaximum)
-        unload_object.signals.progress.connect(self.set_statusbar_text)
-        unload_object.signals.error.connect(self.show_error_message)
-        unload_object.signals.result.connect(self.status_bar_showmessage)
-        unload_object.signals.finished.connect(self.set_default_status)
-        self.threadpool.start(unload_object)
-
-
-def main():
-    app = QApplication(sys.argv)
-    config_file = DynamicConfigFile()
-    config_file.read()
-
-    window = MainWindow()
-    window.fill_by_config(
-        config_file.login,
-        config_file.password,
-        config_file.database_path,
-        config_file.unload_dir,
-        config_file.filter,
-        config_file.date_begin,
-        config_file.date_end,
-    )
-    window.show()
-    sys.exit(app.exec())
+        unload.connection_pool = self.connection_pool
+        unload.reference_cache = self.reference_cache
+        unload.query_slots = self.query_slots
+        unload.cancel_token = self.cancel_token
+        unload.memory_budget = memory_budget
+        unload.output_formats = self.output_formats
+        unload.prefetched = {}
+        return unload
+
+    def run(self):
+        """Выгрузка для всех потребителей.
+
+        Returns:
+            dict: Имя потребителя -> имя созданного архива.
+        """
+        if DATABASE_PATH_SEPARATOR in self.database_path:
+            raise ValueError('Выгрузка для нескольких потребителей выполняется из одной базы')
+
+        # выборки потребителей и их выгрузки существуют одновременно и делят бюджет памяти
+        memory_budget = self.memory_budget // len(self.targets)
+        source = self.create_unload(self.targets[0].unload_dir, '', memory_budget)
+        source.progress_emiter = self.progress_emiter
+        unloads = [self.create_unload(target.unload_dir, target.filter, memory_budget) for target in self.targets]
+        try:
+            source.step_info(DATABASE_CONNECTION)
+            started = perf_counter()
+            with source.connect() as connection:
+                self.route(source, connection, unloads)
+                # общая выборка учитывается этапом route в метриках каждого потребителя
+                for unload in unloads:
+                    unload.metrics.add_phase('route', perf_counter() - started)
+                    # справочники потребителей читаются на снимке общей выборки (Firebird 4+)
+                    if connection.snapshot_number:
+                        unload.snapshot_connection = connection
+
+                with ThreadPoolExecutor(max_workers=len(unloads)) as executor:
+                    results = list(executor.map(lambda unload: unload.run(), unloads))
+        finally:
+            for unload in unloads:
+                for pages in unload.prefetched.values():
+                    pages.close()
+
+        return {target.name: result for target, result in zip(self.targets, results)}
+
+    def route(self, source, connection, unloads):
+        """Выполняет основные запросы один раз и раскладывает строки по выборкам потребителей.
+
+        Args:
+            source (UnloadAbs): Выгрузка без фильтра, по которой строятся запросы.
+            connection (DatabaseConnection): Соединение.
+            unloads (list[UnloadAbs]): Выгрузки потребителей, строки попадают в их prefetched.
+        """
+        for unload in unloads:
+            unload.resolve_account_filter(connection)
+
+        filters = [unload.account_filter for unload in unloads]
+        for request in source.main_requests():
+            name = source.page_checkpoint_name(request)
+            spools = []
+            for unload in unloads:
+                unload.prefetched[name] = RecordSpool(unload.memory_budget, unload.unload_dir)
+                spools.append(unload.prefetched[name])
+
+            for columns, rows in source.request_pages(connection, request):
+                index = columns.index(FILTER_COLUMN)
+                for account_filter, spool in zip(filters, spools):
+                    selected = rows if account_filter is None else [row for row in rows if account_filter.matches(row[index])]
+                    if selected:
+                        spool.append(RecordBatch(columns, selected))
 
 
 if __name__ == '__main__':
+    # окно и точка входа в krista_window.py, модули выгрузки загружаются при первой выгрузке
+    from krista_window import main
+
     main()
@@ -0,0 +1,261 @@
+"""Метрики выгрузок для наблюдения за площадками.
+
+Каждый запуск выгрузки (UnloadAbs.run) собирает UnloadMetrics: длительность этапов,
+записи и размер каждого файла архива (до и после сжатия), размер архива, выбранные
+с сервера строки и время выборки, итог и тип ошибки. Итог дописывается строкой JSON
+в METRICS_LOG_FILE и, если задан METRICS_TEXTFILE, обновляет файл в формате Prometheus
+для textfile collector node_exporter: счётчики запусков и ошибок по типам накапливаются
+между запусками, остальные метрики описывают последний запуск выгрузки базы.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter, time
+
+from settings import METRICS_LOG_FILE, METRICS_TEXTFILE
+
+logger = logging.getLogger('krista.metrics')
+
+# файлы метрик общие для потоков планировщика
+write_lock = threading.Lock()
+
+METRIC_PREFIX = 'krista_unload'
+# имя{метки} значение
+SAMPLE_RE = re.compile(r'^(\w+)(\{.*\})?\s+(\S+)$')
+
+METRIC_HELP = {
+    'runs_total': ('counter', 'Запуски выгрузки по итогу'),
+    'errors_total': ('counter', 'Ошибки выгрузки по типу'),
+    'last_run_timestamp_seconds': ('gauge', 'Время окончания последнего запуска'),
+    'duration_seconds': ('gauge', 'Длительность последнего запуска'),
+    'phase_duration_seconds': ('gauge', 'Длительность этапов последнего запуска'),
+    'file_rows': ('gauge', 'Записи файлов архива последнего запуска'),
+    'file_bytes': ('gauge', 'Размер файлов архива до сжатия'),
+    'file_compressed_bytes': ('gauge', 'Размер файлов архива после сжатия'),
+    'archive_bytes': ('gauge', 'Размер архива последнего запуска'),
+    'fetched_rows': ('gauge', 'Строки, выбранные с сервера за последний запуск'),
+    'fetch_rows_per_second': ('gauge', 'Скорость выборки с сервера за последний запуск'),
+}
+
+
+class FetchCounter:
+    """Строки, выбранные соединением, и время выполнения и выборки запросов на сервере."""
+
+    def __init__(self):
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, rows, seconds):
+        self.rows += rows
+        self.seconds += seconds
+
+    def snapshot(self):
+        return self.rows, self.seconds
+
+
+class UnloadMetrics:
+    """Метрики одного запуска выгрузки.
+
+    Attributes:
+        unload: префикс выгрузки (plp, pbs, arg)
+        database_path: база данных
+        phases: длительность этапов по именам, секунд
+        files: файлы архива по именам: записи (для dbf), размер до и после сжатия
+        archive: имя и размер архива
+        fetch_rows, fetch_seconds: строки, выбранные с сервера, и время их выборки
+        status: итог запуска - ok, cancelled или error
+        error_type: имя класса исключения, которым завершился запуск
+    """
+
+    def __init__(self, unload, database_path, unload_dir, date_begin, date_end):
+        self.unload = unload
+        self.database_path = database_path
+        self.unload_dir = unload_dir
+        self.date_begin = date_begin
+        self.date_end = date_end
+        self.phases = {}
+        self.files = {}
+        self.archive = None
+        self.fetch_rows = 0
+        self.fetch_seconds = 0.0
+        self.status = None
+        self.error_type = None
+        self.started_at = None
+        self.started = None
+        self.duration = None
+
+    def start(self):
+        self.started_at = datetime.now()
+        self.started = perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """Замеряет этап; время повторного этапа с тем же именем складывается."""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, perf_counter() - started)
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_fetch(self, rows, seconds):
+        self.fetch_rows += rows
+        self.fetch_seconds += seconds
+
+    def add_file(self, name, rows, size, compressed_size):
+        self.files[name] = {'rows': rows, 'bytes': size, 'compressed_bytes': compressed_size}
+
+    def finish(self, error=None, cancelled=False):
+        """Завершает замер запуска.
+
+        Args:
+            error (Exception): Исключение, которым завершился запуск, или None.
+            cancelled (bool): Выгрузка отменена.
+        """
+        self.duration = perf_counter() - self.started
+        if error is None:
+            self.status = 'ok'
+        else:
+            self.status = 'cancelled' if cancelled else 'error'
+            self.error_type = type(error).__name__
+
+    @property
+    def fetch_rate(self):
+        return self.fetch_rows / self.fetch_seconds if self.fetch_seconds else 0.0
+
+    def record(self):
+        """Итог запуска для журнала в виде словаря."""
+        return {
+            'time': self.started_at.isoformat(timespec='seconds'),
+            'unload': self.unload,
+            'database_path': self.database_path,
+            'unload_dir': self.unload_dir,
+            'date_begin': self.date_begin,
+            'date_end': self.date_end,
+            'status': self.status,
+            'error_type': self.error_type,
+            'duration': round(self.duration, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'files': self.files,
+            'archive': self.archive,
+            'fetch': {
+                'rows': self.fetch_rows,
+                'seconds': round(self.fetch_seconds, 3),
+                'rows_per_second': round(self.fetch_rate, 1),
+            },
+        }
+
+    def samples(self):
+        """Метрики последнего запуска: (имя без префикса, метки, значение)."""
+        labels = {'unload': self.unload, 'database': self.database_path}
+        result = [
+            ('last_run_timestamp_seconds', labels, time()),
+            ('duration_seconds', labels, self.duration),
+            ('fetched_rows', labels, self.fetch_rows),
+            ('fetch_rows_per_second', labels, self.fetch_rate),
+        ]
+        result.extend(('phase_duration_seconds', dict(labels, phase=name), seconds) for name, seconds in self.phases.items())
+        for name, file_metrics in self.files.items():
+            file_labels = dict(labels, file=name)
+            if file_metrics['rows'] is not None:
+                result.append(('file_rows', file_labels, file_metrics['rows']))
+            result.append(('file_bytes', file_labels, file_metrics['bytes']))
+            result.append(('file_compressed_bytes', file_labels, file_metrics['compressed_bytes']))
+        if self.archive is not None:
+            result.append(('archive_bytes', labels, self.archive['bytes']))
+
+        return result
+
+    def write(self):
+        """Дописывает итог в журнал и обновляет файл Prometheus; ошибки записи не прерывают выгрузку."""
+        with write_lock:
+            try:
+                if METRICS_LOG_FILE:
+                    write_log_record(METRICS_LOG_FILE, self.record())
+                if METRICS_TEXTFILE:
+                    update_textfile(METRICS_TEXTFILE, self)
+            except OSError:
+                logger.exception('Не удалось записать метрики выгрузки')
+
+
+def write_log_record(file_path, record):
+    with open(file_path, 'a', encoding='utf-8') as log_file:
+        log_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def format_label(name, value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{name}="{value}"'
+
+
+def format_labels(labels):
+    return '{' + ','.join(format_label(name, value) for name, value in sorted(labels.items())) + '}'
+
+
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def read_samples(file_path):
+    """Метрики существующего файла Prometheus: (имя, метки в виде строки) -> значение."""
+    samples = {}
+    if not os.path.isfile(file_path):
+        return samples
+
+    with open(file_path, encoding='utf-8') as textfile:
+        for line in textfile:
+            match = SAMPLE_RE.match(line.strip())
+            if match and match.group(1).startswith(METRIC_PREFIX):
+                samples[(match.group(1), match.group(2) or '')] = float(match.group(3))
+
+    return samples
+
+
+def update_textfile(file_path, metrics):
+    """Обновляет файл textfile collector.
+
+    Метрики прошлого запуска той же выгрузки и базы заменяются (например, файлы, которых
+    теперь нет, удаляются), счётчики запусков и ошибок увеличиваются. Файл подменяется
+    целиком, чтобы node_exporter не прочитал его недописанным.
+
+    Args:
+        file_path (str): Путь к файлу .prom.
+        metrics (UnloadMetrics): Метрики запуска.
+    """
+    samples = read_samples(file_path)
+    labels = {'unload': metrics.unload, 'database': metrics.database_path}
+    run_labels = [f',{format_label(name, value)},' for name, value in labels.items()]
+    for key in list(samples):
+        if not key[0].endswith('_total') and all(label in f',{key[1][1:-1]},' for label in run_labels):
+            del samples[key]
+
+    counters = [('runs_total', dict(labels, status=metrics.status))]
+    if metrics.error_type:
+        counters.append(('errors_total', dict(labels, type=metrics.error_type)))
+    for name, counter_labels in counters:
+        key = (f'{METRIC_PREFIX}_{name}', format_labels(counter_labels))
+        samples[key] = samples.get(key, 0) + 1
+
+    for name, sample_labels, value in metrics.samples():
+        samples[(f'{METRIC_PREFIX}_{name}', format_labels(sample_labels))] = value
+
+    lines = []
+    for name, (metric_type, description) in METRIC_HELP.items():
+        full_name = f'{METRIC_PREFIX}_{name}'
+        metric_samples = sorted((key, value) for key, value in samples.items() if key[0] == full_name)
+        if metric_samples:
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            lines.extend(f'{full_name}{sample_labels} {format_value(value)}' for (_, sample_labels), value in metric_samples)
+
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as textfile:
+        textfile.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, file_path)
@@ -0,0 +1,119 @@
+"""Индексные файлы dBase III (.ndx) для готовых dbf-файлов.
+
+Индекс строится сортированной загрузкой B-дерева снизу вверх: ключи берутся из
+закодированных записей файла, сортируются и раскладываются по листовым страницам,
+над ними строятся внутренние уровни до одного корня.
+
+Формат: страницы по 512 байт, страница 0 - заголовок (корневая страница, число
+страниц, длина ключа, ключей на странице, тип ключа, размер элемента, выражение).
+Элемент страницы - ссылка на нижнюю страницу, номер записи (с 1) и ключ.
+Во внутренней странице ключ элемента - наибольший ключ его поддерева, последняя
+ссылка страницы идёт без ключа.
+"""
+import struct
+
+from columnar import read_dbf_header
+
+NDX_PAGE_SIZE = 512
+NDX_CHARACTER_KEY = 0
+
+
+def entry_size(key_length):
+    """Размер элемента страницы: ссылка, номер записи и ключ, выровненные на 4 байта."""
+    return (key_length + 8 + 3) // 4 * 4
+
+
+def _groups(items, count):
+    """Делит элементы на count групп почти равного размера."""
+    size, extra = divmod(len(items), count)
+    start = 0
+    for number in range(count):
+        end = start + size + (1 if number < extra else 0)
+        yield items[start:end]
+        start = end
+
+
+def _page(entries, size, last_pointer=None):
+    """Страница индекса.
+
+    Args:
+        entries (list): Элементы (ссылка на страницу, номер записи, ключ).
+        size (int): Размер элемента.
+        last_pointer (int, optional): Последняя ссылка внутренней страницы.
+    """
+    parts = [struct.pack('< I', len(entries))]
+    for page_number, record_number, key in entries:
+        parts.append(struct.pack('< 2I', page_number, record_number) + key.ljust(size - 8, b'\x00'))
+    if last_pointer is not None:
+        parts.append(struct.pack('< 2I', last_pointer, 0).ljust(size, b'\x00'))
+
+    return b''.join(parts).ljust(NDX_PAGE_SIZE, b'\x00')
+
+
+def build_ndx(keys, key_length, expression):
+    """Содержимое ndx-файла по ключам записей.
+
+    Args:
+        keys (list[tuple]): Пары (ключ в байтах фиксированной длины, номер записи с 1).
+        key_length (int): Длина ключа.
+        expression (str): Выражение ключа (имя поля).
+
+    Returns:
+        bytes: Файл индекса.
+    """
+    size = entry_size(key_length)
+    keys_per_page = (NDX_PAGE_SIZE - 4) // size
+    keys = sorted(keys)
+
+    pages = []
+    level = []
+    leaf_count = max(1, -(-len(keys) // keys_per_page))
+    for group in _groups(keys, leaf_count):
+        pages.append(_page([(0, record_number, key) for key, record_number in group], size))
+        level.append((len(pages), group[-1][0] if group else b''))
+
+    # во внутренней странице последняя ссылка занимает место элемента: не больше keys_per_page ссылок
+    while len(level) > 1:
+        upper = []
+        for group in _groups(level, -(-len(level) // keys_per_page)):
+            entries = [(page_number, 0, key) for page_number, key in group[:-1]]
+            pages.append(_page(entries, size, last_pointer=group[-1][0]))
+            upper.append((len(pages), group[-1][1]))
+        level = upper
+
+    header = struct.pack(
+        '< 3I 4H',
+        level[0][0],
+        len(pages) + 1,
+        0,
+        key_length,
+        keys_per_page,
+        NDX_CHARACTER_KEY,
+        size,
+    )
+    header = (header + b'\x00' * 4 + expression.encode('ascii') + b'\x00').ljust(NDX_PAGE_SIZE, b'\x00')
+    return header + b''.join(pages)
+
+
+def write_ndx(dbf_path, field_name, ndx_path):
+    """Создаёт индекс по символьному полю dbf-файла.
+
+    Args:
+        dbf_path (str): Путь к dbf-файлу.
+        field_name (str): Поле ключа.
+        ndx_path (str): Путь к индексу.
+    """
+    record_count, header_length, record_length, fields = read_dbf_header(dbf_path)
+    field = next(field for field in fields if field.name == field_name)
+    keys = []
+    with open(dbf_path, 'rb') as source:
+        source.seek(header_length)
+        record_number = 0
+        while record_number < record_count:
+            chunk = source.read(record_length * min(5000, record_count - record_number))
+            for position in range(0, len(chunk), record_length):
+                record_number += 1
+                keys.append((chunk[position + field.start:position + field.start + field.length], record_number))
+
+    with open(ndx_path, 'wb') as index_file:
+        index_file.write(build_ndx(keys, field.length, field.name))
@@ -0,0 +1,261 @@
+"""Профили запросов выгрузки из QUERY_PROFILES_FILE (urmload.cfg).
+
+Секция [main] задаёт режим площадки mode, секции типов выгрузки ([plp], [pbs], [agr], [bnd]) -
+дополнительные условия основных запросов. Условия пишутся через псевдонимы таблиц секции
+(PROFILE_SECTIONS); условие с номером режима после точки заменяет общее на площадке
+этого режима, поэтому переход на другую площадку - это смена mode::
+
+    [main]
+    mode = 2
+
+    [plp]
+    incoming = a.progindex in (61, 62, 63, 66) and a.buhpaymentcls in (8, 9, 101, 104, 105)
+    incoming.1 =
+    outgoing = a.progindex in (61, 62, 63, 66) and a.buhpaymentcls in (7, 16, 100, 114, 115)
+
+Файл ищется в рабочей директории, затем рядом с программой (exe или модулями), затем
+среди данных сборки PyInstaller: файл площадки рядом с программой заменяет собранный в exe.
+Файл читается и проверяется один раз на процесс при первом обращении (query_profile):
+псевдонимы заменяются именами таблиц, неизвестный псевдоним, таблица, которой нет в
+запросах секции, несбалансированные скобки, разделитель запросов или комментарий в
+условии - ошибка ValueError. Тексты запросов с условиями профиля собираются один раз
+и не меняются между выгрузками, поэтому подготовленные запросы соединения
+(DatabaseConnection.prepare) находятся по тексту без повторной сборки.
+"""
+import configparser
+import os
+import re
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+from krista_sql import ARG_BANK_SQL, ARG_ORG_SQL, ARG_TOTAL_SQL, BND_MAIN_SQL, PBS_SQL, PLP_IN_SQL, PLP_OUT_SQL
+from settings import QUERY_PROFILES_FILE
+
+# aliases: псевдоним -> таблица; keys: условия секции; queries: запросы, к которым добавляются условия
+ProfileSection = namedtuple('ProfileSection', ('aliases', 'keys', 'queries'))
+
+PROFILE_SECTIONS = {
+    'plp': ProfileSection({'a': 'facialfincaption'}, ('incoming', 'outgoing'), (PLP_IN_SQL, PLP_OUT_SQL)),
+    'pbs': ProfileSection({'a': 'budnotify'}, ('config',), (PBS_SQL,)),
+    'agr': ProfileSection({'a': 'agreements'}, ('config',), (ARG_BANK_SQL, ARG_ORG_SQL, ARG_TOTAL_SQL)),
+    'bnd': ProfileSection({'a': 'quotestitle', 'b': 'incomes32'}, ('config',), (BND_MAIN_SQL,)),
+}
+
+# строковые литералы пропускаются, квалифицированные колонки проверяются, остальное копируется как есть
+CONDITION_TOKENS = re.compile(
+    r"(?P<literal>'(?:[^']|'')*')"
+    r"|(?P<qualifier>\b[a-z_]\w*)\.(?P<column>[a-z_]\w*)"
+    r"|(?P<forbidden>;|--|/\*|\*/)"
+    r"|(?P<bracket>[()])",
+    re.IGNORECASE,
+)
+# условие добавляется к where основного запроса
+CONDITION_SQL = ' and ({0})'
+
+
+class QueryProfilesNotFound(FileNotFoundError):
+    """Нет файла профилей запросов."""
+
+
+class QueryProfile:
+    """Условия основных запросов одного типа выгрузки для режима площадки.
+
+    Attributes:
+        name: имя секции
+        mode: режим площадки
+        conditions: имя условия -> текст для добавления к запросу (пустой, если условие не задано значением)
+        queries: собранные запросы по паре (запрос, имя условия)
+    """
+
+    def __init__(self, name, mode, conditions):
+        self.name = name
+        self.mode = mode
+        self.conditions = conditions
+        self.queries = {}
+
+    def condition(self, key):
+        """Текст условия для добавления к запросу.
+
+        Raises:
+            ValueError: Условие не задано в секции.
+        """
+        try:
+            return self.conditions[key]
+        except KeyError:
+            raise ValueError(f'В секции [{self.name}] {QUERY_PROFILES_FILE} не задано условие {key}') from None
+
+    def query(self, blank, key):
+        """Запрос с условием профиля; собирается один раз на пару запрос-условие.
+
+        Args:
+            blank (str): Основной запрос из krista_sql.
+            key (str): Имя условия секции.
+
+        Returns:
+            str: Текст запроса.
+        """
+        query = self.queries.get((blank, key))
+        if query is None:
+            query = self.queries[(blank, key)] = blank + self.condition(key)
+
+        return query
+
+
+def table_in_query(table, query):
+    return re.search(rf'\b{table}\b', query, re.IGNORECASE) is not None
+
+
+def compile_condition(name, key, text, section):
+    """Проверяет условие и заменяет псевдонимы именами таблиц.
+
+    Args:
+        name (str): Имя секции.
+        key (str): Имя условия.
+        text (str): Условие из файла.
+        section (ProfileSection): Описание секции.
+
+    Returns:
+        str: Текст для добавления к запросу или пустая строка.
+
+    Raises:
+        ValueError: Условие не проходит проверку.
+    """
+    text = text.strip()
+    if not text:
+        return ''
+
+    where = f'[{name}] {key}'
+    tables = set(section.aliases.values())
+    parts = []
+    position = depth = 0
+    for match in CONDITION_TOKENS.finditer(text):
+        parts.append(text[position:match.start()])
+        position = match.end()
+        token = match.group()
+        if match.group('forbidden'):
+            raise ValueError(f'{where}: в условии недопустимо {token}')
+        if match.group('bracket'):
+            depth += 1 if token == '(' else -1
+            if depth < 0:
+                raise ValueError(f'{where}: лишняя закрывающая скобка')
+        elif match.group('qualifier'):
+            qualifier = match.group('qualifier').lower()
+            table = section.aliases.get(qualifier, qualifier)
+            if table not in tables:
+                raise ValueError(f'{where}: неизвестный псевдоним {qualifier}, допустимы {", ".join(sorted(section.aliases))}')
+            token = f'{table}.{match.group("column").lower()}'
+        parts.append(token)
+
+    if depth:
+        raise ValueError(f'{where}: не закрыта скобка')
+    parts.append(text[position:])
+
+    for table in tables:
+        for query in section.queries:
+            if not table_in_query(table, query):
+                raise ValueError(f'{where}: таблицы {table} нет в запросе выгрузки')
+
+    return CONDITION_SQL.format(''.join(parts))
+
+
+def read_query_profiles(file_name):
+    """Читает и проверяет профили запросов.
+
+    Args:
+        file_name (str): Файл профилей.
+
+    Returns:
+        dict: Имя секции -> QueryProfile для секций PROFILE_SECTIONS, которые есть в файле.
+
+    Raises:
+        QueryProfilesNotFound: Нет файла.
+        ValueError: Условие не проходит проверку или в секции неизвестный ключ.
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    # utf-8-sig: файл сохраняют в блокноте с BOM
+    if not config.read(file_name, encoding='utf-8-sig'):
+        raise QueryProfilesNotFound(f'Не найден файл профилей запросов {file_name}')
+
+    mode = config.get('main', 'mode', fallback='').strip()
+    profiles = {}
+    for name, section in PROFILE_SECTIONS.items():
+        if not config.has_section(name):
+            continue
+
+        values = config[name]
+        for option in config.options(name):
+            if option.split('.', 1)[0] not in section.keys:
+                raise ValueError(f'[{name}]: неизвестное условие {option}, допустимы {", ".join(section.keys)}')
+
+        conditions = {}
+        for key in section.keys:
+            text = values.get(f'{key}.{mode}', values.get(key))
+            if text is not None:
+                conditions[key] = compile_condition(name, key, text, section)
+        profiles[name] = QueryProfile(name, mode, conditions)
+
+    return profiles
+
+
+def profile_directories():
+    """Директории поиска файла профилей по порядку."""
+    program = sys.executable if getattr(sys, 'frozen', False) else __file__
+    directories = [os.getcwd(), os.path.dirname(os.path.abspath(program))]
+    # данные, собранные в exe (datas в main.spec), распаковываются в sys._MEIPASS
+    bundle = getattr(sys, '_MEIPASS', None)
+    if bundle:
+        directories.append(bundle)
+
+    # рабочая директория часто совпадает с директорией программы
+    return list(dict.fromkeys(directories))
+
+
+def find_profiles_file(file_name):
+    """Путь к файлу профилей.
+
+    Args:
+        file_name (str): Имя файла или абсолютный путь.
+
+    Returns:
+        str: Путь к существующему файлу.
+
+    Raises:
+        QueryProfilesNotFound: Файла нет ни в одной директории поиска.
+    """
+    if os.path.isabs(file_name):
+        directories = [os.path.dirname(file_name)]
+    else:
+        directories = profile_directories()
+
+    for directory in directories:
+        path = os.path.join(directory, file_name)
+        if os.path.isfile(path):
+            return path
+
+    raise QueryProfilesNotFound(f'Не найден файл профилей запросов {os.path.basename(file_name)} в {", ".join(directories)}')
+
+
+@lru_cache(maxsize=None)
+def load_query_profiles(file_name=QUERY_PROFILES_FILE):
+    """Профили запросов файла, прочитанные один раз на процесс."""
+    return read_query_profiles(find_profiles_file(file_name))
+
+
+def query_profile(name):
+    """Профиль типа выгрузки из QUERY_PROFILES_FILE.
+
+    Args:
+        name (str): Имя секции (plp, pbs, agr, bnd).
+
+    Returns:
+        QueryProfile: Профиль.
+
+    Raises:
+        ValueError: В файле нет секции.
+    """
+    profiles = load_query_profiles()
+    if name not in profiles:
+        raise ValueError(f'В {QUERY_PROFILES_FILE} нет секции [{name}]')
+
+    return profiles[name]
@@ -0,0 +1,441 @@
+"""Планировщик регулярных выгрузок.
+
+Задания читаются из SCHEDULER_JOBS_FILE, по секции на задание::
+
+    [plp_monthly]
+    unload = plp
+    period = previous_month
+    schedule = 0 3 1 * *
+    database_path = C:\\Krista\\Budgetrm2024.gdb
+    unload_dir = C:\\Unload\\plp
+    login = SYSDBA
+    password = masterkey
+    filter =
+    formats = parquet, csv
+
+schedule - расписание в формате cron (минута, час, день, месяц, день недели),
+period - правило периода выгрузки из PERIOD_RULES. Задания выполняются пулом
+из SCHEDULER_WORKERS потоков; соединения с базой и кэш справочников сохраняются
+между запусками, а тяжёлых запросов одновременно выполняется не больше
+SCHEDULER_HEAVY_QUERIES. formats - необязательный список дополнительных форматов
+(csv, arrow, parquet) вместо OUTPUT_FORMATS. filter - лицевые счета, диапазоны
+счетов и организации (``101, 200-250, org:7``, см. account_filter.py), все они
+выгружаются одним проходом.
+
+Один период для нескольких потребителей с разными фильтрами выгружается одной
+выборкой (MultiTargetUnload), если задан список targets; у каждого потребителя
+свой фильтр и своя директория (по умолчанию поддиректория unload_dir)::
+
+    targets = finance, treasury
+    finance.filter = 101, 105, org:7
+    treasury.filter = 202
+    treasury.unload_dir = C:\\Unload\\treasury
+
+Перед выгрузкой без потребителей, если включено PREFLIGHT_ESTIMATES, строки
+и длительность оцениваются (estimates.py): оценка пишется в журнал, по ней
+выбираются постраничная выборка и бюджеты памяти баз.
+
+Запуск: ``python scheduler.py [файл заданий]``.
+"""
+import configparser
+import logging
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from PyQt6.QtCore import QDate
+from fdb import DatabaseError
+
+from cancellation import CancellationToken, UnloadCancelled
+from estimates import UnloadPreflight
+from formats import check_formats
+from main1 import ArgTotalUnload, ArgUnload, DatabaseConnection, MultiTargetUnload, PbsUnload, PlpUnload, UnloadTarget
+from query_profiles import load_query_profiles
+from settings import (
+    MEMORY_BUDGET,
+    PREFLIGHT_ESTIMATES,
+    REFERENCE_CACHE_TTL,
+    SCHEDULER_HEAVY_QUERIES,
+    SCHEDULER_JOBS_FILE,
+    SCHEDULER_POLL_INTERVAL,
+    SCHEDULER_WORKERS,
+)
+
+logger = logging.getLogger('krista.scheduler')
+
+# типы выгрузок по именам секций urmload.cfg
+UNLOAD_TYPES = {
+    'plp': PlpUnload,
+    'pbs': PbsUnload,
+    'agr': ArgUnload,
+    'arg': ArgUnload,
+    'agr_total': ArgTotalUnload,
+    'arg_total': ArgTotalUnload,
+}
+
+
+def previous_month(today):
+    end = today.replace(day=1) - timedelta(days=1)
+    return end.replace(day=1), end
+
+
+def previous_year(today):
+    return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+
+
+# правила периода выгрузки: дата запуска -> (дата начала, дата завершения)
+PERIOD_RULES = {
+    'today': lambda today: (today, today),
+    'yesterday': lambda today: (today - timedelta(days=1),) * 2,
+    'current_month': lambda today: (today.replace(day=1), today),
+    'previous_month': previous_month,
+    'current_year': lambda today: (today.replace(month=1, day=1), today),
+    'previous_year': previous_year,
+}
+
+Job = namedtuple(
+    'Job',
+    (
+        'name', 'unload_class', 'period', 'schedule', 'database_path', 'unload_dir', 'login', 'password', 'filter',
+        'formats', 'targets',
+    ),
+    defaults=(None, None),
+)
+
+
+class CronSchedule:
+    """Расписание в формате cron: ``минута час день месяц день_недели``.
+
+    Поддерживаются ``*``, списки через запятую, диапазоны ``a-b`` и шаг ``/n``.
+    День недели: 0 или 7 - воскресенье. Если заданы и день месяца, и день недели
+    (оба поля не начинаются с ``*``), достаточно совпасть одному из них, как в cron:
+    ``0 3 1 * 1`` - первого числа и каждый понедельник.
+    """
+
+    FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != len(self.FIELD_RANGES):
+            raise ValueError(f'Расписание должно состоять из 5 полей: {expression}')
+
+        self.expression = expression
+        self.fields = [self.parse_field(part, low, high) for part, (low, high) in zip(parts, self.FIELD_RANGES)]
+        if 7 in self.fields[4]:
+            self.fields[4].add(0)
+        # день месяца и день недели оба ограничены: совпадение по любому из них
+        self.any_day = not parts[2].startswith('*') and not parts[4].startswith('*')
+
+    @staticmethod
+    def parse_field(text, low, high):
+        values = set()
+        for item in text.split(','):
+            step = 1
+            if '/' in item:
+                item, step = item.split('/')
+                step = int(step)
+
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = map(int, item.split('-'))
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+
+            if not low <= start <= end <= high:
+                raise ValueError(f'Значение расписания вне диапазона {low}-{high}: {text}')
+            values.update(range(start, end + 1, step))
+
+        return values
+
+    def matches(self, moment):
+        minutes, hours, days, months, weekdays = self.fields
+        day_matches = moment.day in days
+        weekday_matches = moment.isoweekday() % 7 in weekdays
+        return (
+            moment.minute in minutes
+            and moment.hour in hours
+            and moment.month in months
+            and (day_matches or weekday_matches if self.any_day else day_matches and weekday_matches)
+        )
+
+
+def read_jobs(file_name=SCHEDULER_JOBS_FILE):
+    """Чтение таблицы заданий.
+
+    Args:
+        file_name (str): Файл заданий.
+
+    Returns:
+        list[Job]: Задания в порядке секций.
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    if not config.read(file_name, encoding='utf-8'):
+        raise FileNotFoundError(file_name)
+
+    jobs = []
+    for name in config.sections():
+        section = config[name]
+        unload_type = section['unload'].strip().lower()
+        period = section['period'].strip().lower()
+        if unload_type not in UNLOAD_TYPES:
+            raise ValueError(f'[{name}] неизвестный тип выгрузки: {unload_type}')
+        if period not in PERIOD_RULES:
+            raise ValueError(f'[{name}] неизвестное правило периода: {period}')
+
+        formats = section.get('formats')
+        if formats is not None:
+            formats = tuple(item.strip().lower() for item in formats.split(',') if item.strip())
+            check_formats(formats)
+
+        targets = None
+        if section.get('targets', '').strip():
+            targets = tuple(
+                UnloadTarget(
+                    target,
+                    section.get(f'{target}.unload_dir', os.path.join(section['unload_dir'], target)),
+                    section.get(f'{target}.filter', ''),
+                )
+                for target in (item.strip() for item in section['targets'].split(','))
+                if target
+            )
+
+        jobs.append(Job(
+            name,
+            UNLOAD_TYPES[unload_type],
+            period,
+            CronSchedule(section['schedule']),
+            section['database_path'],
+            section['unload_dir'],
+            section.get('login', ''),
+            section.get('password', ''),
+            section.get('filter', ''),
+            formats,
+            targets,
+        ))
+
+    return jobs
+
+
+class ReferenceCache:
+    """Справочник организаций одной базы, общий для выгрузок планировщика.
+
+    Строки ORG_INFO_SQL запоминаются по id и запрашиваются заново только для новых id;
+    по истечении REFERENCE_CACHE_TTL кэш сбрасывается.
+    """
+
+    def __init__(self, ttl=REFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self.loaded = time.monotonic()
+        self.organizations = {}
+        self.lock = threading.Lock()
+
+    def organization_rows(self, unload, connection, organizations_ids):
+        """Строки организаций в порядке ORG_KEYS.
+
+        Args:
+            unload (UnloadAbs): Выгрузка, строящая запросы ORG_INFO_SQL.
+            connection (DatabaseConnection): Соединение.
+            organizations_ids: Id организаций.
+
+        Returns:
+            list[tuple]: Строки найденных организаций.
+        """
+        ids = sorted({org_id for org_id in organizations_ids if org_id is not None})
+        with self.lock:
+            if time.monotonic() - self.loaded > self.ttl:
+                self.organizations = {}
+                self.loaded = time.monotonic()
+            missing = [org_id for org_id in ids if org_id not in self.organizations]
+
+        fetched = {}
+        for request in unload.org_requests(missing):
+            with unload.query_slots:
+                _, rows = connection.fetch_rows(request.sql, request.params)
+            fetched.update((row[0], tuple(row)) for row in rows)
+
+        with self.lock:
+            self.organizations.update(fetched)
+            return [self.organizations[org_id] for org_id in ids if org_id in self.organizations]
+
+
+class ConnectionPool:
+    """Тёплые соединения с базами данных между запусками заданий.
+
+    Соединение выдаётся одной выгрузке; при возврате завершается её транзакция,
+    следующая выгрузка начинает новый снимок на том же соединении.
+    """
+
+    def __init__(self):
+        self.idle = {}
+        self.references = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, login, password, database_path):
+        key = (database_path, login)
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            connection = idle.pop() if idle else None
+
+        if connection is not None:
+            try:
+                connection.renew()
+            except DatabaseError:
+                # соединение разорвано сервером, открываем новое
+                logger.warning('Соединение с %s разорвано, переподключение', database_path)
+                connection = None
+
+        if connection is None:
+            connection = DatabaseConnection(login, password, database_path)
+
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            raise
+
+        connection.end_transaction()
+        with self.lock:
+            self.idle[key].append(connection)
+
+    def reference_cache(self, database_path):
+        with self.lock:
+            return self.references.setdefault(database_path, ReferenceCache())
+
+    def close(self):
+        with self.lock:
+            connections = [connection for idle in self.idle.values() for connection in idle]
+            self.idle = {}
+
+        for connection in connections:
+            connection.close()
+
+
+class Scheduler:
+    """Планировщик: раз в минуту запускает задания, расписание которых совпало.
+
+    Задание не запускается повторно, пока не завершился его прошлый запуск.
+
+    Attributes:
+        jobs: задания
+        workers: количество одновременных выгрузок
+        executor: пул потоков выгрузок
+        query_slots: семафор тяжёлых запросов к серверу
+        connection_pool: тёплые соединения и кэши справочников
+        running: выполняемые задания по имени
+        cancel_token: отмена выполняемых выгрузок при остановке планировщика
+    """
+
+    def __init__(self, jobs, workers=SCHEDULER_WORKERS, heavy_queries=SCHEDULER_HEAVY_QUERIES):
+        self.jobs = jobs
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='unload')
+        self.query_slots = threading.BoundedSemaphore(heavy_queries)
+        self.connection_pool = ConnectionPool()
+        self.running = {}
+        self.last_minute = None
+        self.cancel_token = CancellationToken()
+
+    def tick(self, moment):
+        """Запускает задания, расписание которых совпадает с моментом (с точностью до минуты)."""
+        for name in [name for name, future in self.running.items() if future.done()]:
+            del self.running[name]
+
+        for job in self.jobs:
+            if not job.schedule.matches(moment):
+                continue
+            if job.name in self.running:
+                logger.warning('[%s] прошлый запуск ещё выполняется, пропуск', job.name)
+                continue
+
+            self.running[job.name] = self.executor.submit(self.run_job, job, moment.date())
+
+    def run_job(self, job, today):
+        """Выполнение задания за период, вычисленный от даты запуска.
+
+        Returns:
+            str or dict or None: Имя созданного архива, для нескольких потребителей - архивы по именам.
+        """
+        date_begin, date_end = PERIOD_RULES[job.period](today)
+        logger.info('[%s] выгрузка за %s - %s', job.name, date_begin, date_end)
+        date_begin = QDate(date_begin.year, date_begin.month, date_begin.day)
+        date_end = QDate(date_end.year, date_end.month, date_end.day)
+        if job.targets:
+            unload = MultiTargetUnload(
+                job.unload_class,
+                job.login,
+                job.password,
+                job.database_path,
+                date_begin,
+                date_end,
+                job.targets,
+            )
+        else:
+            unload = job.unload_class(
+                job.login,
+                job.password,
+                job.unload_dir,
+                job.database_path,
+                date_begin,
+                date_end,
+                job.filter,
+            )
+        unload.connection_pool = self.connection_pool
+        unload.reference_cache = self.connection_pool.reference_cache(job.database_path)
+        unload.query_slots = self.query_slots
+        unload.cancel_token = self.cancel_token
+        # одновременные задания делят бюджет памяти
+        unload.memory_budget = MEMORY_BUDGET // self.workers
+        if job.formats is not None:
+            unload.output_formats = job.formats
+        try:
+            if PREFLIGHT_ESTIMATES and not job.targets:
+                # оценка настраивает выгрузку; отмена во время подсчёта - UnloadCancelled
+                logger.info('[%s] оценка выгрузки:\n%s', job.name, UnloadPreflight(unload).run())
+            result = unload.run()
+        except UnloadCancelled:
+            logger.info('[%s] выгрузка отменена', job.name)
+            raise
+        except Exception:
+            logger.exception('[%s] ошибка выгрузки', job.name)
+            raise
+
+        logger.info('[%s] готово: %s', job.name, result)
+        return result
+
+    def serve_forever(self):
+        try:
+            while True:
+                moment = datetime.now().replace(second=0, microsecond=0)
+                if moment != self.last_minute:
+                    self.last_minute = moment
+                    self.tick(moment)
+                time.sleep(SCHEDULER_POLL_INTERVAL)
+        finally:
+            # прерываем запросы выполняемых выгрузок, чтобы не ждать их завершения
+            self.cancel_token.cancel()
+            self.executor.shutdown(wait=True)
+            self.connection_pool.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(levelname)s %(message)s')
+    jobs = read_jobs(sys.argv[1] if len(sys.argv) > 1 else SCHEDULER_JOBS_FILE)
+    # профили запросов проверяются при запуске, а не при первом задании
+    load_query_profiles()
+    logger.info('Заданий: %s', len(jobs))
+    try:
+        Scheduler(jobs).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,107 @@
 DATE_FORMAT = 'dd.MM.yyyy'
 DATABASE_DATE_FORMAT = 'ddMMyyyy'
 
-# платежные поручения
-INCOMING_SQL_ADDITION = ' and facialfincaption.progindex in (61, 62, 63, 66) and facialfincaption.buhpaymentcls in (8, 9, 101, 104, 105)'
-OUTGOING_SQL_ADDITION = ' and facialfincaption.progindex in (61, 62, 63, 66) and facialfincaption.buhpaymentcls in (7, 16, 100, 114, 115)'
+# условия основных запросов по режиму площадки (query_profiles.py)
+QUERY_PROFILES_FILE = 'urmload.cfg'
 
-# сметные назначения
-# a - budnotify
-PBS_CONFIG = ' and budnotify.progindex in (32, 262)'
+FKR_KEYS = ('ID', 'GRBS', 'DIVSN', 'TARGT', 'TARST')
+# колонки org.dbf (как в ORG_INFO_SQL) и соответствующие им колонки основного запроса
+ORG_KEYS = ('ID', 'INN', 'KPP', 'NAME', 'SHORTNAME', 'OKATO')
+ORG_COLUMNS = ('ORG_INN', 'ORG_KPP', 'ORG_NAME', 'ORG_SHORTNAME', 'ORG_OKATO')
 
-# реестр обязательств (договоров)
-# a - agreements
-ARG_CONFIG = ' AND agreements.progindex in (304, 314)'
+# атрибуты организаций выбираются основным запросом, org.dbf пишется без отдельного запроса ORG_INFO_SQL
+ORG_FROM_MAIN_QUERY = True
 
-# прочие финансовые документы
-# a - quotestitle
-# b - incomes32
-bnd_config = 'a.progindex=45 and b.doctype=1010'
+# все запросы выгрузки выполняются в одной читающей транзакции уровня snapshot
+READ_ONLY_SNAPSHOT = True
 
-FKR_KEYS = ('ID', 'GRBS', 'DIVSN', 'TARGT', 'TARST')
+# размер пачки id для запросов по списку (ORG_INFO_SQL)
+ID_CHUNK_SIZE = 100
+# размер пачки счетов в условии фильтра по счёту: список длиннее делится на несколько in (...)
+FILTER_CHUNK_SIZE = 20
+
+# диагностика запросов: план, время, строки и статистика MON$ пишутся в отчёт выгрузки
+QUERY_DIAGNOSTICS = False
+# крупные таблицы, полный просмотр (NATURAL) которых отмечается в отчёте
+NATURAL_SCAN_WATCH_TABLES = ('FACIALFINCAPTION', 'BUDGETDATA', 'AGREEMENTS', 'INCOMES32')
+# колонки дат и ссылок, по которым фильтруют и соединяют запросы выгрузки; в отчёте перечисляются те, что без индекса
+DIAGNOSTIC_INDEX_COLUMNS = {
+    'FACIALFINCAPTION': ('ACCEPTDATE', 'SOURCEFACIALACC_CLS', 'DESTFACIALACC_CLS', 'SOURCEACCOUNT', 'DESTACCOUNT'),
+    'FACIALFINDETAIL': ('RECORDINDEX', 'SOURCEPROMISE'),
+    'BUDNOTIFY': ('DAT',),
+    'BUDGETDATA': ('RECORDINDEX', 'FACIALACC_CLS', 'ORG_REF'),
+    'AGREEMENTS': ('ACCEPTDATE', 'CLIENT_REF', 'EXECUTERACCREF', 'FACIALACC_CLS'),
+    'FACIALACC_CLS': ('ORG_REF',),
+    'PAYMENTSCHEDULE': ('AGREEMENTREF', 'ANUMBER', 'PARENTNUMBER'),
+    'ESTIMATE': ('RECORDINDEX',),
+    'QUOTESTITLE': ('ACCEPTDATE',),
+    'INCOMES32': ('RECORDINDEX', 'FACIALACC_CLS'),
+}
+
+# постраничная выборка основных запросов по первичному ключу (строк на страницу), 0 - одним запросом
+KEYSET_PAGE_SIZE = 0
+
+# разделитель нескольких баз в пути к базе данных (база на бюджетный год)
+DATABASE_PATH_SEPARATOR = ';'
+
+# манифест выгрузки в директории выгрузки: после сбоя повторный запуск продолжает с последней контрольной точки
+RESUMABLE_UNLOADS = True
+# не чаще, чем раз в столько секунд, постраничная запись сохраняет контрольную точку в манифест
+PAGE_CHECKPOINT_SECONDS = 10
+
+# детерминированный порядок записей в готовых файлах (по sort_fields создателя)
+SORTED_OUTPUT = False
+# сколько байт записей сортируется в памяти, больше - внешняя сортировка слиянием через временные файлы
+SORT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# разностный архив: в архив попадают новые, изменённые и удалённые документы относительно прошлой выгрузки
+DIFF_ARCHIVES = False
+
+# деление крупных файлов архива на тома имя_001.dbf, ...: наибольший размер тома и количество записей, 0 - без ограничения
+DBF_VOLUME_MAX_BYTES = 2000 * 1024 * 1024
+DBF_VOLUME_MAX_RECORDS = 0
+
+# индексы dBase .ndx по index_fields создателей рядом с файлами архива
+DBF_INDEXES = False
+
+# дополнительные форматы рядом с dbf-файлами архива: 'csv', 'arrow' (Arrow IPC / Feather v2), 'parquet';
+# arrow и parquet требуют pyarrow. Сортировка, тома, файлы изменений и индексы относятся только к dbf
+OUTPUT_FORMATS = ()
+
+# бюджет памяти выгрузки, байт (0 - без ограничения): записи выборки сверх бюджета сбрасываются во временный
+# файл в директории выгрузки, строки организаций из основного запроса занимают не больше четверти бюджета,
+# остальные организации org.dbf выбирает запросом ORG_INFO_SQL; параллельные базы и задания планировщика делят бюджет
+MEMORY_BUDGET = 512 * 1024 * 1024
+
+# кодировка dbf-файлов
+DBF_CODE_PAGE = 'cp866'
+
+# колоночная конвертация: записи читаются пакетами и кодируются по колонкам (numpy, если установлен)
+COLUMNAR_CONVERSION = False
+COLUMNAR_BATCH_SIZE = 5000
+# количество процессов для кодирования пакетов в колоночном режиме: 0 - без пула, None - по числу ядер
+CONVERSION_PROCESSES = 0
+
+# планировщик регулярных выгрузок (scheduler.py)
+SCHEDULER_JOBS_FILE = 'krista_jobs.ini'
+SCHEDULER_WORKERS = 2
+# сколько тяжёлых запросов планировщик одновременно выполняет на сервере
+SCHEDULER_HEAVY_QUERIES = 1
+SCHEDULER_POLL_INTERVAL = 20
+# время жизни кэша справочников между выгрузками, секунд
+REFERENCE_CACHE_TTL = 3600
+
+# метрики запусков выгрузки (metrics.py): журнал строк JSON и файл textfile collector Prometheus, '' - не писать
+METRICS_LOG_FILE = 'krista_metrics.jsonl'
+METRICS_TEXTFILE = ''
+
+# предварительная оценка выгрузки (estimates.py): окно показывает её перед запуском, планировщик пишет в журнал;
+# основные запросы выборки, которая по оценке не помещается в бюджет памяти, выбираются страницами ESTIMATE_PAGE_SIZE
+PREFLIGHT_ESTIMATES = True
+ESTIMATE_PAGE_SIZE = 50000
+# сколько последних успешных запусков из METRICS_LOG_FILE учитывается в скорости выгрузки
+ESTIMATE_HISTORY_RUNS = 20
+
+# форма главного окна и модуль, собранный из неё build_ui.py (используется, пока совпадает хэш формы)
+UI_FILE = 'krista.ui'
+UI_MODULE_FILE = 'krista_ui.py'
@@ -0,0 +1,111 @@
+"""Буфер записей выборки с бюджетом памяти.
+
+Записи (словари или пакеты RecordBatch) копятся в памяти, пока их оценочный размер
+не превысит бюджет; тогда накопленное сбрасывается частями во временный файл
+(pickle) и память освобождается. Буфер можно обходить несколько раз: сначала
+читаются сброшенные части в порядке записи, затем записи, оставшиеся в памяти.
+"""
+import pickle
+import sys
+import tempfile
+
+# размер словаря-записи оценивается по каждой SIZE_SAMPLE_STEP-й записи
+SIZE_SAMPLE_STEP = 64
+# на сколько частей делится сбрасываемое: при чтении в памяти одна часть
+SPILL_PARTS = 16
+
+
+def item_memory(item):
+    """Оценка памяти записи-словаря или пакета RecordBatch, байт.
+
+    Пакет оценивается по средней строке, значения учитываются без общих объектов (имён колонок).
+    """
+    if isinstance(item, dict):
+        return sys.getsizeof(item) + sum(sys.getsizeof(value) for value in item.values())
+
+    rows = item.rows
+    if not rows:
+        return sys.getsizeof(rows)
+
+    sample = rows[len(rows) // 2]
+    row_memory = sys.getsizeof(sample) + sum(sys.getsizeof(value) for value in sample)
+    return sys.getsizeof(rows) + len(rows) * row_memory
+
+
+class RecordSpool:
+    """Записи выборки в памяти в пределах бюджета, остальное во временном файле.
+
+    Attributes:
+        budget: бюджет памяти, байт; 0 - без ограничения
+        directory: директория временного файла
+        items: записи в памяти
+        memory: оценка памяти записей в памяти
+        parts: смещения сброшенных частей во временном файле
+    """
+
+    def __init__(self, budget=0, directory=None):
+        self.budget = budget
+        self.directory = directory
+        self.items = []
+        self.memory = 0
+        self.parts = []
+        self.count = 0
+        self.file = None
+        self._item_memory = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for offset in self.parts:
+            self.file.seek(offset)
+            yield from pickle.load(self.file)
+
+        yield from self.items
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def spilled(self):
+        return bool(self.parts)
+
+    def append(self, item):
+        if not isinstance(item, dict) or self.count % SIZE_SAMPLE_STEP == 0:
+            self._item_memory = item_memory(item)
+
+        self.items.append(item)
+        self.count += 1
+        self.memory += self._item_memory
+        if self.budget and self.memory > self.budget:
+            self.spill()
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def spill(self):
+        """Сбрасывает записи из памяти во временный файл частями по SPILL_PARTS."""
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix='krista_spool_', dir=self.directory)
+
+        self.file.seek(0, 2)
+        part_size = -(-len(self.items) // SPILL_PARTS)
+        for start in range(0, len(self.items), part_size):
+            self.parts.append(self.file.tell())
+            pickle.dump(self.items[start:start + part_size], self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.items = []
+        self.memory = 0
+
+    def close(self):
+        """Освобождает записи и удаляет временный файл."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.items = []
+        self.parts = []
+        self.memory = self.count = 0
@@ -0,0 +1,84 @@
+"""Замер времени запуска: от старта процесса до первой отрисовки главного окна.
+
+Каждый запуск - отдельный процесс python с холодным импортом модулей. Момент
+первого события Paint окна сравнивается с моментом запуска процесса по
+time.perf_counter (часы общие для процессов системы).
+
+Режимы:
+    compiled - обычный запуск: собранный krista_ui, модули выгрузки не загружаются;
+    load_ui - форма разбирается uic.loadUi;
+    eager - как до отложенных импортов: main1 загружается до окна, форма через uic.loadUi.
+
+Запуск: ``python startup_benchmark.py [количество запусков] [режим ...]``.
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ('compiled', 'load_ui', 'eager')
+DEFAULT_RUNS = 5
+
+
+def run_child(mode):
+    """Запуск окна в режиме mode; печатает момент первой отрисовки."""
+    if mode == 'eager':
+        import main1  # noqa: F401
+
+    import krista_window
+    from PyQt6.QtCore import QEvent, QObject, QTimer
+    from PyQt6.QtWidgets import QApplication
+
+    if mode != 'compiled':
+        krista_window.Ui_MainWindow = None
+
+    class FirstPaint(QObject):
+        moment = None
+
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Type.Paint and self.moment is None:
+                self.moment = time.perf_counter()
+                QTimer.singleShot(0, QApplication.quit)
+            return False
+
+    app = QApplication(sys.argv[:1])
+    window = krista_window.create_window()
+    first_paint = FirstPaint()
+    window.installEventFilter(first_paint)
+    window.show()
+    app.exec()
+    print(first_paint.moment)
+
+
+def measure(mode):
+    """Секунды от запуска процесса до первой отрисовки окна."""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, __file__, '--child', mode],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(completed.stdout.split()[-1]) - started
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        run_child(sys.argv[2])
+        return
+
+    arguments = sys.argv[1:]
+    runs = int(arguments.pop(0)) if arguments and arguments[0].isdigit() else DEFAULT_RUNS
+    for mode in arguments or MODES:
+        if mode not in MODES:
+            raise ValueError(f'Неизвестный режим: {mode}')
+
+        timings = [measure(mode) for _ in range(runs)]
+        print(
+            f'{mode:10} медиана {statistics.median(timings):.3f} с, '
+            f'мин {min(timings):.3f} с, макс {max(timings):.3f} с, запусков {runs}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    """Журнал метрик и прочие относительные пути выгрузки - во временной директории теста."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,226 @@
+"""Фиктивная база для тестов выгрузок: запросы выгрузки отвечают заранее собранными строками.
+
+Таблица выбирается по началу текста запроса. Постраничные запросы (KEYSET_*_PAGE_SQL)
+выбирают строки по колонке ID, запросы по списку id (ORG_INFO_SQL, ARG_EST_SQL) -
+строки с колонкой id из параметров, условие EMPTY_FILTER_SQL не выбирает ничего.
+"""
+import random
+from contextlib import contextmanager
+
+from PyQt6.QtCore import QDate
+
+from columnar import RecordBatch
+from cancellation import CancellationToken
+from creators import ArgEstCreator, ArgMainCreator, FireBirdGetterMethods, PlpMainCreator
+from krista_sql import ARG_EST_SQL, EMPTY_FILTER_SQL, ORG_INFO_SQL
+from metrics import FetchCounter
+from settings import ORG_COLUMNS, ORG_KEYS
+
+FKR_COLUMNS = ('GRBS', 'DIVSN', 'TARGT', 'TARST')
+# колонки основного запроса с id организации
+ORG_ID_COLUMNS = {PlpMainCreator: 'DEST_ORG', ArgMainCreator: 'EXECUTER_REF'}
+FLOAT_GETTERS = (
+    FireBirdGetterMethods.date_from_double,
+    FireBirdGetterMethods.string_from_float,
+    FireBirdGetterMethods.get_inn,
+)
+NUMBER_GETTERS = (
+    FireBirdGetterMethods.number,
+    FireBirdGetterMethods.number_prescision2,
+    FireBirdGetterMethods.number_prescision4,
+)
+STRINGS = ('а', 'Б', '7', 'сумма №1', None)
+
+DATE_BEGIN = QDate(2024, 1, 1)
+DATE_END = QDate(2024, 12, 31)
+
+
+def creator_columns(creator_class, *extra):
+    """Колонки выборки, из которых создатель пишет свой dbf-файл."""
+    columns = ['ID']
+    for (_, column, _), getter in creator_class.dbf_schema_and_getter_map.items():
+        if isinstance(getter, (tuple, list)):
+            getter, column = getter
+        if getter is not None and column not in columns:
+            columns.append(column)
+
+    return tuple(columns) + tuple(column for column in extra if column not in columns)
+
+
+def column_value(generator, creator_class, column):
+    fields = {}
+    for (_, name, length), getter in creator_class.dbf_schema_and_getter_map.items():
+        if isinstance(getter, (tuple, list)):
+            getter, name = getter
+        fields[name] = getter, length
+
+    getter, length = fields.get(column, (None, 0))
+    if getter in FLOAT_GETTERS:
+        return float(generator.randint(10 ** 8, 10 ** 9))
+    if getter in NUMBER_GETTERS:
+        # с двумя знаками после запятой число укладывается в ширину поля
+        return round(generator.uniform(0, 10 ** (length - 4)), 2)
+    if column in FKR_COLUMNS:
+        return generator.choice(('1', '02', '3'))
+
+    return generator.choice(STRINGS)
+
+
+def organization_values(org_id):
+    """Атрибуты организации в порядке ORG_COLUMNS: одинаковые во всех строках организации."""
+    return float(7700000000 + org_id), f'77{org_id:02}', f'Организация {org_id}', f'Орг {org_id}', '45000'
+
+
+def main_rows(creator_class, count, seed=1):
+    """Строки основного запроса по возрастанию ID, по две строки на ID.
+
+    Returns:
+        tuple: Колонки и строки.
+    """
+    org_column = ORG_ID_COLUMNS.get(creator_class)
+    extra = FKR_COLUMNS + ((org_column,) + ORG_COLUMNS if org_column else ())
+    columns = creator_columns(creator_class, *extra)
+    generator = random.Random(seed)
+    rows = []
+    for number in range(count):
+        row = {column: column_value(generator, creator_class, column) for column in columns}
+        row['ID'] = number // 2 + 1
+        if org_column:
+            row[org_column] = generator.randint(1, 6)
+            row.update(zip(ORG_COLUMNS, organization_values(row[org_column])))
+        rows.append(tuple(row[column] for column in columns))
+
+    return columns, rows
+
+
+def estimate_rows(agreement_ids, seed=2):
+    """Сметы ARG_EST_SQL: по две на договор."""
+    columns = creator_columns(ArgEstCreator)
+    generator = random.Random(seed)
+    rows = []
+    for agreement_id in agreement_ids:
+        for number in range(2):
+            row = {column: column_value(generator, ArgEstCreator, column) for column in columns}
+            row.update(ARG_ID=agreement_id, EST_ID=agreement_id * 10 + number)
+            rows.append(tuple(row[column] for column in columns))
+
+    return columns, rows
+
+
+def organization_rows(organizations_ids):
+    """Строки ORG_INFO_SQL."""
+    return ORG_KEYS, [(org_id,) + organization_values(org_id) for org_id in organizations_ids]
+
+
+class FakeDatabase:
+    """Таблицы фиктивной базы.
+
+    Attributes:
+        tables: начало текста запроса -> колонка id для запросов по списку id, колонки и строки
+        queries: выполненные запросы
+        fail_at: номер запроса, на котором база падает (проверка продолжения после сбоя)
+        on_query: вызывается с номером каждого запроса (например, отменяет выгрузку)
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.queries = []
+        self.fail_at = None
+        self.on_query = None
+
+    def add(self, sql, columns, rows, id_column=None):
+        self.tables[sql] = (id_column, tuple(columns), list(rows))
+
+    def select(self, sql, params):
+        self.queries.append(sql)
+        if self.on_query is not None:
+            self.on_query(len(self.queries))
+        if self.fail_at == len(self.queries):
+            raise RuntimeError('сбой базы')
+
+        prefix = max((prefix for prefix in self.tables if sql.startswith(prefix)), key=len, default=None)
+        if prefix is None:
+            return ('ID',), []
+
+        id_column, columns, rows = self.tables[prefix]
+        if EMPTY_FILTER_SQL in sql:
+            return columns, []
+        if id_column is not None:
+            ids = set(params)
+            return columns, [row for row in rows if row[columns.index(id_column)] in ids]
+        if sql.endswith('rows ?'):
+            key_index = columns.index('ID')
+            last_key = params[-2] if sql.rstrip().splitlines()[-2].strip().endswith('> ?') else None
+            rows = sorted((row for row in rows if last_key is None or row[key_index] > last_key), key=lambda row: row[key_index])
+            return columns, rows[:params[-1]]
+
+        return columns, rows
+
+
+def unload_database(unload_class, rows=40):
+    """Фиктивная база с данными всех запросов выгрузки.
+
+    Строки основных запросов делятся между ними поровну, по rows на запрос.
+    """
+    database = FakeDatabase()
+    unload = unload_class('login', 'password', '.', 'db', DATE_BEGIN, DATE_END, '')
+    unload.manifest.enabled = False
+    main_creator = unload_class.creator_classes[0]
+    requests = unload.main_requests()
+    columns, data = main_rows(main_creator, rows * len(requests))
+    for number, request in enumerate(requests):
+        database.add(request.sql, columns, data[number * rows:(number + 1) * rows])
+
+    org_column = ORG_ID_COLUMNS.get(main_creator)
+    if org_column:
+        database.add(ORG_INFO_SQL[:ORG_INFO_SQL.index('{}')], *organization_rows(range(1, 7)), id_column='ID')
+    if main_creator is ArgMainCreator:
+        database.add(ARG_EST_SQL[:ARG_EST_SQL.index('{}')], *estimate_rows(sorted({row[0] for row in data})), id_column='ARG_ID')
+
+    return database
+
+
+class FakeConnection:
+    """Соединение с фиктивной базой с методами выборки DatabaseConnection."""
+
+    snapshot_number = None
+
+    def __init__(self, database):
+        self.database = database
+        self.fetch_counter = FetchCounter()
+        self.cancel_token = CancellationToken()
+
+    def fetch_rows(self, sql, params=()):
+        self.cancel_token.check()
+        columns, rows = self.database.select(sql, params)
+        self.fetch_counter.add(len(rows), 0)
+        return list(columns), rows
+
+    def fetch_batches(self, sql, params=(), batch_size=7):
+        columns, rows = self.fetch_rows(sql, params)
+        for start in range(0, len(rows), batch_size):
+            yield RecordBatch(columns, rows[start:start + batch_size])
+
+    def execute(self, sql, params=()):
+        columns, rows = self.fetch_rows(sql, params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def write_diagnostics(self, file_path):
+        pass
+
+    def cancel_operation(self):
+        pass
+
+
+class FakePool:
+    """Пул соединений планировщика над фиктивной базой."""
+
+    def __init__(self, database):
+        self.database = database
+
+    @contextmanager
+    def connection(self, login, password, database_path):
+        yield FakeConnection(self.database)
+
+    def reference_cache(self, database_path):
+        return None
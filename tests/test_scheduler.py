@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import pytest
+
+from scheduler import CronSchedule
+
+
+@pytest.mark.parametrize('expression, moment, expected', [
+    # день месяца и день недели оба заданы: совпадение по любому из них
+    ('0 3 1 * 1', datetime(2024, 3, 1, 3, 0), True),
+    ('0 3 1 * 1', datetime(2024, 3, 4, 3, 0), True),
+    ('0 3 1 * 1', datetime(2024, 3, 5, 3, 0), False),
+    ('0 3 13 * 5', datetime(2024, 12, 13, 3, 0), True),
+    ('0 3 13 * 5', datetime(2024, 12, 20, 3, 0), True),
+    # одно из полей со звёздочкой: должны совпасть оба
+    ('0 3 1 * *', datetime(2024, 3, 4, 3, 0), False),
+    ('0 3 * * 1', datetime(2024, 3, 1, 3, 0), False),
+    ('0 3 */2 * 1', datetime(2024, 3, 4, 3, 0), False),
+    ('0 3 */2 * 1', datetime(2024, 3, 11, 3, 0), True),
+    ('0 3 1 * 7', datetime(2024, 3, 3, 3, 0), True),
+    ('0 3 1 * 1', datetime(2024, 3, 4, 4, 0), False),
+])
+def test_cron_days(expression, moment, expected):
+    assert CronSchedule(expression).matches(moment) is expected
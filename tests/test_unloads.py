@@ -0,0 +1,191 @@
+import os
+import struct
+import zipfile
+
+import pytest
+
+import formats
+import main1
+from creators import ArgMainCreator
+from krista_sql import EMPTY_FILTER_SQL
+from fake_database import DATE_BEGIN, DATE_END, FakePool, unload_database
+from cancellation import UnloadCancelled
+from main1 import ArgTotalUnload, ArgUnload, PbsUnload, PlpUnload
+
+UNLOAD_CLASSES = [PlpUnload, PbsUnload, ArgUnload, ArgTotalUnload]
+
+
+def new_unload(unload_class, unload_dir, database, sql_filter='', page_size=0, output_formats=()):
+    """Выгрузка из фиктивной базы через пул соединений."""
+    unload_dir.mkdir(exist_ok=True)
+    unload = unload_class('login', 'password', str(unload_dir), 'db', DATE_BEGIN, DATE_END, sql_filter)
+    unload.connection_pool = FakePool(database)
+    unload.page_size = page_size
+    unload.output_formats = output_formats
+    return unload
+
+
+def run_unload(unload_class, unload_dir, database, **options):
+    """Запуск выгрузки new_unload.
+
+    Returns:
+        tuple: Выгрузка и имя архива.
+    """
+    unload = new_unload(unload_class, unload_dir, database, **options)
+    return unload, unload.run()
+
+
+def dbf_content(data):
+    """Заголовок dbf-файла без даты и записи."""
+    header_length, record_length = struct.unpack('<HH', data[8:12])
+    records = [data[start:start + record_length] for start in range(header_length, len(data) - 1, record_length)]
+    return data[:1] + data[4:header_length], records
+
+
+def archive_content(unload, archive_name):
+    """Файлы архива: dbf-файлы - заголовком без даты и записями.
+
+    Порядок записей справочников (fkr, org) зависит от обхода множеств, их записи упорядочиваются.
+    """
+    result = {}
+    with zipfile.ZipFile(os.path.join(unload.unload_dir, archive_name)) as archive:
+        for name in archive.namelist():
+            result[name] = archive.read(name)
+            if name.endswith('.dbf'):
+                header, records = dbf_content(result[name])
+                if unload.creator_class_for(name).unique_field:
+                    records.sort()
+                result[name] = header, records
+
+    return result
+
+
+def record_count(data):
+    return struct.unpack('<I', data[4:8])[0]
+
+
+@pytest.mark.parametrize('page_size', [0, 7])
+@pytest.mark.parametrize('unload_class', UNLOAD_CLASSES)
+def test_columnar_matches_row_mode(unload_class, page_size, tmp_path, monkeypatch):
+    database = unload_database(unload_class)
+    result = {}
+    for columnar in (False, True):
+        monkeypatch.setattr(main1, 'COLUMNAR_CONVERSION', columnar)
+        unload_dir = tmp_path / f'columnar_{columnar}'
+        unload, zip_name = run_unload(unload_class, unload_dir, database, page_size=page_size)
+        result[columnar] = archive_content(unload, zip_name)
+
+    assert result[False] == result[True]
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+@pytest.mark.parametrize('unload_class', [PlpUnload, PbsUnload, ArgUnload])
+def test_pages_match_single_query(unload_class, columnar, tmp_path, monkeypatch):
+    monkeypatch.setattr(main1, 'COLUMNAR_CONVERSION', columnar)
+    database = unload_database(unload_class)
+    unload, zip_name = run_unload(unload_class, tmp_path / 'single', database)
+    expected = archive_content(unload, zip_name)
+    single_queries = len(database.queries)
+
+    database.queries.clear()
+    # страница меньше строк одного ключа удваивается
+    for page_size in (7, 1):
+        unload, zip_name = run_unload(unload_class, tmp_path / f'pages_{page_size}', database, page_size=page_size)
+        assert archive_content(unload, zip_name) == expected
+    assert len(database.queries) > single_queries
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_arg_main_written_once(columnar, tmp_path, monkeypatch):
+    monkeypatch.setattr(main1, 'COLUMNAR_CONVERSION', columnar)
+    database = unload_database(ArgUnload, rows=40)
+    _, zip_name = run_unload(ArgUnload, tmp_path / 'unload', database)
+    with zipfile.ZipFile(tmp_path / 'unload' / zip_name) as archive:
+        data = archive.read(ArgMainCreator.file_name)
+
+    header, records = dbf_content(data)
+    assert record_count(data) == len(records) == 80
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_format_rows_match_dbf(columnar, tmp_path, monkeypatch):
+    output_formats = ('csv',) if formats.pa is None else ('csv', 'parquet')
+    monkeypatch.setattr(main1, 'COLUMNAR_CONVERSION', columnar)
+    database = unload_database(ArgUnload)
+    unload, zip_name = run_unload(ArgUnload, tmp_path / 'unload', database, output_formats=output_formats)
+    with zipfile.ZipFile(tmp_path / 'unload' / zip_name) as archive:
+        archive.extractall(tmp_path / 'files')
+
+    for file_name in unload.dbf_files_names:
+        dbf_records = record_count((tmp_path / 'files' / file_name).read_bytes())
+        for output_format in output_formats:
+            format_path = tmp_path / 'files' / formats.format_file_name(file_name, output_format)
+            rows = sum(count for _, count in formats.TABLE_WRITERS[output_format].read_columns(str(format_path)))
+            assert rows == dbf_records, format_path.name
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+@pytest.mark.parametrize('fail_at', [4, 12])
+def test_resume_after_failure(columnar, fail_at, tmp_path, monkeypatch):
+    monkeypatch.setattr(main1, 'COLUMNAR_CONVERSION', columnar)
+    monkeypatch.setattr(main1, 'PAGE_CHECKPOINT_SECONDS', 0)
+    database = unload_database(PlpUnload)
+    unload, zip_name = run_unload(PlpUnload, tmp_path / 'complete', database, page_size=7)
+    expected = archive_content(unload, zip_name)
+    complete_queries = len(database.queries)
+
+    database.queries.clear()
+    database.fail_at = fail_at
+    with pytest.raises(RuntimeError):
+        run_unload(PlpUnload, tmp_path / 'resumed', database, page_size=7)
+    assert (tmp_path / 'resumed' / 'plp_manifest.json').is_file()
+
+    database.fail_at = None
+    database.queries.clear()
+    unload, zip_name = run_unload(PlpUnload, tmp_path / 'resumed', database, page_size=7)
+    assert archive_content(unload, zip_name) == expected
+    # страницы до сбоя не выбираются повторно: упавшая страница выбирается заново,
+    # законченный запрос - одной пустой страницей после своего последнего ключа
+    assert len(database.queries) <= complete_queries - fail_at + 2
+    assert os.listdir(tmp_path / 'resumed') == [zip_name]
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+@pytest.mark.parametrize('unload_class', [ArgUnload, ArgTotalUnload])
+def test_filter_without_accounts(unload_class, columnar, tmp_path, monkeypatch):
+    """Организация без лицевых счетов: основные запросы выбираются с условием EMPTY_FILTER_SQL."""
+    monkeypatch.setattr(main1, 'COLUMNAR_CONVERSION', columnar)
+    database = unload_database(unload_class)
+    unload, zip_name = run_unload(unload_class, tmp_path / 'unload', database, sql_filter='org:3')
+    assert unload.account_filter.predicate(unload.filter_column) == (EMPTY_FILTER_SQL, ())
+    if zip_name is None:
+        # без записей arg_main.dbf не создаётся и архив не собирается
+        assert not (tmp_path / 'unload' / ArgMainCreator.file_name).exists()
+        return
+
+    with zipfile.ZipFile(tmp_path / 'unload' / zip_name) as archive:
+        assert all(record_count(archive.read(name)) == 0 for name in archive.namelist())
+
+
+@pytest.mark.parametrize('page_size', [0, 7])
+@pytest.mark.parametrize('last_query', [False, True])
+@pytest.mark.parametrize('unload_class', UNLOAD_CLASSES)
+def test_cancel_removes_files(unload_class, last_query, page_size, tmp_path, monkeypatch):
+    """Отмена на первом или последнем запросе выгрузки, когда часть файлов уже записана."""
+    monkeypatch.setattr(main1, 'PAGE_CHECKPOINT_SECONDS', 0)
+    database = unload_database(unload_class)
+    run_unload(unload_class, tmp_path / 'complete', database, page_size=page_size)
+    cancel_at = len(database.queries) if last_query else 1
+    database.queries.clear()
+
+    unload = new_unload(unload_class, tmp_path / 'unload', database, page_size=page_size)
+    (tmp_path / 'unload' / 'other.txt').write_text('не относится к выгрузке')
+
+    def cancel(query_number):
+        if query_number == cancel_at:
+            unload.cancel_token.cancel()
+
+    database.on_query = cancel
+    with pytest.raises(UnloadCancelled):
+        unload.run()
+    assert os.listdir(tmp_path / 'unload') == ['other.txt']